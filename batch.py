@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+"""
+Builds the channels of several PDF and video guides in one run.
+
+Each guide is described by a JSON config file with the same schema as the `DATA`
+of `sushichef.py` (pdf_info with the page_ranges, video_info, video_titles) for
+each of its languages, see the README.  The PDFs of all the guides are cropped
+and split in one pool of processes and their videos are downloaded in one pool
+of threads, sharing the HTTP connections, the request scheduler, the video cache
+(a video used by several guides is downloaded once) and the build manifest.
+Then the channel of each guide is built and uploaded in turn.
+
+    python batch.py -v --token=<Kolibri Studio token> guides=guides/
+    python batch.py dryrun guides=guides/a.json,guides/b.json plan=1
+"""
+import glob
+import json
+import os
+import sys
+
+from ricecooker.classes.nodes import TopicNode
+
+from metrics import METRICS
+from pageranges import PageRangeIndex
+from sushichef import (DOWNLOADS_PATH, DOWNLOADS_VIDEOS_PATH, PARTIAL_VIDEOS, POINTB, VERIFY_ARTIFACTS,
+                       VERIFY_WORKERS, PointBChef, build_content, build_pdf_topics, build_video_topics,
+                       get_bool_option, open_run_journal, setup_run, update_data, verify_content)
+
+
+# Directory of the guide config files, override on the command line with
+# `guides=DIR` or `guides=PATH1,PATH2`.
+GUIDES_PATH = os.path.join(os.getcwd(), 'guides')
+REQUIRED_CHANNEL_INFO = ('CHANNEL_TITLE', 'CHANNEL_SOURCE_DOMAIN', 'CHANNEL_SOURCE_ID', 'CHANNEL_LANGUAGE')
+# Options of the whole batch, not passed to the chef of each guide.
+BATCH_OPTIONS = ('guides', 'metrics', 'metrics_json', 'metrics_prom')
+
+
+class GuideConfigError(ValueError):
+    pass
+
+
+def get_guide_paths(value=GUIDES_PATH):
+    """
+    Returns the config files of the `guides=` option: a directory (all its
+    `*.json` files) or comma-separated paths.
+    """
+    paths = []
+    for path in value.split(','):
+        path = path.strip()
+        if os.path.isdir(path):
+            paths.extend(sorted(glob.glob(os.path.join(path, '*.json'))))
+        elif path:
+            paths.append(path)
+    return paths
+
+
+def load_guide(path):
+    """
+    Loads and checks the guide config file at `path`, filling in the defaults:
+     - the PDF paths are in `downloads/<name>/`, the videos are downloaded to
+       `downloads/videos/<lang_code>/` like the videos of `PointBChef`, shared
+       by the guides in the same language,
+     - each language gets a unique `key`, '<name>:<lang_code>', its entry in `DATA`.
+    Returns the guide dict, with the `DATA` entries of its languages in 'data'.
+    Raises `GuideConfigError` if the config is invalid.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            guide = json.load(f)
+        except ValueError as e:
+            raise GuideConfigError('Invalid guide config %s: %s' % (path, e))
+
+    name = guide.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    errors = []
+    channel_info = guide.get('channel_info') or {}
+    for field in REQUIRED_CHANNEL_INFO:
+        if not channel_info.get(field):
+            errors.append('missing channel_info %s' % field)
+    if not guide.get('languages'):
+        errors.append('no languages')
+    guide.setdefault('copyright_holder', POINTB)
+    guide.setdefault('description', '')
+
+    guide['data'] = {}
+    guide_path = os.path.join(DOWNLOADS_PATH, name, '')
+    for language in guide.get('languages') or []:
+        lang_code = language.get('lang_code')
+        if not lang_code:
+            errors.append('language without lang_code')
+            continue
+        key = language['key'] = '%s:%s' % (name, lang_code)
+        if key in guide['data']:
+            errors.append('duplicate language %s' % lang_code)
+        language.setdefault('title', lang_code)
+        language.setdefault('guide_title', channel_info.get('CHANNEL_TITLE', name))
+        language.setdefault('videos_title', 'Videos')
+        language.setdefault('video_title_suffix', '')
+
+        pdf_info = dict(language.get('pdf_info') or {})
+        video_info = dict(language.get('video_info') or {})
+        if not pdf_info.get('pdf_url'):
+            errors.append('%s: missing pdf_info pdf_url' % lang_code)
+        if not video_info.get('video_url'):
+            errors.append('%s: missing video_info video_url' % lang_code)
+        page_ranges = pdf_info.get('page_ranges')
+        if not page_ranges:
+            errors.append('%s: missing pdf_info page_ranges' % lang_code)
+        else:
+            try:
+                range_errors, warnings = PageRangeIndex(page_ranges).check()
+            except (KeyError, TypeError) as e:
+                range_errors = ['invalid page range %s' % e]
+            errors.extend('%s: %s' % (lang_code, error) for error in range_errors)
+
+        pdf_info['pdf_path'] = os.path.abspath(
+            pdf_info.get('pdf_path') or os.path.join(guide_path, '%s.pdf' % lang_code))
+        pdf_info['pdf_path_cropped'] = os.path.abspath(
+            pdf_info.get('pdf_path_cropped') or os.path.join(guide_path, '%s_cropped.pdf' % lang_code))
+        pdf_info['pdf_split_path'] = os.path.join(os.path.abspath(
+            pdf_info.get('pdf_split_path') or os.path.join(guide_path, '%s_split' % lang_code)), '')
+        video_info.setdefault('filename_prefix', 'pointb-video-%s-' % lang_code)
+        video_info['download_path'] = os.path.join(os.path.abspath(
+            video_info.get('download_path') or os.path.join(DOWNLOADS_VIDEOS_PATH, lang_code)), '')
+        guide['data'][key] = {
+            'lang_code': lang_code,
+            'pdf_info': pdf_info,
+            'video_info': video_info,
+            'video_titles': language.get('video_titles') or {},
+        }
+
+    if errors:
+        raise GuideConfigError('Invalid guide config %s: %s' % (path, '; '.join(errors)))
+    return guide
+
+
+class GuideChef(PointBChef):
+    """
+    Chef of one guide of the batch.  Its content (chapters and videos) is built
+    and verified by `run_batch()` for all the guides at once and set in `content`,
+    `failed_videos` and `broken`, the chef only builds and uploads the channel
+    tree.  Without `content`, it builds its content itself like `PointBChef`.
+    """
+
+    def __init__(self, guide, *args, **kwargs):
+        super(GuideChef, self).__init__(*args, **kwargs)
+        self.guide = guide
+        self.channel_info = guide['channel_info']
+        self.lang_codes = tuple(language['key'] for language in guide['languages'])
+        self.content = None
+        self.failed_videos = []
+        self.broken = []
+
+    def build_channel(self, **kwargs):
+        if self.content is None:
+            return super(GuideChef, self).build_channel(**kwargs)
+        chapters, videos = self.content
+        for lang_code in self.lang_codes:
+            if lang_code in chapters and chapters[lang_code] is None:
+                print('==> Split chapters for %s PDFs FAILED!' % lang_code)
+                return False
+        if self.failed_videos and not get_bool_option(kwargs, 'partial_videos', PARTIAL_VIDEOS):
+            print('==> Download of %d videos FAILED!' % len(self.failed_videos))
+            return False
+        if self.broken:
+            print('==> Verification of %d artifacts FAILED!' % len(self.broken))
+            return False
+        channel = self.get_channel(**kwargs)
+        return self.build_tree(channel, chapters, videos)
+
+    def build_tree(self, channel, chapters, videos):
+        """
+        Adds a topic for each language of the guide to `channel`, with a topic
+        for the chapters of the guide and one for the videos.  The topics of the
+        content missing from `chapters` or `videos` (e.g. skipped by `only=`) are
+        left out.
+        """
+        name = self.guide['name']
+        for language in self.guide['languages']:
+            key = language['key']
+            lang_code = language['lang_code']
+            if key not in chapters and key not in videos:
+                continue
+            main_topic = TopicNode(title=language['title'], source_id='%s_%s_main' % (name, lang_code))
+            channel.add_child(main_topic)
+
+            if key in chapters:
+                topic_guide = TopicNode(title=language['guide_title'], source_id='%s_%s_guide' % (name, lang_code))
+                main_topic.add_child(topic_guide)
+                build_pdf_topics(topic_guide, chapters[key], lang_code=lang_code,
+                                 copyright_holder=self.guide['copyright_holder'],
+                                 description=self.guide['description'])
+            if key in videos:
+                topic_videos = TopicNode(title=language['videos_title'], source_id='%s_%s_videos' % (name, lang_code))
+                main_topic.add_child(topic_videos)
+                build_video_topics(topic_videos, videos[key], lang_code,
+                                   copyright_holder=self.guide['copyright_holder'],
+                                   title_suffix=language['video_title_suffix'])
+        return channel
+
+
+def run_batch(guides, args, options):
+    """
+    Builds the content of all the `guides` in shared pools, then builds and
+    uploads the channel of each guide with the ricecooker `args` and `options`.
+    A failed guide does not stop the others, and the run journal of the content
+    is kept until all the guides are built, see `open_run_journal()`.
+    Returns the list of the names of the failed guides.
+    """
+    entries = {}
+    for guide in guides:
+        entries.update(guide['data'])
+    update_data(entries)
+    lang_codes = tuple(entries)
+    for entry in entries.values():
+        os.makedirs(os.path.dirname(entry['pdf_info']['pdf_path']), exist_ok=True)
+        os.makedirs(entry['video_info']['download_path'], exist_ok=True)
+
+    chefs = [GuideChef(guide) for guide in guides]
+    chef_options = {name: value for name, value in options.items() if name not in BATCH_OPTIONS}
+    metrics_json = options.get('metrics_json')
+    metrics_prom = options.get('metrics_prom')
+    metrics = get_bool_option(options, 'metrics') or bool(metrics_json or metrics_prom)
+    print('==> BATCH of', len(guides), 'guides,', len(lang_codes), 'languages')
+
+    journal = None
+    failed_videos = []
+
+    if not get_bool_option(options, 'plan'):
+        METRICS.enable(metrics)
+        with METRICS.stage('build_content'):
+            manifest = setup_run(options)
+            journal = open_run_journal(lang_codes, options)
+            chapters, videos, failed_videos = build_content(
+                lang_codes, manifest=manifest, partial=True, run_journal=journal, **options)
+            broken = []
+            if get_bool_option(options, 'verify', VERIFY_ARTIFACTS):
+                broken = verify_content(chapters, videos, manifest=manifest,
+                                        max_workers=options.get('verify_workers', VERIFY_WORKERS),
+                                        journal=journal)
+        for chef in chefs:
+            chef.content = (
+                {lang_code: chapters[lang_code] for lang_code in chef.lang_codes if lang_code in chapters},
+                {lang_code: videos[lang_code] for lang_code in chef.lang_codes if lang_code in videos},
+            )
+            chef.failed_videos = [(video, e) for video, e in failed_videos
+                                  if video.lang_code in chef.lang_codes]
+            chef.broken = [artifact for artifact in broken if artifact[0] in chef.lang_codes]
+
+    failed = []
+    for chef in chefs:
+        print('==> CHANNEL', chef.guide['name'])
+        try:
+            chef.run(args, chef_options)
+        except Exception as e:
+            print('==> ERROR building the channel of', chef.guide['name'], e)
+            failed.append(chef.guide['name'])
+    if failed:
+        print('==> FAILED guides:', ', '.join(failed))
+    elif journal is not None and not failed_videos:
+        journal.finish()
+
+    if metrics:
+        print('==> STAGE METRICS')
+        print(METRICS.report())
+        if metrics_json:
+            METRICS.write_json(metrics_json)
+        if metrics_prom:
+            METRICS.write_prometheus(metrics_prom)
+    return failed
+
+
+def main():
+    chef = PointBChef()
+    args, options = chef.parse_args_and_options()
+    chef.config_logger(args, options)
+    guides = [load_guide(path) for path in get_guide_paths(options.get('guides', GUIDES_PATH))]
+    if not guides:
+        print('==> No guide config found')
+        return 1
+    failed = run_batch(guides, args, options)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+"""
+End-to-end benchmark of the chef, offline: runs `construct_channel()` (PDF
+downloads, cropping and splitting, scraping of the video pages, video downloads,
+thumbnails, verification and channel tree) with the HTTP responses and the
+youtube_dl results replayed from a cassette (see `cassette.py`), in a fresh work
+directory, and reports the time spent in each stage.
+
+By default the cassette is synthetic: two-page spread PDFs covering the
+`page_ranges` of each language, video pages laid out like the real ones and
+small mp4 files.  Record a cassette of a real run once (needs network access)
+and replay it in the later runs:
+
+    python benchmarks/bench_e2e.py --runs 2
+    python benchmarks/bench_e2e.py --record chefdata/cassettes/live
+    python benchmarks/bench_e2e.py --cassette chefdata/cassettes/live --output bench_e2e.json
+    python benchmarks/bench_e2e.py --cassette chefdata/cassettes/live --compare bench_e2e.json
+
+The first run starts from an empty work directory, the next `--runs` reuse it
+and measure the run with everything cached.  With `--compare`, the script exits
+with status 1 if a run or a stage got slower than the baseline results by more
+than `--threshold`.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+VIDEO_DURATION = 90  # seconds
+VIDEO_SIZE = 256 * 1024  # bytes of each synthetic mp4
+# Stages faster than this are too noisy to be compared.
+MIN_COMPARED_DURATION = 0.1
+
+
+def make_mp4(duration=VIDEO_DURATION, size=VIDEO_SIZE):
+    """
+    Returns the bytes of a minimal mp4 file (ftyp, moov with the `duration` in
+    its mvhd, mdat of padding) of about `size` bytes.
+    """
+    def box(box_type, content):
+        return struct.pack('>I4s', 8 + len(content), box_type) + content
+
+    mvhd = box(b'mvhd', b'\0\0\0\0' + struct.pack('>IIII', 0, 0, 1000, duration * 1000) + b'\0' * 80)
+    header = box(b'ftyp', b'isom\0\0\0\0isomavc1') + box(b'moov', mvhd)
+    return header + box(b'mdat', b'\0' * max(0, size - len(header) - 8))
+
+
+def make_jpeg(text):
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (640, 360), (40, 90, 160))
+    ImageDraw.Draw(image).text((20, 20), text, fill=(255, 255, 255))
+    out = io.BytesIO()
+    image.save(out, 'JPEG')
+    return out.getvalue()
+
+
+def make_synthetic_cassette(path, density=10, video_size=VIDEO_SIZE):
+    """
+    Records a synthetic cassette of the chef in `path`: the PDF and the video page
+    of each language of `DATA` and the youtube_dl results of their videos.
+    """
+    import sushichef
+    from bench_pdf import make_two_up_pdf
+    from bench_scrape import VIMEO_IDS, make_video_page
+    from cassette import Cassette, get_info_key, get_request_key
+
+    cassette = Cassette(path, mode='record')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for lang_code in sushichef.LANG_CODES:
+            pdf_info = sushichef.DATA[lang_code]['pdf_info']
+            last_page = max(pagerange['page_end'] for pagerange in pdf_info['page_ranges'])
+            # Enough spreads for `last_page` cropped pages, see `get_num_cropped_pages()`.
+            pdf_path = make_two_up_pdf(os.path.join(tmp_dir, '%s.pdf' % lang_code),
+                                       (last_page + 3) // 2, density=density)
+            with open(pdf_path, 'rb') as f:
+                content = f.read()
+            cassette.record_response(get_request_key('GET', pdf_info['pdf_url']), 200, {
+                'Content-Type': 'application/pdf',
+                'ETag': '"%s-%d"' % (lang_code, len(content)),
+            }, content)
+            video_url = sushichef.DATA[lang_code]['video_info']['video_url']
+            cassette.record_response(get_request_key('GET', video_url), 200, {
+                'Content-Type': 'text/html; charset=utf-8',
+            }, make_video_page(num_videos=len(VIMEO_IDS), padding=50).encode('utf-8'))
+
+        prefix = sushichef.DATA[sushichef.LANG_CODE_EN]['video_info']['filename_prefix']
+        for index, vimeo_id in enumerate(VIMEO_IDS):
+            formats = [{
+                'format_id': 'http-%dp' % height,
+                'url': 'https://vod.example.com/%s-%d.mp4' % (vimeo_id, height),
+                'protocol': 'https',
+                'ext': 'mp4',
+                'width': height * 16 // 9,
+                'height': height,
+                'vcodec': 'avc1',
+                'acodec': 'mp4a',
+                'filesize': video_size * height // 360,
+            } for height in (240, 360, 720)]
+            info = {
+                'id': vimeo_id,
+                'title': 'Video %d' % index,
+                'webpage_url': 'https://vimeo.com/%s' % vimeo_id,
+                'extractor': 'vimeo',
+                'duration': VIDEO_DURATION,
+                'formats': formats,
+                'thumbnails': [{'id': '0', 'url': 'https://i.vimeocdn.com/video/%s.jpg' % vimeo_id}],
+            }
+            cassette.record_info(get_info_key(info['webpage_url'], False), info)
+
+            video_path = os.path.join(tmp_dir, '%s%s.mp4' % (prefix, vimeo_id))
+            thumbnail_path = os.path.join(tmp_dir, '%s%s.jpg' % (prefix, vimeo_id))
+            with open(video_path, 'wb') as f:
+                f.write(make_mp4(size=video_size))
+            with open(thumbnail_path, 'wb') as f:
+                f.write(make_jpeg(info['title']))
+            downloaded = dict(info, format_id='http-360p', ext='mp4', height=360, thumbnails=[
+                dict(info['thumbnails'][0], filename=thumbnail_path)])
+            cassette.record_info(get_info_key(info['webpage_url'], True), downloaded,
+                                 [video_path, thumbnail_path])
+    return cassette
+
+
+def run_case(work_dir, cassette_path, mode, options, verbose=False):
+    """
+    Runs `construct_channel()` in this process, in `work_dir`, with the cassette
+    at `cassette_path` in `mode` ('replay' or 'record') and the chef `options`.
+    """
+    os.chdir(work_dir)
+    import sushichef
+    from metrics import METRICS
+
+    kwargs = dict(options)
+    kwargs[mode] = cassette_path
+    kwargs['metrics_json'] = os.path.join(work_dir, 'metrics.json')
+    if mode == 'replay':
+        # Nothing to rate limit offline.
+        kwargs.setdefault('http_rate', '0')
+    # Same layout as the repository, see `run_batch()` of `batch.py`.
+    for entry in sushichef.DATA.values():
+        os.makedirs(os.path.dirname(entry['pdf_info']['pdf_path']), exist_ok=True)
+        os.makedirs(entry['video_info']['download_path'], exist_ok=True)
+    chef = sushichef.PointBChef()
+    output = sys.stderr if verbose else io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        channel = chef.construct_channel(**kwargs)
+    wall_time = time.perf_counter() - start
+    return {
+        'wall_time': wall_time,
+        'ok': bool(channel),
+        'nodes': sushichef.count_nodes(channel) if channel else {},
+        'stages': METRICS.snapshot(),
+    }
+
+
+def run_benchmark(cassette_path, runs=2, options=None, mode='replay', verbose=False):
+    """
+    Runs the chef `runs` times in the same fresh work directory, each time in a
+    new process.  Returns the list of the results of the runs.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for run in range(runs):
+            command = [sys.executable, os.path.abspath(__file__), '--run-case', mode,
+                       '--work-dir', work_dir, '--cassette', os.path.abspath(cassette_path)]
+            for name, value in sorted((options or {}).items()):
+                command.extend(['--option', '%s=%s' % (name, value)])
+            if verbose:
+                command.append('--verbose')
+            output = subprocess.check_output(command, cwd=work_dir)
+            result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+            results.append(result)
+            print_result('%s run %d' % ('cold' if run == 0 else 'warm', run + 1), result)
+            mode = 'replay'
+    return results
+
+
+def print_result(name, result):
+    print('==> %s: %.3fs%s, %s' % (name, result['wall_time'], '' if result['ok'] else ' FAILED',
+          ', '.join('%d %s' % (count, kind) for kind, count in sorted(result['nodes'].items()))))
+    print('    %-30s %6s %10s %6s' % ('STAGE', 'CALLS', 'TOTAL(s)', 'CACHED'))
+    stages = sorted(result['stages'].items(), key=lambda item: -item[1]['duration'])
+    for stage, values in stages:
+        print('    %-30s %6d %10.3f %6d' % (stage, values['calls'], values['duration'], values['cache_hits']))
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Returns the list of regressions of the runs of `results` compared to the runs
+    of the `baseline` results, a regression being a run or a stage more than
+    `threshold` (e.g. 0.25 = 25%) slower.
+    """
+    regressions = []
+    for run, (result, base) in enumerate(zip(results, baseline.get('results', [])), 1):
+        timings = [('wall_time', result['wall_time'], base['wall_time'])]
+        for stage, values in sorted(result['stages'].items()):
+            base_values = base['stages'].get(stage)
+            if base_values and base_values['duration'] >= MIN_COMPARED_DURATION:
+                timings.append((stage, values['duration'], base_values['duration']))
+        for name, value, base_value in timings:
+            if base_value and value > base_value * (1 + threshold):
+                regressions.append('run %d %s: %.3f > %.3f (+%d%%)' % (
+                    run, name, value, base_value, 100 * (value / base_value - 1)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cassette', help='directory of a recorded cassette, a synthetic one by default')
+    parser.add_argument('--record', help='record a live run (needs network access) to this directory first')
+    parser.add_argument('--runs', type=int, default=2, help='runs in the same work directory')
+    parser.add_argument('--density', type=int, default=10, help='lines of text per page of the synthetic PDFs')
+    parser.add_argument('--option', action='append', default=[], help='chef option NAME=VALUE, e.g. thumbnails=0')
+    parser.add_argument('--output', help='path of the JSON results file')
+    parser.add_argument('--compare', help='path of a JSON results file to compare with')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    parser.add_argument('--verbose', action='store_true', help='show the output of the chef')
+    parser.add_argument('--run-case', choices=('replay', 'record'), help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    options = dict(option.split('=', 1) for option in args.option)
+
+    if args.run_case:
+        result = run_case(args.work_dir, args.cassette, args.run_case, options, verbose=args.verbose)
+        print(json.dumps(result, sort_keys=True))
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cassette_path = args.cassette
+        if args.record:
+            run_benchmark(args.record, runs=1, options=options, mode='record', verbose=args.verbose)
+            cassette_path = args.record
+        elif not cassette_path:
+            cassette_path = os.path.join(tmp_dir, 'cassette')
+            with contextlib.redirect_stdout(io.StringIO()):
+                make_synthetic_cassette(cassette_path, density=args.density)
+        results = run_benchmark(cassette_path, runs=args.runs, options=options, verbose=args.verbose)
+
+    report = {
+        'meta': {
+            'cassette': args.record or args.cassette or 'synthetic',
+            'options': options,
+            'python': platform.python_version(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print('==> Saved results to', args.output)
+
+    failed = not all(result['ok'] for result in results)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold)
+        for regression in regressions:
+            print('==> REGRESSION', regression)
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Benchmark of the cold start of the chef: the time to import its modules.
+
+Imports each module in a fresh interpreter with `python -X importtime` and
+records the cumulative import time of the module and of its heaviest imports.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --modules sushichef batch --budget 800 --repeat 5
+
+The script exits with status 1 if the import of a module takes longer than
+`--budget` milliseconds (the fastest of `--repeat` runs), or if it imports one
+of the `--lazy` modules, which must only be imported by the runs using them.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ('sushichef', 'batch')
+# Imported when a video is planned or downloaded, not on import.
+LAZY_MODULES = ('youtube_dl',)
+BUDGET = 1500  # milliseconds
+
+
+def parse_importtime(output):
+    """
+    Parses the `-X importtime` lines of `output`.
+    Returns the list of tuples: (module, depth, self µs, cumulative µs)
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # the header line
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), depth, int(parts[0]), int(parts[1])))
+    return imports
+
+
+def measure_import(module):
+    """
+    Imports `module` in a new interpreter.
+    Returns the list of its imports, see `parse_importtime()`.
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+        cwd=ROOT_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    if proc.returncode != 0:
+        raise RuntimeError('import %s failed:\n%s' % (module, proc.stderr[-2000:]))
+    return parse_importtime(proc.stderr)
+
+
+def run_benchmark(module, repeat=3, top=10, lazy_modules=LAZY_MODULES):
+    """
+    Imports `module` `repeat` times, the first run warming up the bytecode cache.
+    Returns the result dict of the module.
+    """
+    measure_import(module)
+    runs = [measure_import(module) for i in range(max(1, repeat))]
+    totals = []
+    for imports in runs:
+        totals.append(sum(cumulative for name, depth, self_us, cumulative in imports if depth == 0))
+    fastest = runs[totals.index(min(totals))]
+    heaviest = sorted(
+        (item for item in fastest if item[0] != module),
+        key=lambda item: item[3], reverse=True)[:top]
+    loaded = set(name for name, depth, self_us, cumulative in fastest)
+    return {
+        'module': module,
+        'best_ms': min(totals) / 1000.0,
+        'median_ms': statistics.median(totals) / 1000.0,
+        'modules': len(fastest),
+        'heaviest': [(name, cumulative / 1000.0) for name, depth, self_us, cumulative in heaviest],
+        'lazy_loaded': sorted(name for name in lazy_modules if name in loaded),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', nargs='*', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per module, the fastest is kept')
+    parser.add_argument('--budget', type=float, default=BUDGET, help='max import time in milliseconds')
+    parser.add_argument('--top', type=int, default=10, help='number of the heaviest imports to print')
+    parser.add_argument('--lazy', nargs='*', default=LAZY_MODULES, help='modules that must not be imported')
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        result = run_benchmark(module, repeat=args.repeat, top=args.top, lazy_modules=args.lazy)
+        print('==> import %-12s best %7.1f ms  median %7.1f ms  (%d modules)' % (
+            module, result['best_ms'], result['median_ms'], result['modules']))
+        for name, cumulative_ms in result['heaviest']:
+            print('    %7.1f ms  %s' % (cumulative_ms, name))
+        if result['best_ms'] > args.budget:
+            print('==> OVER BUDGET import %s: %.1f ms > %.1f ms' % (module, result['best_ms'], args.budget))
+            failed = True
+        if result['lazy_loaded']:
+            print('==> EAGER IMPORT import %s loads %s' % (module, ', '.join(result['lazy_loaded'])))
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the PDF cropping and chapter splitting functions of `sushichef.py`.
+
+Generates a synthetic two-page spread PDF (no network access needed), runs each
+function in a fresh process and records its wall time, pages/sec and peak RSS.
+
+    python benchmarks/bench_pdf.py --pages 137 --density 40 --output bench.json
+    python benchmarks/bench_pdf.py --compare bench.json --threshold 0.25
+
+With `--compare`, the script exits with status 1 if any function got slower (or
+used more memory) than the baseline results by more than `--threshold`.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+PAGE_WIDTH = 1190  # two A4 pages side by side, in points
+PAGE_HEIGHT = 842
+LOREM = 'Lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor'
+
+BENCHMARKS = (
+    'split_left_right_pages',
+    'split_chapters',
+    'crop_and_split_chapters',
+    'crop_and_split_chapters_stream',
+    'print_pdf_info',
+)
+
+
+def make_two_up_pdf(path, num_pages, density=40, width=PAGE_WIDTH, height=PAGE_HEIGHT):
+    """
+    Writes a synthetic PDF of `num_pages` two-page spreads to `path`, each page
+    having `density` lines of text on both halves.
+    """
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        None,  # page tree, written once the page ids are known
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    page_ids = []
+    for page_num in range(num_pages):
+        lines = []
+        for line in range(density):
+            y = height - 40 - (line * (height - 80) // max(density, 1))
+            for x in (40, width // 2 + 40):
+                lines.append('BT /F1 10 Tf %d %d Td (%d: %s) Tj ET' % (x, y, page_num, LOREM))
+        stream = '\n'.join(lines).encode('latin-1')
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+        content_id = len(objects)
+        objects.append((
+            '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+            '/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>'
+            % (width, height, content_id)).encode('latin-1'))
+        page_ids.append(len(objects))
+    kids = ' '.join('%d 0 R' % page_id for page_id in page_ids)
+    objects[1] = ('<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, num_pages)).encode('latin-1')
+
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n')
+    offsets = []
+    for obj_id, obj in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b'%d 0 obj\n%s\nendobj\n' % (obj_id, obj))
+    xref_offset = out.tell()
+    out.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b'%010d 00000 n \n' % offset)
+    out.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+              % (len(objects) + 1, xref_offset))
+    with open(path, 'wb') as f:
+        f.write(out.getvalue())
+    return path
+
+
+def make_page_ranges(num_pages, num_chapters=8):
+    """
+    Returns `page_ranges` splitting `num_pages` into `num_chapters` chapters, the
+    second chapter having subchapters like Section 2 of the guide.
+    """
+    size = max(1, num_pages // num_chapters)
+    page_ranges = []
+    for index in range(num_chapters):
+        page_start = index * size
+        page_end = num_pages if index == num_chapters - 1 else page_start + size
+        page_ranges.append({'title': 'Chapter %d' % index, 'page_start': page_start, 'page_end': page_end})
+    section = page_ranges[1]
+    middle = (section['page_start'] + section['page_end']) // 2
+    section['children'] = [
+        {'title': 'Subchapter 1', 'page_start': section['page_start'] + 1, 'page_end': middle},
+        {'title': 'Subchapter 2', 'page_start': middle, 'page_end': section['page_end']},
+    ]
+    return page_ranges
+
+
+def reset_peak_rss():
+    """
+    Resets the peak RSS of this process (Linux only) so it can be measured for
+    the benchmarked function only.  Returns False if it can't be reset.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def get_peak_rss():
+    """
+    Returns the peak RSS of this process in KB.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_case(name, work_dir, num_pages):
+    """
+    Runs the benchmark `name` in this process on the PDFs in `work_dir`.
+    """
+    import sushichef
+    from PyPDF2 import PdfFileReader
+
+    source_path = os.path.join(work_dir, 'source.pdf')
+    cropped_path = os.path.join(work_dir, 'cropped.pdf')
+    split_path = os.path.join(work_dir, 'split_%s' % name, '')
+    os.makedirs(split_path, exist_ok=True)
+    with open(cropped_path, 'rb') as f:
+        cropped_pages = PdfFileReader(f).getNumPages()
+    sushichef.DATA[sushichef.LANG_CODE_EN]['pdf_info'].update({
+        'pdf_path': source_path,
+        'pdf_path_cropped': cropped_path,
+        'pdf_split_path': split_path,
+        'page_ranges': make_page_ranges(cropped_pages),
+    })
+
+    reset_peak_rss()
+    rss_before = get_peak_rss()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if name == 'split_left_right_pages':
+            sushichef.split_left_right_pages(source_path, os.path.join(work_dir, 'out.pdf'))
+            pages = num_pages
+        elif name == 'split_chapters':
+            sushichef.split_chapters(sushichef.LANG_CODE_EN)
+            pages = cropped_pages
+        elif name == 'crop_and_split_chapters':
+            sushichef.crop_and_split_chapters(sushichef.LANG_CODE_EN)
+            pages = num_pages
+        elif name == 'crop_and_split_chapters_stream':
+            sushichef.crop_and_split_chapters(sushichef.LANG_CODE_EN, stream=True)
+            pages = num_pages
+        elif name == 'print_pdf_info':
+            sushichef.print_pdf_info(cropped_path)
+            pages = cropped_pages
+        else:
+            raise ValueError('Unknown benchmark %s' % name)
+    wall_time = time.perf_counter() - start
+    peak_rss = get_peak_rss()
+    return {
+        'wall_time': wall_time,
+        'pages': pages,
+        'pages_per_sec': pages / wall_time if wall_time else 0,
+        'peak_rss_kb': peak_rss,
+        'rss_delta_kb': peak_rss - rss_before,
+    }
+
+
+def run_benchmarks(num_pages, density, names=BENCHMARKS, repeat=1):
+    """
+    Runs each benchmark `repeat` times, each time in a fresh process so the peak
+    RSS is the one of that benchmark only.  Keeps the fastest run.
+    """
+    import sushichef
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        make_two_up_pdf(os.path.join(work_dir, 'source.pdf'), num_pages, density=density)
+        with contextlib.redirect_stdout(io.StringIO()):
+            sushichef.split_left_right_pages(
+                os.path.join(work_dir, 'source.pdf'), os.path.join(work_dir, 'cropped.pdf'))
+        for name in names:
+            runs = []
+            for i in range(repeat):
+                output = subprocess.check_output([
+                    sys.executable, os.path.abspath(__file__), '--run-case', name,
+                    '--work-dir', work_dir, '--pages', str(num_pages)], cwd=work_dir)
+                runs.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+            results[name] = min(runs, key=lambda run: run['wall_time'])
+            print('%-25s %8.3fs %10.1f pages/s %10d KB peak RSS (+%d KB)' % (
+                name, results[name]['wall_time'], results[name]['pages_per_sec'],
+                results[name]['peak_rss_kb'], results[name]['rss_delta_kb']))
+    return results
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Returns the list of regressions of `results` compared to the `baseline`
+    results, a regression being more than `threshold` (e.g. 0.25 = 25%) slower or
+    using more memory.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        for metric in ('wall_time', 'peak_rss_kb'):
+            if base[metric] and result[metric] > base[metric] * (1 + threshold):
+                regressions.append('%s %s: %.3f > %.3f (+%d%%)' % (
+                    name, metric, result[metric], base[metric],
+                    100 * (result[metric] / base[metric] - 1)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=137, help='number of two-page spreads')
+    parser.add_argument('--density', type=int, default=40, help='lines of text per page')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the fastest is kept')
+    parser.add_argument('--only', nargs='*', choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument('--output', help='path of the JSON results file')
+    parser.add_argument('--compare', help='path of a JSON results file to compare with')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, args.work_dir, args.pages)))
+        return 0
+
+    import PyPDF2
+    results = run_benchmarks(args.pages, args.density, names=args.only, repeat=args.repeat)
+    report = {
+        'meta': {
+            'pages': args.pages,
+            'density': args.density,
+            'python': platform.python_version(),
+            'pypdf2': getattr(PyPDF2, '__version__', ''),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print('==> Saved results to', args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold)
+        for regression in regressions:
+            print('==> REGRESSION', regression)
+        if regressions:
+            return 1
+        print('==> No regressions compared to', args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+Benchmark and check of the HTML parsers of the video pages scraping of `sushichef.py`.
+
+Parses saved copies of the `21cs-videos` pages (the reconstructed EN and MY
+pages in `benchmarks/fixtures/` if none are given, or a synthetic page of the
+same structure with --synthetic) with `parse_video_blocks()` and each parser,
+checks the videos found are the same, field by field, as with the original full
+page 'html5lib' parsing of `scrape_video_data()` and reports the time per page.
+The check runs offline, --check only runs it.
+
+The fixtures are NOT copies of the live pages: they were written by hand with
+the Squarespace block layout the scraper expects and the Vimeo URLs recorded in
+`notebooks/3. Web Scraping Starter.ipynb`, with placeholder titles and
+descriptions.  The check shows the parsers agree on that layout, not on the
+live markup; save real copies with --fetch to check those.
+
+    python benchmarks/bench_scrape.py --check
+    python benchmarks/bench_scrape.py --fetch benchmarks/fixtures/
+    python benchmarks/bench_scrape.py benchmarks/fixtures/*.html --repeat 20
+
+The script exits with status 1 if a parser doesn't give the same output.
+"""
+import argparse
+import html
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+FIXTURES_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'fixtures')
+# Reconstructed pages, see the docstring.
+FIXTURES = ('21cs-videos.html', '21cs-videos-mm.html')
+FIELDS = ('url', 'title', 'description')
+
+PARSERS = ('html5lib', 'lxml', 'html.parser')
+VIMEO_IDS = ('262755467', '262570817', '262755072', '262755673', '267661918', '262572490')
+DESCRIPTIONS = (
+    '<p>Visual tools help students <em>organize</em> their thinking &amp; ideas.</p>'
+    '<p>Use them   in every lesson.</p>',
+    'Think on your own,<br/>then pair with a partner<br>and share with the class.',
+    '<p>သင်ထောက်ကူ ပစ္စည်းများ&nbsp;နှင့် <strong>ဂျစ်ဆော</strong></p>',
+)
+
+
+def make_video_page(num_videos=24, padding=200):
+    """
+    Returns the HTML of a synthetic video page laid out like the Squarespace
+    pages of the guide, with `padding` unrelated blocks around the videos.
+    """
+    filler = ''.join(
+        '<div class="sqs-block spacer-block"><div class="sqs-block-content">'
+        '<a href="/page-%d">Link %d</a><span>&nbsp;</span></div></div>' % (i, i)
+        for i in range(padding))
+    blocks = []
+    for index in range(num_videos):
+        vimeo_id = VIMEO_IDS[index % len(VIMEO_IDS)]
+        iframe = ('<iframe src="https://player.vimeo.com/video/%s?app_id=122963" width="640" '
+                  'height="360" frameborder="0" title="Video %d: Tools &amp; Tips" '
+                  'allowfullscreen></iframe>' % (vimeo_id, index))
+        blocks.append(
+            '<div class="content-inner"><div class="sqs-block html-block sqs-block-html">'
+            '<div class="sqs-block-content"><h3>Video %d</h3></div></div>'
+            '<div class="sqs-block video-block sqs-block-video"><div class="sqs-block-content">'
+            '<div class="sqs-video-wrapper" data-html="%s"></div></div></div>'
+            '<div class="sqs-block html-block sqs-block-html"><div class="sqs-block-content">'
+            '%s</div></div></div>' % (index, html.escape(iframe), DESCRIPTIONS[index % len(DESCRIPTIONS)]))
+    return ('<!doctype html><html><head><title>21CS Videos</title>'
+            '<script>var data = "<div class=\'content-inner\'>";</script></head><body>'
+            '<header>%s</header><main>%s</main><footer>%s</footer></body></html>'
+            % (filler, ''.join(blocks), filler))
+
+
+def parse_original(page_html):
+    """
+    The parsing of the video page of `scrape_video_data()` before
+    `parse_video_blocks()`: the whole page and each `data-html` with 'html5lib'.
+    Returns a list of dicts: {'url': ..., 'title': ..., 'description': ...}
+    """
+    from bs4 import BeautifulSoup
+
+    videos = []
+    page = BeautifulSoup(page_html, 'html5lib')
+    content_divs = page.find_all('div', class_='content-inner')
+    for content_div in content_divs:
+        video_block = content_div.find('div', class_='video-block')
+        video_wrapper = video_block.find('div', class_='sqs-video-wrapper')
+        data_html_raw = video_wrapper['data-html']
+        data_html = html.unescape(data_html_raw)
+        chunk = BeautifulSoup(data_html, 'html5lib')
+        iframe = chunk.find('iframe')
+        src = iframe['src']
+        title = iframe['title']
+
+        description = ''
+        block_html = content_div.find_all('div', class_='sqs-block html-block sqs-block-html')
+        if isinstance(block_html, list) and len(block_html) > 1:
+            desc_block = block_html[1]
+            block_content = desc_block.find('div', class_='sqs-block-content')
+            description = block_content.get_text(" ", strip=True)
+        videos.append({'url': src, 'title': title, 'description': description})
+    return videos
+
+
+def compare_videos(videos, expected):
+    """
+    Returns the list of the differences of `videos` with the `expected` videos,
+    field by field.
+    """
+    differences = []
+    if len(videos) != len(expected):
+        differences.append('%d videos instead of %d' % (len(videos), len(expected)))
+    for index, (video, expected_video) in enumerate(zip(videos, expected)):
+        for field in FIELDS:
+            if video.get(field) != expected_video.get(field):
+                differences.append('video %d %s: %r instead of %r' % (
+                    index, field, video.get(field), expected_video.get(field)))
+        for field in sorted(set(video) - set(FIELDS)):
+            differences.append('video %d: unexpected field %s' % (index, field))
+    return differences
+
+
+def check_pages(pages, parsers=PARSERS):
+    """
+    Compares the output of `parse_video_blocks()` with each parser and the
+    original parsing of each of the `pages` (dict of name --> html).
+    Returns the list of mismatches.
+    """
+    from bs4.builder import builder_registry
+    import sushichef
+
+    mismatches = []
+    for name, page_html in pages.items():
+        expected = parse_original(page_html)
+        if not expected:
+            mismatches.append('%s: no videos found' % name)
+        for parser in parsers:
+            if not builder_registry.lookup(parser):
+                print('%-20s %-12s not installed' % (name, parser))
+                continue
+            videos = list(sushichef.parse_video_blocks(page_html, parser=parser))
+            differences = compare_videos(videos, expected)
+            print('%-20s %-12s %4d videos %s' % (name, parser, len(videos), 'MISMATCH' if differences else 'OK'))
+            for difference in differences:
+                mismatches.append('%s %s %s' % (name, parser, difference))
+    return mismatches
+
+
+def fetch_pages(directory):
+    """
+    Saves copies of the video pages of each language to `directory`.
+    """
+    import requests
+    import sushichef
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for lang_code in sushichef.LANG_CODES:
+        url = sushichef.DATA[lang_code]['video_info']['video_url']
+        response = requests.get(url)
+        response.raise_for_status()
+        path = os.path.join(directory, '%s.html' % url.rstrip('/').split('/')[-1])
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(response.text)
+        print('==> Saved', url, 'to', path)
+        paths.append(path)
+    return paths
+
+
+def time_parser(page_html, parser, repeat):
+    """
+    Returns tuple: (videos, best time of `repeat` parses in seconds)
+    """
+    import sushichef
+
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        videos = list(sushichef.parse_video_blocks(page_html, parser=parser))
+        times.append(time.perf_counter() - start)
+    return videos, min(times)
+
+
+def run_benchmarks(pages, parsers=PARSERS, repeat=5):
+    """
+    Parses each of the `pages` (dict of name --> html) with each parser.
+    Returns the list of mismatches with the original parsing.
+    """
+    from bs4.builder import builder_registry
+
+    mismatches = []
+    for name, page_html in pages.items():
+        times = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            expected = parse_original(page_html)
+            times.append(time.perf_counter() - start)
+        base_time = min(times)
+        print('%-20s %-12s %8.2f ms %4d videos' % (name, 'original', base_time * 1000, len(expected)))
+        for parser in parsers:
+            if not builder_registry.lookup(parser):
+                print('%-20s %-12s not installed' % (name, parser))
+                continue
+            videos, parse_time = time_parser(page_html, parser, repeat)
+            same = not compare_videos(videos, expected)
+            print('%-20s %-12s %8.2f ms %4d videos %6.1fx faster %s' % (
+                name, parser, parse_time * 1000, len(videos), base_time / parse_time,
+                'OK' if same else 'MISMATCH'))
+            if not same:
+                mismatches.append('%s %s' % (name, parser))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pages', nargs='*', help='saved copies of the video pages')
+    parser.add_argument('--fetch', metavar='DIR', help='save copies of the video pages to DIR first')
+    parser.add_argument('--check', action='store_true', help='only check the parsers, without timing them')
+    parser.add_argument('--synthetic', action='store_true', help='use a synthetic page instead of the fixtures')
+    parser.add_argument('--videos', type=int, default=24, help='videos of the synthetic page')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per parser, the fastest is kept')
+    parser.add_argument('--parsers', nargs='*', choices=PARSERS, default=PARSERS)
+    args = parser.parse_args()
+
+    paths = list(args.pages)
+    if args.fetch:
+        paths.extend(fetch_pages(args.fetch))
+    pages = {}
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            pages[os.path.basename(path)] = f.read()
+    if args.synthetic:
+        pages['synthetic'] = make_video_page(args.videos)
+    elif not pages:
+        for name in FIXTURES:
+            with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+                pages[name] = f.read()
+
+    if args.check:
+        mismatches = check_pages(pages, parsers=args.parsers)
+    else:
+        mismatches = run_benchmarks(pages, parsers=args.parsers, repeat=args.repeat)
+    for mismatch in mismatches:
+        print('==> MISMATCH', mismatch)
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
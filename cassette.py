@@ -0,0 +1,315 @@
+import functools
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.response import HTTPResponse
+
+from fetch import get_session
+from manifest import HASH_CHUNK_SIZE
+from pointb import get_vimeo_id, set_youtube_dl
+
+
+CASSETTES_PATH = os.path.join(os.getcwd(), 'chefdata', 'cassettes', '')
+CASSETTE_MODES = ('record', 'replay')
+# Request headers dropped when recording so the cassette has the whole content:
+# the run being recorded may have files and pages from previous runs.
+CONDITIONAL_HEADERS = ('If-None-Match', 'If-Modified-Since', 'If-Range', 'Range')
+# Response headers describing the transfer rather than the (decoded) content.
+TRANSFER_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length', 'connection')
+
+
+class CassetteMissError(LookupError):
+    pass
+
+
+def get_request_key(method, url):
+    return '%s %s' % (method.upper(), url)
+
+
+def get_info_key(url, download):
+    """
+    Returns the key of the youtube_dl result of the video `url`, by Vimeo id so
+    the player URLs of the video pages and the URLs of the extracted info match.
+    """
+    return '%s %s' % ('download' if download else 'info', get_vimeo_id(url) or url)
+
+
+class Cassette():
+    """
+    Store of the HTTP responses and the youtube_dl results of a run, recorded in
+    `record` mode and served back offline in `replay` mode.
+
+    The cassette is a directory with an `index.json` of the recorded requests and
+    a `blobs/` directory of their contents, named by sha256 so the same content
+    is stored once:
+     - `http`: key 'GET <url>' --> {'status', 'headers', 'blob'}
+     - `youtube_dl`: key 'info <vimeo id>' (formats listed without downloading)
+       or 'download <vimeo id>' --> {'blob' of the info dict, 'files'}, the
+       `files` being the downloaded video and thumbnails as (name, blob) pairs.
+    """
+
+    def __init__(self, path, mode='replay'):
+        if mode not in CASSETTE_MODES:
+            raise ValueError('Unknown cassette mode %s' % mode)
+        self.path = path
+        self.mode = mode
+        self.index = {'http': {}, 'youtube_dl': {}}
+        self.lock = threading.Lock()
+        index_path = os.path.join(self.path, 'index.json')
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                self.index.update(json.load(f))
+        elif mode == 'replay':
+            raise CassetteMissError('No cassette in %s' % self.path)
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        index_path = os.path.join(self.path, 'index.json')
+        with self.lock:
+            with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, indent=2, sort_keys=True, ensure_ascii=False)
+            os.replace(index_path + '.tmp', index_path)
+
+    def get_blob_path(self, digest):
+        return os.path.join(self.path, 'blobs', digest)
+
+    def put_blob(self, data):
+        """
+        Stores the bytes `data`.  Returns their sha256 hex digest.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self.get_blob_path(digest)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            with open(blob_path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(blob_path + '.tmp', blob_path)
+        return digest
+
+    def put_file(self, path):
+        """
+        Stores the contents of the file at `path`.  Returns their sha256 hex digest.
+        """
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        blob_path = self.get_blob_path(digest)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            shutil.copyfile(path, blob_path + '.tmp')
+            os.replace(blob_path + '.tmp', blob_path)
+        return digest
+
+    def get(self, section, key):
+        with self.lock:
+            entry = self.index[section].get(key)
+        if entry is None:
+            raise CassetteMissError('%s not recorded in the cassette %s' % (key, self.path))
+        return entry
+
+    def record_response(self, key, status, headers, content):
+        headers = {name: value for name, value in headers.items() if name.lower() not in TRANSFER_HEADERS}
+        entry = {'status': status, 'headers': headers, 'blob': self.put_blob(content)}
+        with self.lock:
+            self.index['http'][key] = entry
+        self.save()
+        return entry
+
+    def record_info(self, key, info, paths=()):
+        """
+        Records the youtube_dl `info` dict and the files downloaded at `paths`.
+        """
+        serialized = json.dumps(info, sort_keys=True, ensure_ascii=False, default=repr)
+        entry = {
+            'blob': self.put_blob(serialized.encode('utf-8')),
+            'files': [[os.path.basename(path), self.put_file(path)] for path in paths],
+        }
+        with self.lock:
+            self.index['youtube_dl'][key] = entry
+        self.save()
+        return entry
+
+    def load_info(self, key):
+        """
+        Returns the recorded youtube_dl info dict of `key`.
+        """
+        entry = self.get('youtube_dl', key)
+        with open(self.get_blob_path(entry['blob']), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def restore_files(self, key, info, directory, video_name=None):
+        """
+        Copies the files downloaded with the youtube_dl `info` of `key` to
+        `directory` and changes the paths of `info` to them.  The video file is
+        restored as `video_name` if given, e.g. when it was recorded by the other
+        language, whose file names have another prefix.  Returns `info`.
+        """
+        entry = self.get('youtube_dl', key)
+        os.makedirs(directory, exist_ok=True)
+        thumbnail_names = set(os.path.basename(thumbnail['filename'])
+                              for thumbnail in info.get('thumbnails') or [] if thumbnail.get('filename'))
+        for name, digest in entry['files']:
+            if video_name and name not in thumbnail_names:
+                name = video_name
+            path = os.path.join(directory, name)
+            blob_path = self.get_blob_path(digest)
+            if not os.path.exists(path) or os.path.getsize(path) != os.path.getsize(blob_path):
+                shutil.copyfile(blob_path, path)
+        for thumbnail in info.get('thumbnails') or []:
+            if thumbnail.get('filename'):
+                thumbnail['filename'] = os.path.join(directory, os.path.basename(thumbnail['filename']))
+        if info.get('_filename'):
+            info['_filename'] = os.path.join(directory, os.path.basename(info['_filename']))
+        return info
+
+
+class CassetteAdapter(HTTPAdapter):
+    """
+    Transport adapter of the `requests` session recording the responses of the
+    `adapter` to the `cassette`, or replaying them.  When replaying, a request
+    revalidated with the ETag or Last-Modified of the recorded response gets a
+    304 like from the server, the other requests get the whole response.
+    """
+
+    def __init__(self, cassette, adapter=None):
+        super(CassetteAdapter, self).__init__()
+        self.cassette = cassette
+        self.adapter = adapter
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        key = get_request_key(request.method, request.url)
+        if self.cassette.mode == 'record':
+            for name in CONDITIONAL_HEADERS:
+                request.headers.pop(name, None)
+            response = self.adapter.send(request, stream=False, timeout=timeout, verify=verify,
+                                         cert=cert, proxies=proxies)
+            self.cassette.record_response(key, response.status_code, response.headers, response.content)
+            return response
+
+        entry = self.cassette.get('http', key)
+        headers = CaseInsensitiveDict(entry['headers'])
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if ((etag and request.headers.get('If-None-Match') == etag) or
+                (last_modified and request.headers.get('If-Modified-Since') == last_modified)):
+            raw = HTTPResponse(body=b'', headers=headers, status=304, reason='Not Modified',
+                               preload_content=False)
+        else:
+            blob_path = self.cassette.get_blob_path(entry['blob'])
+            headers['Content-Length'] = str(os.path.getsize(blob_path))
+            raw = HTTPResponse(body=open(blob_path, 'rb'), headers=headers, status=entry['status'],
+                               preload_content=False, decode_content=False)
+        return self.build_response(request, raw)
+
+
+class RecordingYoutubeDL():
+    """
+    `youtube_dl.YoutubeDL` recording the info dicts it returns, and the files it
+    downloads, to the `cassette`.
+    """
+
+    def __init__(self, cassette, options):
+        import youtube_dl
+
+        self.cassette = cassette
+        self.options = options
+        self.ydl = youtube_dl.YoutubeDL(options)
+
+    def __enter__(self):
+        self.ydl.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        return self.ydl.__exit__(*args)
+
+    def add_default_info_extractors(self):
+        self.ydl.add_default_info_extractors()
+
+    def record(self, url, info, download):
+        paths = []
+        if download:
+            # Same file name as `PointBVideo.set_filepath_and_thumbnail()`.
+            paths.append(self.options['outtmpl'] % info)
+            paths.extend(thumbnail['filename'] for thumbnail in info.get('thumbnails') or []
+                         if thumbnail.get('filename'))
+        self.cassette.record_info(get_info_key(url, download), info,
+                                  [path for path in paths if os.path.exists(path)])
+
+    def extract_info(self, url, download=True, process=True, **kwargs):
+        info = self.ydl.extract_info(url, download=download, process=process, **kwargs)
+        self.record(url, info, download)
+        return info
+
+    def process_ie_result(self, ie_result, download=True, **kwargs):
+        info = self.ydl.process_ie_result(ie_result, download=download, **kwargs)
+        self.record(ie_result.get('webpage_url') or ie_result.get('url'), info, download)
+        return info
+
+
+class ReplayingYoutubeDL():
+    """
+    Stand-in of `youtube_dl.YoutubeDL` returning the info dicts recorded in the
+    `cassette` and copying the recorded files where youtube_dl would download them.
+    """
+
+    def __init__(self, cassette, options):
+        self.cassette = cassette
+        self.options = options
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def add_default_info_extractors(self):
+        pass
+
+    def load(self, url, download):
+        key = get_info_key(url, download)
+        info = self.cassette.load_info(key)
+        if download:
+            path = self.options['outtmpl'] % info
+            self.cassette.restore_files(key, info, os.path.dirname(path), os.path.basename(path))
+        return info
+
+    def extract_info(self, url, download=True, process=True, **kwargs):
+        return self.load(url, download)
+
+    def process_ie_result(self, ie_result, download=True, **kwargs):
+        return self.load(ie_result.get('webpage_url') or ie_result.get('url'), download)
+
+
+def get_cassette_path(name):
+    """
+    Returns the directory of the cassette `name`, a path or the name of a
+    cassette in `chefdata/cassettes/`.
+    """
+    if os.path.isabs(name) or os.path.sep in name:
+        return name
+    return os.path.join(CASSETTES_PATH, name)
+
+
+def use_cassette(path, mode='replay'):
+    """
+    Routes the HTTP requests of the shared session (see `fetch.get_session()`)
+    and the youtube_dl calls of the videos through the cassette `path` (see
+    `get_cassette_path()`), to record them in `record` mode or to serve them
+    offline in `replay` mode.
+    Returns the `Cassette`.
+    """
+    cassette = Cassette(get_cassette_path(path), mode=mode)
+    session = get_session()
+    for prefix in ('http://', 'https://'):
+        session.mount(prefix, CassetteAdapter(cassette, adapter=session.adapters[prefix]))
+    factory = RecordingYoutubeDL if mode == 'record' else ReplayingYoutubeDL
+    set_youtube_dl(functools.partial(factory, cassette))
+    print('==> CASSETTE', mode, cassette.path)
+    return cassette
@@ -0,0 +1,190 @@
+import os
+import threading
+
+from email.utils import formatdate
+
+import requests
+
+from manifest import load_json, write_json_atomic
+
+
+CHUNK_SIZE = 64 * 1024
+POOL_SIZE = 10
+TIMEOUT = 60  # seconds, for connecting and between received bytes
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Returns the `requests.Session` shared by all the downloads so the connections
+    to the same host are pooled and reused.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def get_meta_path(path):
+    """
+    Returns the path of the sidecar file storing the validators (ETag and
+    Last-Modified) of the file downloaded to `path`.
+    """
+    return path + '.meta.json'
+
+
+def read_meta(path):
+    return load_json(get_meta_path(path), 'download metadata')
+
+
+def write_meta(path, meta):
+    write_json_atomic(get_meta_path(path), meta)
+
+
+def get_validators(response):
+    return {
+        'etag': response.headers.get('ETag', ''),
+        'last_modified': response.headers.get('Last-Modified', ''),
+    }
+
+
+def fetch_page(url, validators=None, session=None):
+    """
+    GETs the page at `url`, revalidated with If-None-Match/If-Modified-Since if
+    the `validators` (see `get_validators()`) of the last fetch are given.
+    Returns the response, None if the page is unchanged (304).
+    """
+    session = session or get_session()
+    validators = validators or {}
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    response = session.get(url, headers=headers, timeout=TIMEOUT)
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+    return response
+
+
+def get_range_start(response):
+    """
+    Returns the first byte of the `Content-Range` of a 206 `response`, None if
+    the header is missing or invalid.
+    """
+    unit, _, byte_range = response.headers.get('Content-Range', '').strip().partition(' ')
+    start = byte_range.split('-', 1)[0]
+    if unit != 'bytes' or not start.isdigit():
+        return None
+    return int(start)
+
+
+def get_remote_size(url, session=None):
+    """
+    Returns the Content-Length of `url` from a HEAD request, None if the server
+    doesn't give it.
+    """
+    session = session or get_session()
+    response = session.head(url, allow_redirects=True, timeout=TIMEOUT)
+    response.raise_for_status()
+    length = response.headers.get('Content-Length', '')
+    return int(length) if length.isdigit() else None
+
+
+def download_file(url, path, session=None, chunk_size=CHUNK_SIZE):
+    """
+    Streams `url` to `path` in chunks of `chunk_size` bytes so memory use stays
+    flat whatever the size of the file.
+
+    - The content is written to `path + '.part'` and renamed to `path` once
+      complete, so `path` is never left half-written.
+    - An interrupted download leaves the `.part` file, which is resumed on the
+      next call with an HTTP Range request (`If-Range` makes the server send the
+      whole file instead if it changed in between).  A partial response that
+      doesn't start at the end of the `.part` file is discarded and the download
+      starts over.
+    - An existing `path` is revalidated with If-None-Match/If-Modified-Since
+      using the validators stored in its sidecar `.meta.json` file.  If the
+      server gave no validators, its Content-Length is checked with a HEAD
+      request instead: the existing file is kept when the size is the same, or
+      when the server doesn't give the size either.
+
+    Returns True if the file was (re)downloaded, False if it was unchanged.
+    """
+    session = session or get_session()
+    part_path = path + '.part'
+    meta = read_meta(path)
+    headers = {}
+
+    if os.path.exists(part_path) and meta.get('part_url') == url:
+        offset = os.path.getsize(part_path)
+        headers['Range'] = 'bytes=%d-' % offset
+        if_range = meta.get('part_etag') or meta.get('part_last_modified')
+        if if_range:
+            headers['If-Range'] = if_range
+    else:
+        offset = 0
+        if os.path.exists(path):
+            if meta.get('url') == url and not (meta.get('etag') or meta.get('last_modified')):
+                size = get_remote_size(url, session=session)
+                if size is None or size == os.path.getsize(path):
+                    return False
+            if meta.get('url') == url and meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('url') == url and meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+            elif not meta:
+                # Files downloaded before the sidecar existed are checked by age.
+                headers['If-Modified-Since'] = formatdate(os.path.getmtime(path), usegmt=True)
+
+    with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code == 304:
+            return False
+        if response.status_code == 416 and offset:
+            # The `.part` file is already complete (or bogus), start over.
+            os.remove(part_path)
+            return download_file(url, path, session=session, chunk_size=chunk_size)
+        response.raise_for_status()
+
+        if response.status_code == 206 and get_range_start(response) != offset:
+            # Appending this range would corrupt the file, start over.
+            print('==> Unexpected Content-Range %r for %s, restarting the download' % (
+                response.headers.get('Content-Range'), url))
+            os.remove(part_path)
+            return download_file(url, path, session=session, chunk_size=chunk_size)
+        if response.status_code == 206:
+            mode = 'ab'
+        else:
+            mode = 'wb'
+            offset = 0
+            validators = get_validators(response)
+            meta.update({
+                'part_url': url,
+                'part_etag': validators['etag'],
+                'part_last_modified': validators['last_modified'],
+            })
+            write_meta(path, meta)
+
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+    os.replace(part_path, path)
+    write_meta(path, {
+        'url': url,
+        'etag': meta.get('part_etag', ''),
+        'last_modified': meta.get('part_last_modified', ''),
+        'size': os.path.getsize(path),
+    })
+    return True
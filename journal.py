@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+import time
+
+from manifest import hash_data
+
+
+RUN_JOURNAL_PATH = os.path.join(os.getcwd(), 'chefdata', 'run_journal.jsonl')
+
+JOURNAL_ENCODER = json.JSONEncoder(sort_keys=True, ensure_ascii=False)
+
+
+def get_output_stat(path):
+    """
+    Returns the [size, mtime in ns] of the file at `path`, None if it's missing.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class RunJournal():
+    """
+    Write-ahead journal of the units of work finished by a run (a PDF downloaded,
+    a chapter split, a video downloaded...) and of their results, so a run that
+    crashed or failed can be resumed by the next run at its first unfinished unit.
+
+    The journal is a JSON lines file in `chefdata/`.  Its first line has the
+    `run` key of the inputs of the run (see `get_run_key()`), then each finished
+    unit appends a line {'unit', 'result', 'outputs'}, written with one `write()`
+    to the file opened in append mode and synced to disk before the run goes on,
+    so the worker processes can add their units to the same journal.  The
+    `outputs` are the files written by the unit with their size and mtime: a
+    unit is only done again if one of them changed or is missing.  A line torn
+    by a crash is ignored.
+
+    The journal of a run with other inputs is discarded, and the journal of a
+    run that finished is removed by `finish()`.  Unlike the build manifest,
+    which hashes the inputs and outputs to skip the stages that didn't change,
+    the journal trusts the units of the interrupted run and skips them, including
+    the network requests.
+    """
+
+    def __init__(self, path=RUN_JOURNAL_PATH, run_key=None):
+        self.path = path
+        self.run_key = run_key
+        self.units = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """
+        Loads the units of the journal, the journal is started again if it was
+        written by a run with another `run_key`.  The units are kept when
+        `run_key` is None, e.g. in the worker processes.
+        """
+        self.units = {}
+        run_key = None
+        torn = False
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line_num, line in enumerate(f, 1):
+                    torn = not line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        print('==> Ignoring torn line %d of the run journal %s' % (line_num, self.path))
+                        continue
+                    if 'run' in entry:
+                        run_key = entry['run']
+                    elif 'forget' in entry:
+                        self.units.pop(entry['forget'], None)
+                    else:
+                        self.units[entry['unit']] = entry
+        if self.run_key is not None and run_key != self.run_key:
+            if self.units:
+                print('==> The inputs of the run changed, NOT resuming the run journal', self.path)
+            self.discard()
+        elif self.run_key is not None:
+            if torn:
+                # End the torn line so it doesn't swallow the next unit.
+                self.append_data(b'\n')
+            if self.units:
+                print('==> RESUMING the run journal %s: %d units done' % (self.path, len(self.units)))
+        return self.units
+
+    def append_data(self, data):
+        with self.lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def append(self, entry):
+        self.append_data((JOURNAL_ENCODER.encode(entry) + '\n').encode('utf-8'))
+
+    def discard(self):
+        """
+        Starts a new journal for `run_key`, forgetting all the units.
+        """
+        self.units = {}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        self.append({'run': self.run_key, 'started': time.time()})
+
+    def get(self, unit):
+        """
+        Returns the result of `unit` if it was done and its outputs are unchanged,
+        else None.
+        """
+        entry = self.units.get(unit)
+        if entry is None:
+            return None
+        for path, stat in entry['outputs'].items():
+            if get_output_stat(path) != stat:
+                return None
+        return entry['result']
+
+    def record(self, unit, result=True, outputs=()):
+        """
+        Records that `unit` is done with its JSON-serializable `result` and the
+        files at `outputs` (paths, None for no file).
+        """
+        entry = {
+            'unit': unit,
+            'result': result,
+            'outputs': {path: get_output_stat(path) for path in outputs if path},
+        }
+        self.append(entry)
+        self.units[unit] = entry
+        return result
+
+    def forget(self, unit):
+        if self.units.pop(unit, None) is not None:
+            self.append({'forget': unit})
+
+    def forget_output(self, path):
+        """
+        Forget the units that wrote the file at `path`, e.g. a broken output, so
+        they are done again.  Returns the list of the units.
+        """
+        units = [unit for unit, entry in self.units.items() if path in entry['outputs']]
+        for unit in units:
+            self.forget(unit)
+        return units
+
+    def finish(self):
+        """
+        Removes the journal once the run is done, the next run starts from scratch.
+        """
+        self.units = {}
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        print('==> Run finished, removed the run journal', self.path)
+
+
+def get_run_key(data, options=None):
+    """
+    Returns the key of the inputs of a run: the `data` entries of its languages
+    (URLs, paths and page ranges) and the `options` changing its results.
+    """
+    return hash_data({'data': data, 'options': options or {}})
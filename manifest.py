@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+
+
+BUILD_MANIFEST_PATH = os.path.join(os.getcwd(), 'chefdata', 'build_manifest.json')
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def load_json(path, name, default=None):
+    """
+    Returns the data of the JSON file at `path`, or `default` ({} if None) if the
+    file is missing or invalid.  `name` describes the file in the message.
+    """
+    if default is None:
+        default = {}
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError as e:
+        print('==> Ignoring invalid %s %s %s' % (name, path, e))
+        return default
+
+
+def write_json_atomic(path, data):
+    """
+    Writes `data` as JSON to a temporary file replacing the file at `path`, so a
+    crash never leaves a partly written file.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+def hash_file(path):
+    """
+    Returns the sha256 hex digest of the contents of the file at `path`.
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def hash_data(data):
+    """
+    Returns the sha256 hex digest of the JSON-serializable `data`, e.g. the
+    `page_ranges` of a PDF or the crop parameters.
+    """
+    serialized = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+class BuildManifest():
+    """
+    Persistent record of the content hashes of the inputs and outputs of each
+    build stage, saved as JSON in `chefdata/`.
+
+    A stage is identified by a `key` (e.g. 'crop:en') and is "fresh" when its
+    inputs are the same as the recorded ones and all its recorded outputs still
+    exist with the same content.  Fresh stages can be skipped.
+
+    Worker processes use `persist=False` and send their `changes` back to the
+    parent process, which `merge()`s them, so only one process writes the file.
+    """
+
+    def __init__(self, path=BUILD_MANIFEST_PATH, persist=True):
+        self.path = path
+        self.persist = persist
+        self.entries = {}
+        self.changes = {}
+        self.load()
+
+    def load(self):
+        self.entries = load_json(self.path, 'build manifest')
+        return self.entries
+
+    def save(self):
+        if not self.persist:
+            return
+        write_json_atomic(self.path, self.entries)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def is_fresh(self, key, inputs):
+        """
+        Returns True if the stage `key` was built from the same `inputs` and its
+        outputs are unchanged on disk.
+        """
+        entry = self.entries.get(key)
+        if not entry or entry.get('inputs') != inputs:
+            return False
+        for path, digest in entry.get('outputs', {}).items():
+            if not os.path.exists(path) or hash_file(path) != digest:
+                return False
+        return True
+
+    def record(self, key, inputs, outputs, save=True):
+        """
+        Records the `inputs` (dict of hashes and parameters) and the list of
+        `outputs` paths of stage `key`.
+        """
+        self.entries[key] = {
+            'inputs': inputs,
+            'outputs': {path: hash_file(path) for path in outputs},
+        }
+        self.changes[key] = self.entries[key]
+        if save:
+            self.save()
+        return self.entries[key]
+
+    def merge(self, changes, save=True):
+        """
+        Adds the `changes` recorded by another manifest, e.g. in a worker process.
+        """
+        self.entries.update(changes)
+        self.changes.update(changes)
+        if save:
+            self.save()
+
+    def invalidate(self, key=None):
+        """
+        Forget stage `key`, or all the stages if `key` is None.
+        """
+        if key is None:
+            self.entries = {}
+            self.changes = {}
+        else:
+            self.entries.pop(key, None)
+            self.changes.pop(key, None)
+        self.save()
+
+    def invalidate_output(self, path):
+        """
+        Forget the stages that wrote the file at `path`, e.g. a broken output, so
+        they are built again.  Returns the list of their keys.
+        """
+        keys = [key for key, entry in self.entries.items() if path in entry.get('outputs', {})]
+        for key in keys:
+            self.entries.pop(key, None)
+            self.changes.pop(key, None)
+        if keys:
+            self.save()
+        return keys
@@ -0,0 +1,140 @@
+import functools
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+COUNTERS = ('calls', 'duration', 'bytes', 'pages', 'cache_hits', 'errors')
+PROMETHEUS_PREFIX = 'pointb_stage'
+PROMETHEUS_METRICS = {
+    'calls': ('calls_total', 'Number of times the stage ran.'),
+    'duration': ('duration_seconds_total', 'Total time spent in the stage.'),
+    'bytes': ('bytes_total', 'Bytes transferred or written by the stage.'),
+    'pages': ('pages_total', 'PDF pages processed by the stage.'),
+    'cache_hits': ('cache_hits_total', 'Work skipped because its result was cached.'),
+    'errors': ('errors_total', 'Number of times the stage raised an error.'),
+}
+
+
+class Metrics():
+    """
+    Lightweight per-stage counters: number of calls, duration, bytes transferred,
+    pages processed and cache hits.  Disabled by default, in which case the
+    `timed()` functions and `add()` only check the `enabled` flag.
+
+    The counters recorded in worker processes are sent back to the parent with
+    `snapshot()` and added to its counters with `merge()`.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+
+    def add(self, stage, **counters):
+        """
+        Adds the `counters` (e.g. `bytes=1024, pages=3`) to the counters of `stage`.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            values = self.stages.setdefault(stage, dict.fromkeys(COUNTERS, 0))
+            values['max_duration'] = max(values.get('max_duration', 0), counters.get('duration', 0))
+            for name, value in counters.items():
+                values[name] = values.get(name, 0) + value
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager recording the duration of the `name` stage.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        errors = 0
+        try:
+            yield
+        except BaseException:
+            errors = 1
+            raise
+        finally:
+            self.add(name, calls=1, duration=time.perf_counter() - start, errors=errors)
+
+    def timed(self, name):
+        """
+        Decorator recording the duration of each call of the function as stage `name`.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self.lock:
+            return {stage: dict(values) for stage, values in self.stages.items()}
+
+    def merge(self, snapshot):
+        if not self.enabled:
+            return
+        with self.lock:
+            for stage, counters in snapshot.items():
+                values = self.stages.setdefault(stage, dict.fromkeys(COUNTERS, 0))
+                for name, value in counters.items():
+                    if name == 'max_duration':
+                        values[name] = max(values.get(name, 0), value)
+                    else:
+                        values[name] = values.get(name, 0) + value
+
+    def report(self):
+        """
+        Returns the end-of-run report as a table, slowest stages first.
+        """
+        lines = ['%-30s %6s %10s %10s %14s %8s %6s %6s' % (
+            'STAGE', 'CALLS', 'TOTAL(s)', 'MAX(s)', 'BYTES', 'PAGES', 'CACHED', 'ERRORS')]
+        stages = sorted(self.snapshot().items(), key=lambda item: -item[1]['duration'])
+        for stage, values in stages:
+            lines.append('%-30s %6d %10.3f %10.3f %14d %8d %6d %6d' % (
+                stage, values['calls'], values['duration'], values.get('max_duration', 0),
+                values['bytes'], values['pages'], values['cache_hits'], values['errors']))
+        return '\n'.join(lines)
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({'stages': self.snapshot(), 'time': time.time()}, f, indent=2, sort_keys=True)
+
+    def write_prometheus(self, path):
+        """
+        Writes the counters in the Prometheus textfile collector format.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for counter, (suffix, help_text) in PROMETHEUS_METRICS.items():
+            metric = '%s_%s' % (PROMETHEUS_PREFIX, suffix)
+            lines.append('# HELP %s %s' % (metric, help_text))
+            lines.append('# TYPE %s counter' % metric)
+            for stage, values in sorted(snapshot.items()):
+                lines.append('%s{stage="%s"} %s' % (metric, stage, values.get(counter, 0)))
+        # Write and rename so the collector never reads a partial file.
+        with open(path + '.tmp', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(path + '.tmp', path)
+
+
+METRICS = Metrics()
+timed = METRICS.timed
@@ -0,0 +1,155 @@
+import bisect
+
+
+class PageRangeError(ValueError):
+    pass
+
+
+def iter_pageranges(page_ranges):
+    """
+    Yields the page ranges written as separate PDFs for the `page_ranges` tree,
+    in the same order and with the same file name prefixes as
+    `PDFParser.split_subchapters()`: the chapters without children, and for the
+    chapters with children their intro pages (before the first child) followed
+    by the children.
+    Yields tuples: (pagerange, prefix, chapter_index, parent_pagerange or None)
+    """
+    for index, chpagerange in enumerate(page_ranges):
+        chprefix = str(index) + '-'
+        subchpageranges = chpagerange.get('children')
+        if not subchpageranges:
+            yield chpagerange, chprefix, index, None
+            continue
+        if subchpageranges[0]['page_start'] > chpagerange['page_start']:
+            chintro_pagerange = {
+                'title': chpagerange['title'],
+                'page_start': chpagerange['page_start'],
+                'page_end': subchpageranges[0]['page_start'],
+            }
+            yield chintro_pagerange, chprefix, index, chpagerange
+        for subindex, subchpagerange in enumerate(subchpageranges):
+            yield subchpagerange, chprefix + str(subindex) + '-', index, chpagerange
+
+
+class PageRangeIndex():
+    """
+    Interval index of the page ranges of a `page_ranges` tree, see `iter_pageranges()`.
+
+    The page boundaries of all the ranges split the pages into segments, each
+    segment being covered by the same ranges, so `find()` is a binary search.
+    `check()` finds the invalid, out of bounds, overlapping ranges and the gaps
+    between them before the PDF is split.
+    """
+
+    def __init__(self, page_ranges):
+        self.page_ranges = page_ranges
+        self.leaves = []
+        for pagerange, prefix, chapter_index, parent in iter_pageranges(page_ranges):
+            self.leaves.append({
+                'title': pagerange['title'],
+                'page_start': pagerange['page_start'],
+                'page_end': pagerange['page_end'],
+                'prefix': prefix,
+                'chapter_index': chapter_index,
+                'parent': parent,
+            })
+
+        boundaries = set()
+        for leaf in self.leaves:
+            if leaf['page_start'] < leaf['page_end']:
+                boundaries.update((leaf['page_start'], leaf['page_end']))
+        self.boundaries = sorted(boundaries)
+        # The leaves covering the pages from each boundary to the next one.
+        self.segments = [[] for boundary in self.boundaries]
+        for leaf in self.leaves:
+            if leaf['page_start'] >= leaf['page_end']:
+                continue
+            first = bisect.bisect_left(self.boundaries, leaf['page_start'])
+            last = bisect.bisect_left(self.boundaries, leaf['page_end'])
+            for segment in range(first, last):
+                self.segments[segment].append(leaf)
+
+    def find(self, page_num):
+        """
+        Returns the list of page ranges containing `page_num`, empty if it's in
+        none of them.  There is more than one only if the ranges overlap.
+        """
+        segment = bisect.bisect_right(self.boundaries, page_num) - 1
+        if segment < 0:
+            return []
+        return self.segments[segment]
+
+    def get_page_span(self):
+        """
+        Returns tuple: (first page, last page + 1) of all the page ranges.
+        """
+        if not self.boundaries:
+            return 0, 0
+        return self.boundaries[0], self.boundaries[-1]
+
+    def get_intervals(self):
+        """
+        Returns the list of the (page_start, page_end) intervals of the pages in
+        at least one range, in page order, the adjacent ranges being merged.
+        """
+        intervals = []
+        for segment, leaves in enumerate(self.segments[:-1]):
+            if not leaves:
+                continue
+            page_start = self.boundaries[segment]
+            page_end = self.boundaries[segment + 1]
+            if intervals and intervals[-1][1] == page_start:
+                intervals[-1] = (intervals[-1][0], page_end)
+            else:
+                intervals.append((page_start, page_end))
+        return intervals
+
+    def check(self, num_pages=None):
+        """
+        Returns tuple: (errors, warnings), lists of messages about the page ranges.
+         - errors: empty or inverted ranges, children outside of their parent,
+           overlapping ranges and ranges ending after the `num_pages` of the PDF.
+         - warnings: the pages that are in no range.
+        """
+        errors = []
+        warnings = []
+        for chpagerange in self.page_ranges:
+            for pagerange in [chpagerange] + list(chpagerange.get('children') or []):
+                if not 0 <= pagerange['page_start'] < pagerange['page_end']:
+                    errors.append('"%s" has invalid pages %d-%d' % (
+                        pagerange['title'], pagerange['page_start'], pagerange['page_end']))
+                if num_pages is not None and pagerange['page_end'] > num_pages:
+                    errors.append('"%s" ends at page %d after the end of the PDF (%d pages)' % (
+                        pagerange['title'], pagerange['page_end'], num_pages))
+                if pagerange is not chpagerange and (
+                        pagerange['page_start'] < chpagerange['page_start'] or
+                        pagerange['page_end'] > chpagerange['page_end']):
+                    errors.append('"%s" (pages %d-%d) is outside of its parent "%s" (pages %d-%d)' % (
+                        pagerange['title'], pagerange['page_start'], pagerange['page_end'],
+                        chpagerange['title'], chpagerange['page_start'], chpagerange['page_end']))
+
+        for segment, leaves in enumerate(self.segments[:-1]):
+            page_start = self.boundaries[segment]
+            page_end = self.boundaries[segment + 1]
+            if len(leaves) > 1:
+                errors.append('Pages %d-%d are in more than one range: %s' % (
+                    page_start, page_end, ', '.join('"%s"' % leaf['title'] for leaf in leaves)))
+            elif not leaves:
+                warnings.append('Pages %d-%d are in no range' % (page_start, page_end))
+        first, last = self.get_page_span()
+        if first > 0:
+            warnings.insert(0, 'Pages 0-%d are in no range' % first)
+        if num_pages is not None and last < num_pages:
+            warnings.append('Pages %d-%d are in no range' % (last, num_pages))
+        return errors, warnings
+
+    def validate(self, num_pages=None, name=''):
+        """
+        Prints the warnings of `check()` and raises `PageRangeError` if there are errors.
+        """
+        errors, warnings = self.check(num_pages=num_pages)
+        for warning in warnings:
+            print('==> WARNING page ranges', name, warning)
+        if errors:
+            raise PageRangeError('Invalid page ranges %s: %s' % (name, '; '.join(errors)))
+        return True
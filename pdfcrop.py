@@ -0,0 +1,131 @@
+from copy import copy
+
+from PyPDF2.generic import ArrayObject, DictionaryObject
+
+from pdfreader import closing_pdfs, open_pdf
+
+
+# Width of the binders removed when cropping the two-page PDF spreads.
+# The first and last pages have a wider binder on one side only.
+CROP_PARAMS = {
+    'binder_width': 20,
+    'edge_binder_width': 40,
+}
+
+
+def get_source_page_num(page_num, num_pages):
+    """
+    Returns the number of the two-page source page of the cropped page `page_num`,
+    `num_pages` being the number of pages of the source PDF.
+    """
+    return min((page_num + 1) // 2, num_pages - 1)
+
+
+def get_num_cropped_pages(num_pages):
+    """
+    Returns the number of pages of the cropped PDF of a `num_pages` source PDF,
+    the cover and back cover having only their right half.
+    """
+    return max(2 * num_pages - 2, 1)
+
+
+def get_cropped_page_num(source_page_num):
+    """
+    Returns the number of the first cropped page of the source page `source_page_num`.
+    """
+    return max(2 * source_page_num - 1, 0)
+
+
+def copy_direct_objects(obj):
+    """
+    Returns a copy of `obj` and of its nested dictionaries and arrays, keeping
+    the references to indirect objects.  PdfFileWriter replaces the references
+    in the pages it writes, so the pages of the reader are left unchanged and
+    don't keep the previous writers alive.
+    """
+    if isinstance(obj, DictionaryObject):
+        obj_copy = copy(obj)
+        for key, value in obj.items():
+            dict.__setitem__(obj_copy, key, copy_direct_objects(value))
+        return obj_copy
+    if isinstance(obj, ArrayObject):
+        return ArrayObject([copy_direct_objects(value) for value in obj])
+    return obj
+
+
+def crop_page(page, page_num, num_pages,
+        binder_width=CROP_PARAMS['binder_width'],
+        edge_binder_width=CROP_PARAMS['edge_binder_width']):
+    """
+    Splits the left and right halves of the two-page `page` into separate pages,
+    removing the binders between those separated pages.  The first page (cover)
+    and the last page (back cover) only have their right half.
+    Returns the list of cropped pages, `page` itself is not modified.
+    """
+    # REF: https://gist.github.com/mdoege/0676e37ee2470fc755ea98177a560b4b
+    # RELATED-REF: https://github.com/mstamy2/PyPDF2/issues/100
+    # Copy before accessing the mediaBox so the halves don't share it.
+    left_page = copy_direct_objects(page)
+    right_page = copy_direct_objects(page)
+    # copy the existing page dimensions
+    (page_width, page_height,) = left_page.mediaBox.upperRight
+
+    is_first_page = (page_num == 0)
+    is_last_page = (page_num + 1 >= num_pages)
+    if is_first_page or is_last_page:
+        # The first page has the binder to its left while the last page
+        # has the binder to its right.
+        if is_first_page:
+            (page_width, page_height,) = right_page.mediaBox.upperLeft
+            right_page.mediaBox.upperLeft = (page_width + edge_binder_width, page_height,)
+        if is_last_page:
+            (page_width, page_height,) = right_page.mediaBox.upperRight
+            right_page.mediaBox.upperRight = (page_width - edge_binder_width, page_height,)
+        return [right_page]
+
+    # Divide the width by 2 for the other pages (except first and last).
+    # We also remove the binders on the left-side of the right pages
+    # and the right-side of the left pages.
+    page_width = page_width / 2
+    right_page.mediaBox.upperLeft = (page_width + binder_width, page_height,)
+    left_page.mediaBox.upperRight = (page_width - binder_width, page_height,)
+    return [left_page, right_page]
+
+
+def iter_cropped_pages(pdfin1, page_start=0, page_end=None,
+        binder_width=CROP_PARAMS['binder_width'],
+        edge_binder_width=CROP_PARAMS['edge_binder_width']):
+    """
+    Yields the cropped pages `page_start` to `page_end` (excluded) of the two-page
+    `pdfin1` reader.  Only the source pages of that range are loaded, one at a time.
+    """
+    num_pages = pdfin1.getNumPages()
+    num_cropped_pages = get_num_cropped_pages(num_pages)
+    if page_end is None or page_end > num_cropped_pages:
+        page_end = num_cropped_pages
+    if page_start >= page_end:
+        return
+    first = get_source_page_num(page_start, num_pages)
+    last = get_source_page_num(page_end - 1, num_pages)
+    cropped_page_num = get_cropped_page_num(first)
+    for source_page_num in range(first, last + 1):
+        page = pdfin1.getPage(source_page_num)
+        for cropped_page in crop_page(page, source_page_num, num_pages,
+                                      binder_width=binder_width,
+                                      edge_binder_width=edge_binder_width):
+            if page_start <= cropped_page_num < page_end:
+                yield cropped_page
+            cropped_page_num += 1
+
+
+def get_cropped_page_sizes(pdf_path, page_start, page_end, crop_params=CROP_PARAMS):
+    """
+    Returns the list of the [width, height] of the pages `page_start` to `page_end`
+    cropped with `crop_params` from the source PDF at `pdf_path`, see `verify_pdf()`.
+    """
+    sizes = []
+    with closing_pdfs():
+        pdfin1 = open_pdf(pdf_path)
+        for page in iter_cropped_pages(pdfin1, page_start, page_end, **crop_params):
+            sizes.append([round(float(page.mediaBox.getWidth()), 2), round(float(page.mediaBox.getHeight()), 2)])
+    return sizes
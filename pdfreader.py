@@ -0,0 +1,189 @@
+import bisect
+import contextlib
+import mmap
+import os
+import threading
+
+from PyPDF2 import PdfFileReader
+from PyPDF2.pdf import PageObject
+from PyPDF2.generic import NameObject
+
+
+# Page attributes inherited from the parent nodes of the page tree.
+INHERITABLE_ATTRIBUTES = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+class SharedPDFReader():
+    """
+    Lazy PDF reader shared by the PDF helpers of the chef.
+
+    - The file is memory-mapped and its xref table is parsed once, when opened.
+    - Pages are loaded on demand by walking the page tree with the `/Count` of
+      its nodes, instead of loading every page like `PdfFileReader.getPage()`.
+      The page offsets of the visited nodes are indexed so finding a page is a
+      binary search per level of the tree.
+    - Loaded pages and their geometry (mediaBox) are memoized.
+
+    `getNumPages()` and `getPage()` have the same API as `PdfFileReader` so the
+    reader can be used by the functions expecting a `PdfFileReader`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.reader = PdfFileReader(self.mmap, strict=False)
+        except Exception:
+            self.file.close()
+            raise
+        self.pages = {}
+        self.mediaboxes = {}
+        self.nodes = {}
+        self.num_pages = None
+
+    def close(self):
+        self.pages = {}
+        self.mmap.close()
+        self.file.close()
+
+    def getNumPages(self):
+        if self.num_pages is None:
+            root = self.reader.trailer['/Root'].getObject()
+            self.num_pages = int(root['/Pages'].getObject()['/Count'])
+        return self.num_pages
+
+    def getPage(self, page_num):
+        page = self.pages.get(page_num)
+        if page is None:
+            if not 0 <= page_num < self.getNumPages():
+                raise IndexError('Page %d out of range in %s' % (page_num, self.path))
+            root = self.reader.trailer['/Root'].getObject()
+            page = self._find_page(root.raw_get('/Pages'), page_num, {})
+            self.pages[page_num] = page
+        return page
+
+    def _get_node(self, node_ref, inherited):
+        """
+        Returns the index of the page tree node `node_ref`, tuple:
+        (first page number of each kid, kids, attributes inherited by the kids)
+        """
+        node = self.nodes.get(node_ref.idnum)
+        if node is None:
+            node_obj = node_ref.getObject()
+            inherited = dict(inherited)
+            for name in INHERITABLE_ATTRIBUTES:
+                if name in node_obj:
+                    inherited[name] = node_obj.raw_get(name)
+            offsets = []
+            kids = []
+            offset = 0
+            for kid_ref in node_obj['/Kids']:
+                kid = kid_ref.getObject()
+                offsets.append(offset)
+                if kid.get('/Type') == '/Pages':
+                    kids.append((kid_ref, True))
+                    offset += int(kid['/Count'])
+                else:
+                    kids.append((kid_ref, False))
+                    offset += 1
+            node = (offsets, kids, inherited)
+            self.nodes[node_ref.idnum] = node
+        return node
+
+    def _find_page(self, node_ref, page_num, inherited):
+        offsets, kids, inherited = self._get_node(node_ref, inherited)
+        index = bisect.bisect_right(offsets, page_num) - 1
+        kid_ref, is_node = kids[index]
+        if is_node:
+            return self._find_page(kid_ref, page_num - offsets[index], inherited)
+        if page_num != offsets[index]:
+            raise IndexError('Page not found in the page tree of %s' % self.path)
+        # Same as `PdfFileReader._flatten()` for a single page.
+        page = PageObject(self.reader, kid_ref)
+        page.update(kid_ref.getObject())
+        for name, value in inherited.items():
+            if name not in page:
+                page[NameObject(name)] = value
+        return page
+
+    def get_mediabox(self, page_num):
+        """
+        Returns the memoized mediaBox of page `page_num` as tuple: (x0, y0, x1, y1)
+        """
+        mediabox = self.mediaboxes.get(page_num)
+        if mediabox is None:
+            # Don't use `page.mediaBox`, it would modify the shared page.
+            box = self.getPage(page_num).raw_get('/MediaBox').getObject()
+            mediabox = tuple(value.getObject() for value in box)
+            self.mediaboxes[page_num] = mediabox
+        return mediabox
+
+    def release_cached_objects(self):
+        """
+        Drops the loaded pages and the objects cached by the PyPDF2 reader, they
+        are read again from the memory-mapped file if needed.  The xref, the page
+        tree index and the page geometry are kept.
+        """
+        self.pages = {}
+        self.reader.resolvedObjects.clear()
+
+
+def open_pdf(path):
+    """
+    Returns the `SharedPDFReader` of the PDF at `path`, reusing the reader already
+    opened for that file unless the file was modified since.  The reader stays
+    open until `close_pdf()` or the end of the `closing_pdfs()` context it was
+    opened in.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _readers_lock:
+        entry = _readers.get(path)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        if entry is not None:
+            entry[1].close()
+        reader = SharedPDFReader(path)
+        _readers[path] = (key, reader)
+        return reader
+
+
+def close_pdf(path):
+    """
+    Closes the shared reader of the PDF at `path`, if any.
+    """
+    with _readers_lock:
+        entry = _readers.pop(os.path.abspath(path), None)
+    if entry is not None:
+        entry[1].close()
+
+
+def close_all():
+    with _readers_lock:
+        entries = list(_readers.values())
+        _readers.clear()
+    for key, reader in entries:
+        reader.close()
+
+
+@contextlib.contextmanager
+def closing_pdfs():
+    """
+    Context of a stage using the shared readers: the readers opened in the
+    context are closed when it ends, with their file and memory map.  The
+    readers that were already open are kept for their own stage.
+    """
+    with _readers_lock:
+        before = set(id(reader) for key, reader in _readers.values())
+    try:
+        yield
+    finally:
+        with _readers_lock:
+            paths = [path for path, (key, reader) in _readers.items() if id(reader) not in before]
+        for path in paths:
+            close_pdf(path)
@@ -1,46 +1,388 @@
+import json
+import os
 import pprint
-import youtube_dl
+import re
+import threading
+import time
+
+from manifest import hash_data, load_json, write_json_atomic
+from metrics import METRICS, timed
+
+
+VIDEO_CACHE_PATH = os.path.join(os.getcwd(), 'chefdata', 'video_cache.json')
+VIDEO_FORMATS_PATH = os.path.join(os.getcwd(), 'chefdata', 'video_formats.json')
+# Max height of the downloaded videos, see `get_default_format()`.
+VIDEO_MAX_HEIGHT = 480
+VIMEO_ID_RE = re.compile(r'vimeo\.com/(?:video/)?(\d+)')
+# Shared by `save_videos()`, `json.dumps()` with options makes a new encoder per call.
+VIDEO_ENCODER = json.JSONEncoder(sort_keys=True, ensure_ascii=False)
+
+_youtube_dl_factory = None
+
+
+def get_vimeo_id(url):
+    """
+    Returns the Vimeo id of a video `url` like `https://player.vimeo.com/video/262755467?...`
+    or '' if it's not a Vimeo URL.
+    """
+    match = VIMEO_ID_RE.search(url or '')
+    return match.group(1) if match else ''
+
+
+def make_youtube_dl(options):
+    """
+    Returns the `youtube_dl.YoutubeDL` with `options` used to list the formats of
+    a video and download it, or the object made by the factory set with
+    `set_youtube_dl()`.
+    """
+    if _youtube_dl_factory is not None:
+        return _youtube_dl_factory(options)
+    # NOTE: youtube_dl is imported here rather than at the top of the module,
+    # importing it loads all its extractors which is slow and not needed by the
+    # PDF-only runs.
+    import youtube_dl
+    return youtube_dl.YoutubeDL(options)
+
+
+def set_youtube_dl(factory):
+    """
+    Replaces `youtube_dl.YoutubeDL` by `factory(options)` for all the videos, e.g.
+    to record or replay their downloads (see `cassette.py`), None to restore it.
+    """
+    global _youtube_dl_factory
+    _youtube_dl_factory = factory
+    return factory
+
+
+def get_video_fingerprint(url, title, description):
+    """
+    Returns the fingerprint of a video as scraped from the video page, it changes
+    when its URL, title or description is edited on the page.
+    """
+    return hash_data([url, title, description])
+
+
+class VideoCache():
+    """
+    On-disk cache of the video metadata resolved by youtube_dl, keyed by Vimeo id
+    (or video URL for the other sites):
+    id, title, chosen format, file path, thumbnail and file size.
+    An entry is only used if it is younger than `ttl` seconds (no limit if None)
+    and its video file is still on disk with the same size.
+    """
+
+    def __init__(self, path=VIDEO_CACHE_PATH, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = load_json(self.path, 'video cache')
+
+    def save(self):
+        with self.lock:
+            write_json_atomic(self.path, self.entries)
+
+    def is_valid(self, entry):
+        if self.ttl is not None and time.time() - entry.get('timestamp', 0) > self.ttl:
+            return False
+        filepath = entry.get('filepath', '')
+        if not filepath or not os.path.exists(filepath):
+            return False
+        if os.path.getsize(filepath) != entry.get('filesize'):
+            return False
+        thumbnail = entry.get('thumbnail', '')
+        return not thumbnail or os.path.exists(thumbnail)
+
+    def get(self, url, validate=True):
+        """
+        Returns the valid cache entry of `url` or None.  With `validate=False` the
+        entry is returned even if it's no longer valid.
+        """
+        with self.lock:
+            entry = self.entries.get(url)
+        if entry and (not validate or self.is_valid(entry)):
+            return entry
+        return None
+
+    def set(self, url, entry):
+        entry = dict(entry, timestamp=time.time())
+        with self.lock:
+            self.entries[url] = entry
+        self.save()
+        return entry
+
+    def invalidate(self, url=None):
+        """
+        Forget the entry of `url`, or all the entries if `url` is None.
+        """
+        with self.lock:
+            if url is None:
+                self.entries = {}
+            else:
+                self.entries.pop(url, None)
+        self.save()
+
+
+def get_default_format(max_height=VIDEO_MAX_HEIGHT):
+    """
+    Returns the youtube_dl format used when no format was planned: mp4 and not
+    taller than `max_height`.
+    """
+    return ('bestvideo[height<=%d][ext=mp4]+bestaudio[ext=m4a]/best[height<=%d][ext=mp4]'
+            % (max_height, max_height))
+
+
+def estimate_format_size(fmt, duration=None):
+    """
+    Returns the size in bytes of the youtube_dl format `fmt`, estimated from its
+    bitrate (kbit/s) and the `duration` of the video if the size is not known.
+    None if it can't be estimated.
+    """
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    bitrate = fmt.get('tbr') or (fmt.get('vbr') or 0) + (fmt.get('abr') or 0)
+    if bitrate and duration:
+        return int(bitrate * duration * 125)
+    return None
+
+
+def get_format_candidates(info, max_height=VIDEO_MAX_HEIGHT):
+    """
+    Returns the mp4 formats of the video `info` (as extracted by youtube_dl) not
+    taller than `max_height`, best first, a list of dicts:
+    {'format_id': ..., 'height': ..., 'size': estimated bytes or None, 'merge': ...}
+     - the progressive formats, one file with the video and the audio,
+     - the video-only formats merged with the best m4a audio-only format, which
+       needs a second download and an ffmpeg merge.
+    The progressive formats come first, so the merge is skipped whenever one of
+    them is available, then the merged ones; each taller first, then smaller first.
+    """
+    from youtube_dl.utils import determine_protocol
+
+    duration = info.get('duration')
+    candidates = []
+    videos = []
+    audios = []
+    for fmt in info.get('formats') or []:
+        if not fmt.get('url') or determine_protocol(fmt) not in ('http', 'https'):
+            continue
+        has_video = fmt.get('vcodec') != 'none'
+        has_audio = fmt.get('acodec') != 'none'
+        height = fmt.get('height')
+        if has_video and (not height or height > max_height or fmt.get('ext') != 'mp4'):
+            continue
+        if has_video and has_audio:
+            candidates.append({
+                'format_id': fmt['format_id'],
+                'height': height,
+                'size': estimate_format_size(fmt, duration),
+                'merge': False,
+            })
+        elif has_video:
+            videos.append(fmt)
+        elif has_audio and fmt.get('ext') == 'm4a':
+            audios.append(fmt)
+    if audios:
+        audio = max(audios, key=lambda fmt: fmt.get('abr') or fmt.get('tbr') or 0)
+        audio_size = estimate_format_size(audio, duration)
+        for fmt in videos:
+            video_size = estimate_format_size(fmt, duration)
+            candidates.append({
+                'format_id': '%s+%s' % (fmt['format_id'], audio['format_id']),
+                'height': fmt['height'],
+                'size': video_size + audio_size if video_size and audio_size else None,
+                'merge': True,
+            })
+    candidates.sort(key=lambda plan: (plan['merge'], -plan['height'], plan['size'] or 0))
+    return candidates
+
+
+class VideoFormatPlanner():
+    """
+    Chooses the format of each video before downloading it, from the formats
+    listed by `youtube_dl.extract_info(download=False)`, see `get_format_candidates()`.
+
+    The best candidate is chosen unless it doesn't fit in what remains of the
+    byte `budget` of the channel (no limit if None), then the best one that fits,
+    so a merged format is only chosen if no progressive one fits, or the smallest
+    one.  With a budget, a candidate of unknown size doesn't fit: the lowest
+    candidate is chosen if no size is known.  The chosen plans are saved in
+    `chefdata/` by media id and reused by the next runs (with the same
+    `max_height`) without listing the formats again.  The videos found in the
+    cache count towards the budget too.
+    """
+
+    def __init__(self, path=VIDEO_FORMATS_PATH, max_height=VIDEO_MAX_HEIGHT, budget=None):
+        self.path = path
+        self.max_height = int(max_height)
+        self.budget = int(budget) if budget else None
+        self.used = 0
+        self.lock = threading.Lock()
+        self.plans = load_json(self.path, 'video formats')
+
+    def save(self):
+        with self.lock:
+            write_json_atomic(self.path, self.plans)
+
+    def get_remaining(self):
+        if self.budget is None:
+            return None
+        return self.budget - self.used
+
+    def get(self, media_id):
+        """
+        Returns the recorded plan of `media_id` if it was made with the same
+        `max_height`, or None.
+        """
+        with self.lock:
+            plan = self.plans.get(media_id)
+        if plan and plan.get('max_height') == self.max_height:
+            return plan
+        return None
+
+    def reserve(self, plan):
+        """
+        Counts the size of the recorded `plan` in the budget, unless it doesn't
+        fit.  Returns True if it was reserved.
+        """
+        size = plan.get('size') or 0
+        with self.lock:
+            if self.budget is not None and self.used + size > self.budget:
+                return False
+            self.used += size
+        return True
+
+    def add_used(self, size):
+        with self.lock:
+            self.used += size or 0
+
+    def plan(self, media_id, info):
+        """
+        Chooses, reserves and records the format of `media_id` from its `info`.
+        Returns the plan, None if none of the formats can be planned.
+        """
+        candidates = get_format_candidates(info, max_height=self.max_height)
+        if not candidates:
+            return None
+        with self.lock:
+            plan = candidates[0]
+            remaining = None if self.budget is None else self.budget - self.used
+            if remaining is not None and (plan['size'] is None or plan['size'] > remaining):
+                # A format of unknown size can't be known to fit in the budget.
+                known = [candidate for candidate in candidates if candidate['size'] is not None]
+                fitting = [candidate for candidate in known if candidate['size'] <= remaining]
+                if fitting:
+                    plan = fitting[0]
+                elif known:
+                    plan = min(known, key=lambda candidate: candidate['size'])
+                    print('==> Video budget exceeded, using the smallest format of', media_id)
+                else:
+                    plan = min(candidates, key=lambda candidate: (candidate['merge'], candidate['height']))
+                if candidates[0]['size'] is None:
+                    print('==> Size of the format %s of %s unknown, using the format %s' % (
+                        candidates[0]['format_id'], media_id, plan['format_id']))
+            plan = dict(plan, max_height=self.max_height)
+            self.used += plan['size'] or 0
+            self.plans[media_id] = plan
+        self.save()
+        return plan
+
+    def get_format(self, plan):
+        """
+        Returns the youtube_dl format of `plan`, which falls back on the default
+        format if the planned format is no longer available.
+        """
+        return '%s/%s' % (plan['format_id'], get_default_format(self.max_height))
 
 
 class PointBVideo():
+    """
+    Video found on the video page of a language.
 
-    uid = 0   # value from `id` after `youtube_dl.extract_info()`
-    title = ''
-    description = ''
-    url = ''
-    lang_code = ''
-    thumbnail = ''  # local path to thumbnail image
-    filepath = ''  # local path to video file
-    filename_prefix = ''
-    download_dir = './'
+    The scraped attributes `url`, `lang_code` and `filename_prefix` are read-only,
+    the other attributes are set when the video is downloaded or loaded from the
+    cache.  The attributes are slots so the records of a large catalog are small
+    and cheap to pickle for the worker processes, see `save_videos()` and
+    `load_videos()` to save and load a whole catalog.
+    """
+
+    # The fields of the serialized videos, see `to_dict()`.
+    FIELDS = ('uid', 'url', 'title', 'description', 'lang_code', 'thumbnail', 'filepath',
+              'source_title', 'filename_prefix', 'fingerprint')
+
+    __slots__ = (
+        'uid',  # value from `id` after `youtube_dl.extract_info()`
+        '_url',
+        'title',
+        'description',
+        '_lang_code',
+        'thumbnail',  # local path to thumbnail image
+        'filepath',  # local path to video file
+        'source_title',  # untranslated title from the video metadata
+        '_filename_prefix',
+        'fingerprint',  # of the scraped url, title and description, see `diff_videos()`
+    )
 
     def __init__(self, uid=0, url='', title='', description='', lang_code='', 
-            filename_prefix=''):
+            filename_prefix='', thumbnail='', filepath='', source_title='', fingerprint=''):
         self.uid = str(uid)
-        self.url = url
+        self._url = url
         self.title = title
         self.description = description
-        self.thumbnail = ''
-        self.filepath = ''
-        self.lang_code = lang_code
-        self.filename_prefix = filename_prefix
+        self.thumbnail = thumbnail
+        self.filepath = filepath
+        self.source_title = source_title
+        self._lang_code = lang_code
+        self._filename_prefix = filename_prefix
+        self.fingerprint = fingerprint
+
+    @property
+    def url(self):
+        return self._url
+
+    @property
+    def lang_code(self):
+        return self._lang_code
+
+    @property
+    def filename_prefix(self):
+        return self._filename_prefix
 
     def __str__(self):
         return 'PointBVideo (%s - %s - %s - %s)' % (self.uid, self.url, self.title, self.description,)
 
+    def __eq__(self, other):
+        if not isinstance(other, PointBVideo):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    # Mutable, so not hashable.
+    __hash__ = None
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Returns the video of the dict `data` made by `to_dict()`, the unknown
+        fields are ignored so older catalogs can still be loaded.
+        """
+        return cls(**{field: data[field] for field in cls.FIELDS if field in data})
+
     def get_filename(self, download_dir='./'):
+        """
+        Returns the youtube_dl output template of the video in `download_dir`.
+        """
         # TODO(cpauya): How to get the mp4 filename from local path?
-        filename = download_dir + self.filename_prefix + '%(id)s.%(ext)s'
-        # MUST: make sure to save the `download_dir` for reuse later.
-        self.download_dir = download_dir
-        return filename
+        return download_dir + self.filename_prefix + '%(id)s.%(ext)s'
 
     def set_filepath_and_thumbnail(self, video_info, download_dir='./'):
         # MUST: assign the filename to the `filepath` attribute based on
         # the video_info dict argument.
         # Also traverses the `video_info['thumbnails']` list to get the image filename
         # to be used for the `thumbnail` attribute.
-        filename = self.get_filename(download_dir=self.download_dir)
+        filename = self.get_filename(download_dir=download_dir)
         self.filepath = filename % video_info
 
         for thumbnail in video_info.get('thumbnails', None):
@@ -51,7 +393,109 @@ class PointBVideo():
 
         return self.filepath
 
-    def download(self, download_dir="./", video_data=None):
+    def get_media_id(self):
+        """
+        Returns the id of the video file shared by the languages: the Vimeo id,
+        or the URL for the other sites.
+        """
+        return get_vimeo_id(self.url) or self.url
+
+    def set_title(self, title, video_data=None):
+        self.source_title = title
+        # MUST: If translated (e.g. Burmese), get the translated title from the
+        # list of translated videos of the language.
+        translated = ''
+        if video_data is not None and self.lang_code in video_data:
+            translated = video_data[self.lang_code].get('video_titles', {}).get(self.uid, '')
+        if translated:
+            self.title = translated
+            print('====> VIDEO TITLE', self.title)
+        else:
+            self.title = title
+
+    def load_from_cache(self, cache, video_data=None):
+        """
+        Sets the attributes of the video from its `cache` entry without hitting the
+        network.  Returns False if the video is not in the cache.
+        """
+        entry = cache.get(self.get_media_id())
+        if not entry:
+            return False
+        self.uid = entry['id']
+        self.set_title(entry['title'], video_data=video_data)
+        self.filepath = entry['filepath']
+        self.thumbnail = entry['thumbnail']
+        print('====> Using cached video', self.filepath)
+        return True
+
+    def save_to_cache(self, cache, vinfo):
+        return cache.set(self.get_media_id(), {
+            'id': self.uid,
+            'title': vinfo.get('title', ''),
+            'format_id': vinfo.get('format_id', ''),
+            'ext': vinfo.get('ext', ''),
+            'filepath': self.filepath,
+            'thumbnail': self.thumbnail,
+            'filesize': os.path.getsize(self.filepath),
+            'duration': vinfo.get('duration'),
+        })
+
+    def share_media(self, video, video_data=None):
+        """
+        Uses the file and thumbnail already downloaded for `video`, which has the
+        same media id in another language.  Only the title is set for this language.
+        """
+        self.uid = video.uid
+        self.filepath = video.filepath
+        self.thumbnail = video.thumbnail
+        self.set_title(video.source_title, video_data=video_data)
+        return self
+
+    def plan_format(self, planner, scheduler=None):
+        """
+        Returns tuple: (plan or None, info extracted by youtube_dl or None)
+        The recorded plan of the video is used if it fits in the budget of the
+        `planner` (a `VideoFormatPlanner`), otherwise the formats of the video
+        are listed without downloading it and a new plan is made.
+        """
+        media_id = self.get_media_id()
+        plan = planner.get(media_id)
+        if plan is not None and planner.reserve(plan):
+            return plan, None
+        with make_youtube_dl({'quiet': True, 'no_warnings': True}) as ydl:
+            # `process=False` skips the format selection, done by the download.
+            if scheduler is not None:
+                info = scheduler.call(self.url, ydl.extract_info, self.url, download=False, process=False)
+            else:
+                info = ydl.extract_info(self.url, download=False, process=False)
+        plan = planner.plan(media_id, info)
+        if plan is not None:
+            print('====> Planned format %s (%sp, %s bytes%s) for %s' % (
+                plan['format_id'], plan['height'], plan['size'] or '?',
+                ', merged' if plan['merge'] else '', self.url))
+        return plan, info
+
+    @timed('video_download')
+    def download(self, download_dir="./", video_data=None, cache=None, scheduler=None, planner=None):
+        """
+        Downloads the video and its thumbnail with youtube_dl, unless a valid entry
+        for the video is found in the `cache` (a `VideoCache`).  The download runs
+        through the `scheduler` (a `RequestScheduler`) if given, which limits the
+        requests to the host of the video and retries the transient errors.
+        The format is chosen by the `planner` (a `VideoFormatPlanner`) if given.
+        """
+        if cache is not None and self.load_from_cache(cache, video_data=video_data):
+            METRICS.add('video_download', cache_hits=1)
+            if planner is not None:
+                planner.add_used(cache.get(self.get_media_id()).get('filesize'))
+            return True
+
+        import youtube_dl
+
+        plan = info = None
+        if planner is not None:
+            plan, info = self.plan_format(planner, scheduler=scheduler)
+
         print('====> download()', self.get_filename(download_dir))
         ydl_options = {
             'outtmpl': self.get_filename(download_dir),
@@ -61,29 +505,35 @@ class PointBVideo():
             'restrictfilenames': True,
             'quiet': False,
             # Note the format specification is important so we get mp4 and not taller than 480
-            'format': "bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/best[height<=480][ext=mp4]"
+            'format': planner.get_format(plan) if plan else get_default_format(
+                planner.max_height if planner is not None else VIDEO_MAX_HEIGHT),
         }
-        with youtube_dl.YoutubeDL(ydl_options) as ydl:
+        with make_youtube_dl(ydl_options) as ydl:
             pp = pprint.PrettyPrinter()
             try:
                 ydl.add_default_info_extractors()
-                vinfo = ydl.extract_info(self.url, download=True)
+                if info is not None:
+                    # Download from the info already extracted by the planning.
+                    extract, args = ydl.process_ie_result, (info,)
+                else:
+                    extract, args = ydl.extract_info, (self.url,)
+                if scheduler is not None:
+                    vinfo = scheduler.call(self.url, extract, *args, download=True)
+                else:
+                    vinfo = extract(*args, download=True)
                 # Save the remaining "temporary scraped values" of attributes with actual values
                 # from the video metadata.
                 self.uid = vinfo.get('id', '')
-
-                if self.lang_code == 'my' and video_data is not None:
-                    # MUST: If Burmese, get the translated title from the
-                    # list of translated videos.
-                    self.title = video_data[self.lang_code]['video_titles'][self.uid]
-                    print('====> VIDEO TITLE', self.title)
-                else:
-                    self.title = vinfo.get('title', '')                
+                self.set_title(vinfo.get('title', ''), video_data=video_data)
 
                 # TODO(cpauya): If Burmese, use the translated video description.
 
                 # Set the filepath and thumbnail attributes of the video object.
                 self.set_filepath_and_thumbnail(vinfo, download_dir=download_dir)
+                if os.path.exists(self.filepath):
+                    METRICS.add('video_download', bytes=os.path.getsize(self.filepath))
+                    if cache is not None:
+                        self.save_to_cache(cache, vinfo)
                 # pp.pprint(self)
 
                 # # These are useful when debugging.
@@ -99,3 +549,67 @@ class PointBVideo():
                 # pp.pprint(e)
                 raise e
         return True
+
+
+def save_videos(videos, path):
+    """
+    Saves the `videos` to `path` in JSON lines, one video per line in the order
+    of `videos`, so two catalogs can be compared with a line diff.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        for video in videos:
+            f.write(VIDEO_ENCODER.encode(video.to_dict()))
+            f.write('\n')
+    os.replace(path + '.tmp', path)
+
+
+def load_videos(path):
+    """
+    Returns the list of the videos saved to `path` by `save_videos()`, empty if
+    there is no file.  Invalid lines are skipped.
+    """
+    videos = []
+    if not os.path.exists(path):
+        return videos
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                videos.append(PointBVideo.from_dict(json.loads(line)))
+            except (ValueError, TypeError) as e:
+                print('==> Ignoring invalid video at line', line_num, 'of', path, e)
+    return videos
+
+
+def diff_videos(old_videos, new_videos):
+    """
+    Compares the videos of the last scraping of a page, `old_videos`, with the
+    `new_videos` scraped now, matching them by media id and comparing their
+    fingerprints.  The unchanged videos are reused from `old_videos`.
+    Returns tuple: (videos, changes)
+     - videos: the list of videos in the order of `new_videos`
+     - changes: dict of 'added', 'removed', 'changed', 'unchanged' --> list of videos
+    """
+    old_by_media = {}
+    for video in old_videos:
+        old_by_media.setdefault(video.get_media_id(), []).append(video)
+    videos = []
+    changes = {'added': [], 'removed': [], 'changed': [], 'unchanged': []}
+    for video in new_videos:
+        matches = old_by_media.get(video.get_media_id())
+        if not matches:
+            changes['added'].append(video)
+            videos.append(video)
+            continue
+        old_video = matches.pop(0)
+        if old_video.fingerprint and old_video.fingerprint == video.fingerprint:
+            changes['unchanged'].append(old_video)
+            videos.append(old_video)
+        else:
+            changes['changed'].append(video)
+            videos.append(video)
+    for matches in old_by_media.values():
+        changes['removed'].extend(matches)
+    return videos, changes
@@ -0,0 +1,237 @@
+import email.utils
+import http.client
+import random
+import socket
+import sys
+import threading
+import time
+import urllib.error
+
+from urllib.parse import urlparse
+
+import requests
+
+from metrics import METRICS
+
+
+# HTTP statuses worth retrying: rate limited or a transient server error.
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+RETRY_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    ConnectionError,
+    TimeoutError,
+    socket.timeout,
+    http.client.IncompleteRead,
+)
+
+# Defaults of the scheduler, override on the command line with `http_retries=N`,
+# `http_per_host=N` (max requests to a host at the same time) and `http_rate=N`
+# (max requests started per second to a host, no limit if 0).
+MAX_RETRIES = 4
+BACKOFF = 1.0  # seconds, doubled after each failed attempt
+MAX_BACKOFF = 60.0
+MAX_PER_HOST = 4
+RATE_PER_HOST = 2.0
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def iter_causes(exc):
+    """
+    Yields `exc` and the exceptions that caused it, including the exceptions
+    wrapped by the youtube_dl errors (`exc_info` and `cause`).
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc_info = getattr(exc, 'exc_info', None)
+        if isinstance(exc_info, tuple) and len(exc_info) > 1 and isinstance(exc_info[1], BaseException):
+            exc = exc_info[1]
+        elif isinstance(getattr(exc, 'cause', None), BaseException):
+            exc = exc.cause
+        else:
+            exc = exc.__cause__ or exc.__context__
+
+
+def get_status(exc):
+    """
+    Returns the HTTP status of the HTTP error `exc`, None for the other errors.
+    """
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code
+    if isinstance(exc, urllib.error.HTTPError):
+        return exc.code
+    return None
+
+
+def is_retryable(exc):
+    """
+    Returns True if `exc` (or an exception that caused it) is a transient network
+    error or an HTTP error with one of the `RETRY_STATUSES`.
+    """
+    for cause in iter_causes(exc):
+        status = get_status(cause)
+        if status is not None:
+            return status in RETRY_STATUSES
+        if isinstance(cause, RETRY_EXCEPTIONS):
+            return True
+        # Not imported by the runs that don't download videos.
+        youtube_dl_utils = sys.modules.get('youtube_dl.utils')
+        if youtube_dl_utils is not None and isinstance(cause, youtube_dl_utils.ContentTooShortError):
+            return True
+        if isinstance(cause, urllib.error.URLError):
+            # Not an HTTP error: connection refused, DNS failure, timeout...
+            return True
+    return False
+
+
+def get_retry_after(exc):
+    """
+    Returns the seconds to wait from the Retry-After header of the HTTP error
+    `exc` (or of its cause), None if there is none.
+    """
+    for cause in iter_causes(exc):
+        if isinstance(cause, requests.HTTPError) and cause.response is not None:
+            value = cause.response.headers.get('Retry-After')
+        elif isinstance(cause, urllib.error.HTTPError) and cause.headers is not None:
+            value = cause.headers.get('Retry-After')
+        else:
+            continue
+        if not value:
+            return None
+        if value.strip().isdigit():
+            return float(value)
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+class HostLimiter():
+    """
+    Limits the requests to one host to `max_concurrency` at the same time and
+    to `rate` started per second (no limit if 0 or None).
+    """
+
+    def __init__(self, max_concurrency, rate, clock=time.monotonic, sleep=time.sleep):
+        self.semaphore = threading.BoundedSemaphore(max(1, int(max_concurrency)))
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_start = 0.0
+        self.lock = threading.Lock()
+        self.clock = clock
+        self.sleep = sleep
+
+    def acquire(self):
+        self.semaphore.acquire()
+        if self.interval:
+            with self.lock:
+                now = self.clock()
+                start = max(now, self.next_start)
+                self.next_start = start + self.interval
+            if start > now:
+                self.sleep(start - now)
+
+    def release(self):
+        self.semaphore.release()
+
+
+class RequestScheduler():
+    """
+    Runs the outbound requests of the chef (PDF downloads, page scraping and
+    video downloads) with per-host limits and retries.
+
+    - Each host gets a `HostLimiter`: at most `max_per_host` requests at the same
+      time and `rate` requests started per second.
+    - A request failing with a retryable error (see `is_retryable()`) is retried
+      up to `retries` times, after an exponential backoff with jitter, or after
+      the delay of the Retry-After header of the response.  The host slot is
+      released while waiting.
+    - The other errors are raised at once.
+
+    `sleep` and `random` can be replaced for testing.
+    """
+
+    def __init__(self, retries=MAX_RETRIES, backoff=BACKOFF, max_backoff=MAX_BACKOFF,
+            max_per_host=MAX_PER_HOST, rate=RATE_PER_HOST, sleep=time.sleep, random=random.random):
+        self.retries = max(0, int(retries))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_per_host = max_per_host
+        self.rate = float(rate) if rate else 0.0
+        self.sleep = sleep
+        self.random = random
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def get_limiter(self, url):
+        host = urlparse(url).netloc.lower()
+        with self.lock:
+            limiter = self.hosts.get(host)
+            if limiter is None:
+                limiter = HostLimiter(self.max_per_host, self.rate, sleep=self.sleep)
+                self.hosts[host] = limiter
+            return limiter
+
+    def get_delay(self, attempt, exc=None):
+        """
+        Returns the seconds to wait before retrying after the failed `attempt`
+        (0 for the first one): the Retry-After of `exc` if any, or an exponential
+        backoff with "equal jitter", between half and all of the backoff.
+        """
+        retry_after = get_retry_after(exc) if exc is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay / 2 + self.random() * delay / 2
+
+    def call(self, url, func, *args, **kwargs):
+        """
+        Calls `func(*args, **kwargs)`, which requests `url`, within the limits of
+        the host of `url` and retries it on the retryable errors.
+        Returns the result of `func`.
+        """
+        limiter = self.get_limiter(url)
+        attempt = 0
+        while True:
+            limiter.acquire()
+            try:
+                return func(*args, **kwargs)
+            except Exception as exc:
+                if attempt >= self.retries or not is_retryable(exc):
+                    METRICS.add('http_requests', errors=1)
+                    raise
+                delay = self.get_delay(attempt, exc)
+                METRICS.add('http_retries', calls=1, duration=delay)
+                print('==> Retrying %s in %.1fs (%d/%d) after error: %s' % (
+                    url, delay, attempt + 1, self.retries, exc))
+            finally:
+                limiter.release()
+                METRICS.add('http_requests', calls=1)
+            self.sleep(delay)
+            attempt += 1
+
+
+def get_scheduler():
+    """
+    Returns the `RequestScheduler` shared by all the requests of the process.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
+
+
+def set_scheduler(scheduler):
+    """
+    Replaces the shared scheduler, e.g. with other limits or for testing.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
+    return scheduler
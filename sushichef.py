@@ -1,22 +1,38 @@
 #!/usr/bin/env python
 
+import asyncio
+import gc
 import html
 import os
 import pprint
 import requests
+import threading
 
-from bs4 import BeautifulSoup
-from copy import copy
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from le_utils.constants import roles
-from PyPDF2 import PdfFileReader, PdfFileWriter
+from PyPDF2 import PdfFileWriter
 
 from ricecooker.chefs import SushiChef
 from ricecooker.classes.files import DocumentFile, VideoFile
 from ricecooker.classes.licenses import get_license
 from ricecooker.classes.nodes import ChannelNode, DocumentNode, TopicNode, VideoNode
-from ricecooker.utils.pdf import PDFParser
 
-from pointb import PointBVideo
+from cassette import use_cassette
+from fetch import download_file, fetch_page, get_validators, read_meta
+from journal import RunJournal, get_run_key
+from manifest import BuildManifest, hash_data, hash_file, load_json, write_json_atomic
+from metrics import METRICS, timed
+from pageranges import PageRangeIndex
+from pdfcrop import CROP_PARAMS, copy_direct_objects, get_num_cropped_pages, iter_cropped_pages
+from pdfreader import close_pdf, closing_pdfs, open_pdf
+from pointb import (PointBVideo, VideoCache, VideoFormatPlanner, diff_videos, get_video_fingerprint, get_vimeo_id,
+                    load_videos, save_videos)
+from scheduler import (MAX_PER_HOST, MAX_RETRIES, RATE_PER_HOST, RequestScheduler, get_scheduler,
+                       set_scheduler)
+from thumbnails import make_thumbnails
+from verify import VerificationCache, verify_artifacts
 
 LE = 'Learning Equality'
 LANG_CODE_EN = 'en'
@@ -46,6 +62,82 @@ PDF_PATH_EN_CROPPED = os.path.join(os.getcwd(), DOWNLOADS_PATH, CSGUIDE_PDF_EN_C
 PDF_PATH_MY = os.path.join(os.getcwd(), DOWNLOADS_PATH, CSGUIDE_PDF_MY)
 PDF_PATH_MY_CROPPED = os.path.join(os.getcwd(), DOWNLOADS_PATH, CSGUIDE_PDF_MY_CROPPED)
 
+# The PDFs are cropped and split into chapters in a single pass, writing the
+# full cropped PDF is optional.  Override on the command line with `write_cropped=1`.
+WRITE_CROPPED_PDF = False
+
+# Release the objects cached by the PDF reader after each batch of pages to bound
+# the memory used by very large PDFs.  Override with `stream_pdf=1`.
+STREAM_PDF = False
+STREAM_BATCH_PAGES = 64
+
+# Max number of worker processes cropping and splitting the PDFs, one language
+# per process.  Defaults to one per language (up to the number of CPUs).
+# Override on the command line with `pdf_workers=N`.
+PDF_PROCESS_WORKERS = None
+
+# Cache of the video metadata so the videos already downloaded are not resolved
+# again with youtube_dl.  Override on the command line with `video_cache_ttl=SECONDS`
+# (no limit by default) and use `refresh_videos=1` to clear the cache.
+VIDEO_CACHE = None
+VIDEO_CACHE_TTL = None
+
+# The format of each video is planned before downloading it: the tallest mp4 not
+# taller than `video_max_height=N` (default 480), preferring one file with both the
+# video and the audio over merging two downloads, within the `video_budget=BYTES`
+# of the whole channel (no limit by default).  The plans are recorded and reused.
+VIDEO_FORMATS = None
+VIDEO_BUDGET = None
+
+# Max number of videos downloaded at the same time, shared by all languages.
+# Override on the command line with `video_workers=N`.
+VIDEO_DOWNLOAD_WORKERS = 4
+
+# A failed video download fails the run, the channel is not uploaded without the
+# video.  Use `partial_videos=1` on the command line to upload the channel with the
+# videos that were downloaded.
+PARTIAL_VIDEOS = False
+
+# What a run builds: '' for the whole channel, 'pdfs' (no video is scraped nor
+# downloaded, youtube_dl is not even imported) or 'videos' (no PDF is processed).
+# Override on the command line with `only=pdfs` or `only=videos`.
+RUN_MODES = ('', 'pdfs', 'videos')
+
+# Make the thumbnails of the chapter PDFs and normalize the thumbnails of the videos
+# in a pool of processes (one per CPU by default).  Override on the command line
+# with `thumbnails=0` and `thumbnail_workers=N`.
+MAKE_THUMBNAILS = True
+THUMBNAIL_WORKERS = None
+
+# Verify the chapter PDFs, the videos and the thumbnails before uploading them, in
+# a pool of processes (one per CPU by default).  The artifacts are only verified
+# again when their content changes.  Override on the command line with `verify=0`
+# and `verify_workers=N`.
+VERIFY_ARTIFACTS = True
+VERIFY_WORKERS = None
+
+# Record each finished unit of work of the run (PDF downloaded, cropped, chapter
+# split, page scraped, video downloaded) in a journal, so a failed run is resumed
+# by the next one at its first unfinished unit.  The journal is removed once the
+# channel is built without any failed unit.  Override on the command line with
+# `journal=0`.
+RUN_JOURNAL = True
+# The command line options changing the results of the units, the journal of a
+# run with other values is not resumed.
+RUN_JOURNAL_OPTIONS = ('video_max_height', 'video_budget')
+
+# Parser of the video pages.  With 'lxml' (or 'html.parser' if lxml is not
+# installed) only the `content-inner` blocks are parsed, 'html5lib' parses the
+# whole page like browsers do but is much slower.
+SCRAPE_HTML_PARSER = 'lxml' if builder_registry.lookup('lxml') else 'html.parser'
+
+# The videos found by the last scraping of each language, used by `plan=1`, and
+# the validators and hash of each scraped page.  An unchanged page is not parsed
+# again and only the added and changed videos are new to the run.
+SCRAPED_VIDEOS_PATH = os.path.join(os.getcwd(), 'chefdata', 'scraped_videos.jsonl')
+SCRAPED_PAGES_PATH = os.path.join(os.getcwd(), 'chefdata', 'scraped_pages.json')
+SCRAPED_VIDEOS_LOCK = threading.Lock()
+
 
 DATA = {
     LANG_CODE_EN: {
@@ -102,7 +194,7 @@ DATA = {
             'page_ranges': [
                 {'title': 'နိဒါန်းအဖွင့်', 'page_start': 0, 'page_end': 13},  # Introduction
                 {'title': '1 - သင်စ် ၂၁ ရာစု စာသင်ခန်းအတွက် မျှော်မှန်းချက်တစ်ခုထားရှိခြင်း', 'page_start': 13, 'page_end': 23},  # Section 1
-                {'title': '2 - ၂၁ ရာစု စိတ်နေသဘောထားများနှင့် အလေ့အကျင့်များ', 'page_start': 23, 'page_end': 61,  # Section 2
+                {'title': '2 - ၂၁ ရာစု စိတ်နေသဘောထားများနှင့် အလေ့အကျင့်များ', 'page_start': 23, 'page_end': 63,  # Section 2
                 'children': [
                     {'title': '#1: စိတ်တည်ငြိမ်မူ သတိအားကောင်းခြင်း', 'page_start': 25, 'page_end': 33},  # Mindfulness
                     {'title': '#2: သိလိုစိတ်ပြင်းပြခြင်း', 'page_start': 33, 'page_end': 39},  # Curiousity
@@ -137,124 +229,479 @@ DATA = {
 }
 
 
-def download_pdfs():
+def update_data(data):
+    """
+    Adds the `data` entries (same schema as `DATA`, keyed by a unique key which
+    is the language code for the entries of this guide) to `DATA`, e.g. for the
+    guides of `batch.py`.  Also the initializer of the worker processes.
+    """
+    DATA.update(data)
+
+
+@timed('download_pdf')
+def download_pdf(lang_code, journal=None):
+    """
+    Downloads the PDF of `lang_code`.  Existing files are revalidated with the
+    server and only downloaded again if they changed, an interrupted download
+    is resumed.  Nothing is done if the PDF was downloaded by the run of the
+    `journal` (a `RunJournal`).
+    """
+    pdf = DATA[lang_code]['pdf_info']
+    pdf_url = pdf['pdf_url']
+    pdf_path = pdf['pdf_path']
+    unit = 'download_pdf:%s' % lang_code
+    if journal is not None and journal.get(unit):
+        print('==> PDF already downloaded by the journaled run:', pdf_path)
+        return pdf_path
+    print('==> Downloading PDF', pdf_url, 'TO', pdf_path)
     try:
-        for i, lang_code in enumerate(DATA):
-            pdf = DATA[lang_code]['pdf_info']
-            pdf_url = pdf['pdf_url']
-            pdf_path = pdf['pdf_path']
-            # Do not download if file already exists.
-            if os.path.exists(pdf_path):
-                print('==> PDF already exists, NOT downloading:', pdf_path)
-            else:
-                print('==> Downloading PDF', pdf_url, 'TO', pdf_path)
-                response = requests.get(pdf_url)
-                assert response.status_code == 200
-                # save .pdf to the downloads folder
-                with open(pdf_path, 'wb') as pdf_file:
-                    pdf_file.write(response.content)
-                print('... DONE downloading.')
-
-            # crop from two-paged pdf into single-page pdf
-            print('==> Cropping from two-page into single-page...', pdf_path)
-            pdf_path_cropped = pdf_path.replace('.pdf', '_cropped.pdf')
-            split_left_right_pages(pdf_path, pdf_path_cropped)
-            # print_pdf_info(pdf_path_cropped)
-            print('... DONE cropping.')
-
-        return True
-    except Exception as exc:
-        print('==> ERROR downloading PDFs: ', exc)
-        return False
+        if get_scheduler().call(pdf_url, download_file, pdf_url, pdf_path):
+            METRICS.add('download_pdf', bytes=os.path.getsize(pdf_path))
+            print('... DONE downloading.')
+        else:
+            METRICS.add('download_pdf', cache_hits=1)
+            print('==> PDF is unchanged, NOT downloading:', pdf_path)
+    except requests.RequestException as exc:
+        if not os.path.exists(pdf_path):
+            raise
+        print('==> Cannot revalidate PDF, using the existing file:', pdf_path, exc)
+    if journal is not None:
+        journal.record(unit, outputs=[pdf_path])
+    return pdf_path
+
+
+@timed('download_pdfs')
+def download_pdfs(lang_codes=LANG_CODES, journal=None):
+    """
+    Downloads the PDFs of `lang_codes`, a failed download does not stop the others.
+    Returns True if all the PDFs were downloaded.
+    """
+    ok = True
+    for lang_code in lang_codes:
+        try:
+            download_pdf(lang_code, journal=journal)
+        except Exception as exc:
+            print('==> ERROR downloading PDF for', lang_code, exc)
+            ok = False
+    return ok
 
 
-def split_chapters(lang_code):
+@timed('crop_pdf')
+def crop_pdf(lang_code, manifest=None, journal=None):
     """
-    Splits the chapters for the PDFs.
+    Crops the two-page PDF of `lang_code` into a single-page PDF, unless the
+    `manifest` shows that the source PDF and the crop parameters haven't changed
+    or the PDF was cropped by the run of the `journal`.
+    """
+    pdf = DATA[lang_code]['pdf_info']
+    pdf_path = pdf['pdf_path']
+    pdf_path_cropped = pdf['pdf_path_cropped']
+
+    key = 'crop:%s' % lang_code
+    if journal is not None and journal.get(key):
+        print('==> PDF already cropped by the journaled run:', pdf_path_cropped)
+        return pdf_path_cropped
+    inputs = {
+        'source': hash_file(pdf_path),
+        'crop_params': hash_data(CROP_PARAMS),
+    }
+    if manifest is not None and manifest.is_fresh(key, inputs):
+        print('==> Cropped PDF is up to date, NOT cropping:', pdf_path_cropped)
+        METRICS.add('crop_pdf', cache_hits=1)
+        return pdf_path_cropped
+
+    # crop from two-paged pdf into single-page pdf
+    print('==> Cropping from two-page into single-page...', pdf_path)
+    split_left_right_pages(pdf_path, pdf_path_cropped, **CROP_PARAMS)
+    # print_pdf_info(pdf_path_cropped)
+    if manifest is not None:
+        manifest.record(key, inputs, [pdf_path_cropped])
+    if journal is not None:
+        journal.record(key, outputs=[pdf_path_cropped])
+    print('... DONE cropping.')
+    return pdf_path_cropped
+
+
+def get_chapter_path(directory, pagerange, prefix=''):
+    """
+    Returns the path of the PDF file of `pagerange` in `directory`, using the
+    same file naming as `PDFParser.write_pagerange()`.
+    """
+    slug = ''.join([c for c in pagerange['title'].replace(' ', '-') if c.isalnum() or c == '-'])
+    return os.path.sep.join([directory, '{}{}.pdf'.format(prefix, slug)])
+
+
+def build_chapters(lang_code, index, directory, source_inputs, write_pageranges, manifest=None,
+        dry_run=False, journal=None):
+    """
+    Builds the chapters/subchapters tree of the `index` (a `PageRangeIndex`) the
+    same way as `PDFParser.split_subchapters()`, the chapter files being in
+    `directory`.  The `write_pageranges(pageranges, paths, on_write)` callback
+    writes the PDFs of all the chapters whose `source_inputs` or page range
+    changed since the build recorded in `manifest`, and calls `on_write(position)`
+    after writing each one.  Each chapter written is recorded in the `journal`,
+    the chapters written by the journaled run are not written again.  With
+    `dry_run=True` the manifest is not updated.
+    Returns tuple: (chapters, written_paths, cached_paths)
+    """
+    paths = []
+    written = []
+    cached = []
+    pending = []
+    resumed = []  # chapters written by the journaled run, missing from the manifest
+    for leaf in index.leaves:
+        key = 'split:%s:%s%s' % (lang_code, leaf['prefix'], leaf['title'],)
+        inputs = dict(source_inputs)
+        inputs.update({
+            'page_start': leaf['page_start'],
+            'page_end': leaf['page_end'],
+        })
+        journaled = journal.get(key) if journal is not None else None
+        if journaled and journaled['inputs'] == inputs:
+            path = journaled['path']
+            cached.append(path)
+            if manifest is not None and (manifest.get(key) or {}).get('inputs') != inputs:
+                resumed.append((key, inputs, path))
+        elif manifest is not None and manifest.is_fresh(key, inputs):
+            path = list(manifest.get(key)['outputs'])[0]
+            cached.append(path)
+        else:
+            path = get_chapter_path(directory, leaf, prefix=leaf['prefix'])
+            written.append(path)
+            pending.append((leaf, key, inputs, path))
+        paths.append(path)
+
+    def on_write(position):
+        leaf, key, inputs, path = pending[position]
+        journal.record(key, {'path': path, 'inputs': inputs}, outputs=[path])
+
+    if pending:
+        write_pageranges([leaf for leaf, key, inputs, path in pending],
+                         [path for leaf, key, inputs, path in pending],
+                         on_write if journal is not None and not dry_run else None)
+    if (pending or resumed) and manifest is not None and not dry_run:
+        for key, inputs, path in [(key, inputs, path) for leaf, key, inputs, path in pending] + resumed:
+            manifest.record(key, inputs, [path], save=False)
+        manifest.save()
+
+    chapters = []
+    topics = {}
+    for leaf, path in zip(index.leaves, paths):
+        chapter = {'title': leaf['title'], 'path': path,
+                   'page_start': leaf['page_start'], 'page_end': leaf['page_end']}
+        if leaf['parent'] is None:
+            chapters.append(chapter)
+            continue
+        chapter_topic = topics.get(leaf['chapter_index'])
+        if chapter_topic is None:
+            chapter_topic = {'title': leaf['parent']['title'], 'children': []}
+            topics[leaf['chapter_index']] = chapter_topic
+            chapters.append(chapter_topic)
+        chapter_topic['children'].append(chapter)
+    return chapters, written, cached
+
+
+def write_chapter_pdfs(pages, pageranges, paths, on_page=None, stage='write_chapter_pdfs',
+        on_write=None):
+    """
+    Writes each of the `pageranges` to the PDF file at the same position in
+    `paths` in a single pass over `pages`, an iterable of (page_num, page) tuples
+    in page order.  Each page is added to the range containing it and a range is
+    written as soon as it has all its pages, so each page is read only once.
+    The `pageranges` must be valid, see `PageRangeIndex.validate()`: they don't
+    overlap and end on the last page of the PDF at the latest.
+    `on_page(page_num, num_writing)` is called after each page with the number of
+    ranges still being written, `on_write(position)` after writing each range.
+    The bytes and pages written are added to the metrics of `stage`.
+    """
+    index = PageRangeIndex(pageranges)
+    positions = {id(leaf): position for position, leaf in enumerate(index.leaves)}
+    remaining = [pagerange['page_end'] - pagerange['page_start'] for pagerange in pageranges]
+    writers = {}
+
+    def write(position):
+        pdfout = writers.pop(position)
+        with open(paths[position], "wb") as out_f:
+            pdfout.write(out_f)
+        METRICS.add(stage, bytes=os.path.getsize(paths[position]),
+                    pages=pdfout.getNumPages())
+        if on_write is not None:
+            on_write(position)
+
+    for page_num, page in pages:
+        for leaf in index.find(page_num):
+            position = positions[id(leaf)]
+            if position not in writers:
+                writers[position] = PdfFileWriter()
+            writers[position].addPage(page)
+            writers[position].removeLinks()  # must be done every page
+            remaining[position] -= 1
+            if remaining[position] == 0:
+                write(position)
+        if on_page is not None:
+            on_page(page_num, len(writers))
+
+
+@timed('split_chapters')
+def split_chapters(lang_code, manifest=None, journal=None):
+    """
+    Splits the chapters for the PDFs from the cropped PDF.
+    Each chapter is only written if its page range or the cropped PDF changed
+    since the build recorded in `manifest`, or if the run of the `journal`
+    didn't write it.
     """
     pdf = DATA[lang_code]['pdf_info']
-    page_ranges = pdf['page_ranges']
     pdf_path_cropped = pdf['pdf_path_cropped']
     pdf_split_path = pdf['pdf_split_path']
 
     print('==> Splitting chapters for', pdf_path_cropped)
     print('====> PDF_PATH_CROPPED', pdf_path_cropped, 'PDF_SPLIT_PATH', pdf_split_path)
-    with PDFParser(pdf_path_cropped, directory=pdf_split_path) as pdfparser:
-        chapters = pdfparser.split_subchapters(jsondata=page_ranges)
-        # for chapter in chapters:
-        #     print(chapter)
-    print('==> DONE splitting chapters for {} PDF.'.format(lang_code))
+    os.makedirs(pdf_split_path, exist_ok=True)
+    pdfin1 = open_pdf(pdf_path_cropped)
+    index = PageRangeIndex(pdf['page_ranges'])
+    index.validate(pdfin1.getNumPages(), name=lang_code)
+    source_inputs = {'source': hash_file(pdf_path_cropped)}
+
+    def write_pageranges(pageranges, paths, on_write=None):
+        pages = (
+            (page_num, page)
+            for page_start, page_end in PageRangeIndex(pageranges).get_intervals()
+            for page_num, page in enumerate(iter_pages(pdfin1, page_start, page_end), page_start)
+        )
+        write_chapter_pdfs(pages, pageranges, paths, stage='split_chapters', on_write=on_write)
+
+    try:
+        chapters, written, cached = build_chapters(
+            lang_code, index, pdf_split_path, source_inputs, write_pageranges, manifest=manifest,
+            journal=journal)
+    finally:
+        pdfin1.release_cached_objects()
+    METRICS.add('split_chapters', cache_hits=len(cached))
+
+    print('==> DONE splitting chapters for {} PDF, {} of {} chapters written.'.format(
+        lang_code, len(written), len(written) + len(cached)))
     return chapters
 
 
+@timed('crop_and_split_chapters')
+def crop_and_split_chapters(lang_code, manifest=None, write_cropped=WRITE_CROPPED_PDF,
+        stream=STREAM_PDF, journal=None):
+    """
+    Single-pass version of `crop_pdf()` + `split_chapters()`: reads the two-page
+    source PDF once, crops its pages in memory and writes each chapter directly
+    from the cropped pages, without writing and re-parsing the cropped PDF.
+    The full cropped PDF is only written if `write_cropped` is True.
+
+    With `stream=True`, the objects cached by the reader are released between
+    chapters once `STREAM_BATCH_PAGES` pages were loaded, so the peak memory is
+    set by the batch size (or the largest chapter) instead of the whole document.
+    The cropped PDF and the chapters written by the run of the `journal` are
+    not written again.
+    """
+    pdf = DATA[lang_code]['pdf_info']
+    pdf_path = pdf['pdf_path']
+    pdf_split_path = pdf['pdf_split_path']
+
+    print('==> Cropping and splitting chapters for', pdf_path)
+    os.makedirs(pdf_split_path, exist_ok=True)
+    pdfin1 = open_pdf(pdf_path)
+    index = PageRangeIndex(pdf['page_ranges'])
+    index.validate(get_num_cropped_pages(pdfin1.getNumPages()), name=lang_code)
+    source_inputs = {
+        'source': hash_file(pdf_path),
+        'crop_params': hash_data(CROP_PARAMS),
+    }
+    batch = {'pages': 0}
+
+    def release_batch(page_num, num_writing):
+        # PdfFileWriter reads the pages when writing so the cache is only
+        # released when no chapter is being written.
+        batch['pages'] += 1
+        if batch['pages'] >= STREAM_BATCH_PAGES and not num_writing:
+            release_cached_objects(pdfin1)
+            batch['pages'] = 0
+
+    def write_pageranges(pageranges, paths, on_write=None):
+        # Each source page is loaded and cropped once, even if its halves are in
+        # different chapters.
+        pages = (
+            (page_num, page)
+            for page_start, page_end in PageRangeIndex(pageranges).get_intervals()
+            for page_num, page in enumerate(
+                iter_cropped_pages(pdfin1, page_start, page_end, **CROP_PARAMS), page_start)
+        )
+        write_chapter_pdfs(pages, pageranges, paths, on_page=release_batch if stream else None,
+                           stage='crop_and_split_chapters', on_write=on_write)
+
+    try:
+        if write_cropped:
+            crop_pdf(lang_code, manifest=manifest, journal=journal)
+        chapters, written, cached = build_chapters(
+            lang_code, index, pdf_split_path, source_inputs, write_pageranges, manifest=manifest,
+            journal=journal)
+    finally:
+        # Keep the parsed reader for later uses of the PDF, but not its objects.
+        pdfin1.release_cached_objects()
+    METRICS.add('crop_and_split_chapters', cache_hits=len(cached))
+
+    print('==> DONE cropping and splitting chapters for {} PDF, {} of {} chapters written.'.format(
+        lang_code, len(written), len(written) + len(cached)))
+    return chapters
+
+
+def process_pdf(lang_code, manifest_path=None, write_cropped=WRITE_CROPPED_PDF,
+        collect_metrics=False, stream=STREAM_PDF, journal_path=None):
+    """
+    Runs the single-pass crop and split of the `lang_code` PDF.
+    This is run in a worker process by `process_pdfs()` so the build manifest is
+    not saved here, its changes and the metrics of the worker are returned to be
+    merged by the parent process.  The chapters are recorded in the run journal
+    at `journal_path` as soon as they are written.  The PDF readers are closed
+    at the end, the worker process is reused for other PDFs.
+    Returns tuple: (lang_code, chapters, manifest_changes, metrics)
+    """
+    # Worker processes are reused and may be forked with the parent's counters.
+    METRICS.reset()
+    METRICS.enable(collect_metrics)
+    manifest = None
+    if manifest_path:
+        manifest = BuildManifest(manifest_path, persist=False)
+    journal = None
+    if journal_path:
+        journal = RunJournal(journal_path)
+    with closing_pdfs():
+        chapters = crop_and_split_chapters(lang_code, manifest=manifest, write_cropped=write_cropped,
+                                           stream=stream, journal=journal)
+    changes = manifest.changes if manifest is not None else {}
+    return lang_code, chapters, changes, METRICS.snapshot()
+
+
+def resume_chapters(lang_code, journal=None):
+    """
+    Returns the chapters of `lang_code` processed by the run of the `journal`,
+    None if they have to be processed.
+    """
+    if journal is None:
+        return None
+    return journal.get('chapters:%s' % lang_code)
+
+
+def record_chapters(lang_code, chapters, journal=None, write_cropped=WRITE_CROPPED_PDF):
+    """
+    Records the processed `chapters` of `lang_code` in the `journal`.
+    """
+    if journal is None:
+        return
+    outputs = [chapter['path'] for chapter in iter_chapter_files(chapters)]
+    if write_cropped:
+        outputs.append(DATA[lang_code]['pdf_info']['pdf_path_cropped'])
+    journal.record('chapters:%s' % lang_code, chapters, outputs=outputs)
+
+
+def process_pdfs(lang_codes=LANG_CODES, manifest=None, max_workers=PDF_PROCESS_WORKERS,
+        write_cropped=WRITE_CROPPED_PDF, stream=STREAM_PDF, journal=None):
+    """
+    Crops and splits the PDFs of `lang_codes` in parallel, one worker process per
+    language since the PyPDF2 page handling is CPU-bound.  The languages
+    processed by the run of the `journal` are not processed again.
+    Returns a dict of lang_code --> chapters, the chapters are None if the
+    processing of that language failed.
+    """
+    chapters_by_lang = {lang_code: resume_chapters(lang_code, journal) for lang_code in lang_codes}
+    pending = [lang_code for lang_code in lang_codes if chapters_by_lang[lang_code] is None]
+    if len(pending) < len(lang_codes):
+        print('==> %d PDFs already processed by the journaled run.' % (len(lang_codes) - len(pending)))
+    if not pending:
+        return chapters_by_lang
+    if not max_workers:
+        max_workers = min(len(pending), os.cpu_count() or 1)
+    max_workers = max(1, int(max_workers))
+    manifest_path = manifest.path if manifest is not None else None
+    journal_path = journal.path if journal is not None else None
+
+    print('==> PROCESSING PDFs', pending, 'using', max_workers, 'processes')
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=update_data, initargs=(DATA,)) as executor:
+        futures = {}
+        for lang_code in pending:
+            future = executor.submit(process_pdf, lang_code, manifest_path, write_cropped,
+                                     METRICS.enabled, stream, journal_path)
+            futures[future] = lang_code
+        for future in as_completed(futures):
+            lang_code = futures[future]
+            try:
+                lang_code, chapters, changes, metrics = future.result()
+                chapters_by_lang[lang_code] = chapters
+                METRICS.merge(metrics)
+                if manifest is not None:
+                    manifest.merge(changes)
+                record_chapters(lang_code, chapters, journal, write_cropped=write_cropped)
+            except Exception as exc:
+                print('==> ERROR processing PDF for', lang_code, exc)
+    return chapters_by_lang
+
+
 def get_dimensions(pdfin1):
     """
-    Get dimensions of second page in PDF file `pdfin1`.
+    Get dimensions of second page in PDF file `pdfin1`, a `SharedPDFReader`.
     Returns tuple: (half_width, full_height)
     """
-    page = pdfin1.getPage(2)
-    double_page_width = page.mediaBox.getUpperRight_x()
+    x0, y0, double_page_width, page_height = pdfin1.get_mediabox(2)
     page_width = double_page_width / 2
-    page_height = page.mediaBox.getUpperRight_y()
     return page_width, page_height
 
 
-def split_left_right_pages(pdfin_path, pdfout_path):
+def release_cached_objects(pdfin1):
     """
-    Splits the left and right halves of a page into separate pages.
-    We also remove the binders between those separated pages.
+    Drops the objects (content streams, fonts, images...) cached by the `pdfin1`
+    reader, they are read again from the file if needed.  The xref is kept.
     """
-    # REF: https://gist.github.com/mdoege/0676e37ee2470fc755ea98177a560b4b
-    # RELATED-REF: https://github.com/mstamy2/PyPDF2/issues/100
+    pdfin1.release_cached_objects()
+    # The writers of the previous chapters hold the objects in reference cycles.
+    gc.collect()
 
-    pdfin1 = PdfFileReader(open(pdfin_path, "rb"))  # used for left pages
-    pdfout = PdfFileWriter()
 
-    num_pages = pdfin1.getNumPages()
-    page_ranges = [pdfin1.getPage(i) for i in range(0, num_pages)]
-    for nn, left_page in enumerate(page_ranges):
-        # use copy for the right pages
-        right_page = copy(left_page)
-        # copy the existing page dimensions
-        (page_width, page_height,) = left_page.mediaBox.upperRight
-
-        is_first_page = (nn == 0)
-        is_last_page = (nn + 1 >= num_pages)
-        if is_first_page or is_last_page:
-            # The first page has the binder to its left while the last page
-            # has the binder to its right.
-            binder_width = 40
-            if is_first_page:
-                (page_width, page_height,) = right_page.mediaBox.upperLeft
-                right_page.mediaBox.upperLeft = (page_width + binder_width, page_height,)
-            if is_last_page:
-                (page_width, page_height,) = right_page.mediaBox.upperRight
-                right_page.mediaBox.upperRight = (page_width - binder_width, page_height,)
-        else:
-            # Divide the width by 2 for the other pages (except first and last).
-            # We also remove the binders on the left-side of the right pages
-            # and the right-side of the left pages.
-            page_width = page_width / 2
-            binder_width = 20
-            right_page.mediaBox.upperLeft = (page_width + binder_width, page_height,)
-            left_page.mediaBox.upperRight = (page_width - binder_width, page_height,)
-            pdfout.addPage(left_page)
-        pdfout.addPage(right_page)
+def iter_pages(pdfin1, page_start, page_end):
+    """
+    Yields copies of the pages `page_start` to `page_end` (excluded) of `pdfin1`
+    so writing them leaves the pages of the shared reader unchanged.
+    """
+    for page_num in range(page_start, min(page_end, pdfin1.getNumPages())):
+        yield copy_direct_objects(pdfin1.getPage(page_num))
 
+
+@timed('split_left_right_pages')
+def split_left_right_pages(pdfin_path, pdfout_path,
+        binder_width=CROP_PARAMS['binder_width'],
+        edge_binder_width=CROP_PARAMS['edge_binder_width']):
+    """
+    Splits the left and right halves of a page into separate pages.
+    We also remove the binders between those separated pages.
+    """
+    # NOTE: PdfFileWriter keeps all the pages until `write()`, the pages are
+    # loaded and cropped one at a time but the cropped PDF is written at once.
+    pdfin1 = open_pdf(pdfin_path)
+    pdfout = PdfFileWriter()
+    for page in iter_cropped_pages(pdfin1, binder_width=binder_width,
+                                   edge_binder_width=edge_binder_width):
+        pdfout.addPage(page)
+    # The output is overwritten, don't leave a reader mapping the old file.
+    close_pdf(pdfout_path)
     with open(pdfout_path, "wb") as out_f:
         pdfout.write(out_f)
+    num_pages = pdfout.getNumPages()
+    pdfin1.release_cached_objects()
+    METRICS.add('split_left_right_pages', pages=num_pages, bytes=os.path.getsize(pdfout_path))
 
 
+@timed('print_pdf_info')
 def print_pdf_info(pdf_path):
     pp = pprint.PrettyPrinter()
-    pdf = PdfFileReader(open(pdf_path, "rb"))
+    pdf = open_pdf(pdf_path)
     page_width, page_height = get_dimensions(pdf)
     print('==> PDF INFO:', page_width, page_height)
     num_pages = pdf.getNumPages()
     for page_num in range(0, num_pages):
-        page = pdf.getPage(page_num)
-        this_width = page.mediaBox.getUpperRight_x()
-        this_height = page.mediaBox.getUpperRight_y()
+        x0, y0, this_width, this_height = pdf.get_mediabox(page_num)
         print('==> page', page_num, 'this_width',
               this_width, 'this_height', this_height)
         # pretty print the last 3 pages
@@ -262,156 +709,548 @@ def print_pdf_info(pdf_path):
         #     pp.pprint(page)
 
 
+def parse_video_blocks(page_html, parser=SCRAPE_HTML_PARSER):
+    """
+    Extracts the videos of the `content-inner` blocks of the video page `page_html`.
+    The 'html5lib' `parser` parses the whole page and the `data-html` of the video
+    wrappers, the other parsers only parse those blocks and the `iframe`s.
+    Yields a dict per video: {'url': ..., 'title': ..., 'description': ...}
+    """
+    if parser == 'html5lib':
+        # html5lib doesn't support `parse_only`.
+        page = BeautifulSoup(page_html, parser)
+        iframe_only = None
+    else:
+        page = BeautifulSoup(page_html, parser, parse_only=SoupStrainer('div', class_='content-inner'))
+        iframe_only = SoupStrainer('iframe')
+
+    content_divs = page.find_all('div', class_='content-inner')
+    for content_div in content_divs:
+        video_block = content_div.find('div', class_='video-block')
+        video_wrapper = video_block.find('div', class_='sqs-video-wrapper')
+        data_html_raw = video_wrapper['data-html']
+        data_html = html.unescape(data_html_raw)
+        if iframe_only is None:
+            chunk = BeautifulSoup(data_html, parser)
+        else:
+            chunk = BeautifulSoup(data_html, parser, parse_only=iframe_only)
+        iframe = chunk.find('iframe')
+        src = iframe['src']
+        title = iframe['title']
+
+        description = ''  # Get from the scraped page details
+        block_html = content_div.find_all('div', class_='sqs-block html-block sqs-block-html')
+        if isinstance(block_html, list) and len(block_html) > 1:
+            # Video description is the second div block.
+            desc_block = block_html[1]
+            block_content = desc_block.find('div', class_='sqs-block-content')
+            # NOTE: Some descriptions have <em> etc tags, some are separated by <br/> tags, while
+            # most are separated with <p> tags.  So we use `get_text(" ") - replacing those tags
+            # with " " and then stripping whitespaces for a "clean" description.`
+            description = block_content.get_text(" ", strip=True)
+        yield {'url': src, 'title': title, 'description': description}
+
+
+@timed('scrape_video_data')
 def scrape_video_data(url, lang_code, filename_prefix):
     """
     Scrapes videos based on the URL passed and returns a list of PointBVideo objects.
     For efficiency, the actual download will be done outside of this function, 
     after all video links have been collected.
+    The page is revalidated with the validators of the last scraping: if it didn't
+    change, the videos of the last scraping are returned without parsing it.
+    Otherwise the unchanged videos of the last scraping are returned, with their
+    recorded download (see `reuse_video()`), the cache entries of the changed
+    videos are invalidated so they are downloaded again, and the added, changed
+    and removed videos are reported.
     """
     video_data = []
     pp = pprint.PrettyPrinter()
     try:
-        if lang_code in LANG_CODES:
+        if lang_code in DATA:
+            with SCRAPED_VIDEOS_LOCK:
+                previous = load_scraped_videos().get(lang_code, [])
+                page = load_scraped_pages().get(lang_code, {})
+            if page.get('url') != url or not previous:
+                page = {}
             print('==> SCRAPING', url)
-            response = requests.get(url)
-            page = BeautifulSoup(response.text, 'html5lib')
-
-            content_divs = page.find_all('div', class_='content-inner')
-            for content_div in content_divs:
-                video_block = content_div.find('div', class_='video-block')
-                video_wrapper = video_block.find('div', class_='sqs-video-wrapper')
-                data_html_raw = video_wrapper['data-html']
-                data_html = html.unescape(data_html_raw)
-                chunk = BeautifulSoup(data_html, 'html5lib')
-                iframe = chunk.find('iframe')
-                src = iframe['src']
-                title = iframe['title']
-
-                # print('==> SCRAPED VALUES')
-                description = ''  # Get from the scraped page details
-                block_html = content_div.find_all('div', class_='sqs-block html-block sqs-block-html')
-                if isinstance(block_html, list) and len(block_html) > 1:
-                    # Video description is the second div block.
-                    desc_block = block_html[1]
-                    block_content = desc_block.find('div', class_='sqs-block-content')
-                    # print('==> BLOCK_CONTENT', block_content)
-                    # NOTE: Some descriptions have <em> etc tags, some are separated by <br/> tags, while
-                    # most are separated with <p> tags.  So we use `get_text(" ") - replacing those tags
-                    # with " " and then stripping whitespaces for a "clean" description.`
-                    description = block_content.get_text(" ", strip=True)
-                    # print('==> DESCRIPTION', description)
-                # print('==> url==', src)
-                # print('==> title==', title)
-                # print('==> description==', description)
-                # print('==> DONE with SCRAPED VALUES')
-
+            response = get_scheduler().call(url, fetch_page, url, validators=page)
+            if response is None:
+                print('==> UNCHANGED', url, 'reusing', len(previous), 'videos')
+                METRICS.add('scrape_video_data', cache_hits=1)
+                return previous
+            METRICS.add('scrape_video_data', bytes=len(response.content))
+            page_info = dict(get_validators(response), url=url, hash=hash_data(response.text))
+            if page_info['hash'] == page.get('hash'):
+                print('==> UNCHANGED', url, 'reusing', len(previous), 'videos')
+                METRICS.add('scrape_video_data', cache_hits=1)
+                save_scraped_videos(lang_code, previous, page=page_info)
+                return previous
+            scraped = []
+            for block in parse_video_blocks(response.text):
                 video = PointBVideo(
-                            url=src, 
-                            title=title, 
-                            description=description, 
+                            url=block['url'], 
+                            title=block['title'], 
+                            description=block['description'], 
                             lang_code=lang_code,
-                            filename_prefix=filename_prefix)
-                video_data.append(video)
+                            filename_prefix=filename_prefix,
+                            fingerprint=get_video_fingerprint(
+                                block['url'], block['title'], block['description']))
+                scraped.append(video)
+            video_data, changes = diff_videos(previous, scraped)
+            print('==> VIDEOS', lang_code, ', '.join(
+                '%d %s' % (len(changes[name]), name) for name in ('added', 'changed', 'removed', 'unchanged')))
+            for video in changes['removed']:
+                print('====> REMOVED', video.lang_code, video.url, video.title)
+            for video in changes['changed']:
+                get_video_cache().invalidate(video.get_media_id())
+            save_scraped_videos(lang_code, video_data, page=page_info)
     except Exception as e:
         print('==> Error scraping video URL', lang_code)
         pp.pprint(e)
     return video_data
 
 
-def download_videos(lang_code):
+def load_scraped_videos(path=SCRAPED_VIDEOS_PATH):
     """
-    Scrape, collect, and download the videos and their thumbnails.
+    Returns the videos found by the last scraping of each language, a dict of
+    lang_code --> list of PointBVideo objects in the scraped order.
     """
-    video_data = []
+    scraped = {}
+    for video in load_videos(path):
+        scraped.setdefault(video.lang_code, []).append(video)
+    return scraped
+
+
+def load_scraped_pages(path=SCRAPED_PAGES_PATH):
+    """
+    Returns the pages of the last scraping, a dict of
+    lang_code --> {'url': ..., 'etag': ..., 'last_modified': ..., 'hash': ...}
+    """
+    return load_json(path, 'scraped pages')
+
+
+def save_scraped_videos(lang_code, videos, page=None, path=SCRAPED_VIDEOS_PATH,
+        pages_path=SCRAPED_PAGES_PATH):
+    """
+    Replaces the scraped videos of `lang_code` in the catalog at `path`, before
+    they are downloaded, and the info of their `page` in the file at `pages_path`.
+    """
+    with SCRAPED_VIDEOS_LOCK:
+        scraped = load_scraped_videos(path)
+        scraped[lang_code] = [PointBVideo.from_dict(video.to_dict()) for video in videos]
+        save_videos([video for lang in sorted(scraped) for video in scraped[lang]], path)
+        if page is not None:
+            pages = load_scraped_pages(pages_path)
+            pages[lang_code] = page
+            write_json_atomic(pages_path, pages)
+
+
+def record_downloaded_videos(videos_by_lang, path=SCRAPED_VIDEOS_PATH):
+    """
+    Records the file, thumbnail and title of the downloaded videos of
+    `videos_by_lang` in the catalog of the scraped videos at `path`, so the
+    next run reuses them if they are unchanged, see `reuse_video()`.
+    """
+    with SCRAPED_VIDEOS_LOCK:
+        scraped = load_scraped_videos(path)
+        for lang_code, videos in videos_by_lang.items():
+            downloaded = {video.get_media_id(): video for video in videos}
+            scraped[lang_code] = [downloaded.get(video.get_media_id(), video)
+                                  for video in scraped.get(lang_code, [])]
+        save_videos([video for lang in sorted(scraped) for video in scraped[lang]], path)
+
+
+def get_video_cache():
+    global VIDEO_CACHE
+    if VIDEO_CACHE is None:
+        VIDEO_CACHE = VideoCache(ttl=VIDEO_CACHE_TTL)
+    return VIDEO_CACHE
+
+
+def get_video_formats():
+    global VIDEO_FORMATS
+    if VIDEO_FORMATS is None:
+        VIDEO_FORMATS = VideoFormatPlanner(budget=VIDEO_BUDGET)
+    return VIDEO_FORMATS
+
+
+def scrape_videos(lang_code, journal=None):
+    """
+    Scrapes the videos of `lang_code` (see `scrape_video_data()`), unless they were
+    scraped by the run of the `journal`.
+    Returns the list of PointBVideo objects.
+    """
+    unit = 'scrape:%s' % lang_code
+    if journal is not None and journal.get(unit):
+        print('==> Videos of %s already scraped by the journaled run.' % lang_code)
+        return [PointBVideo.from_dict(data) for data in journal.get(unit)]
     vinfo = DATA[lang_code]['video_info']
-    try:
-        download_path = vinfo['download_path']
-        video_data = scrape_video_data(
-                            vinfo['video_url'], 
-                            lang_code, 
-                            vinfo['filename_prefix'])
-        print('==> DOWNLOADING', download_path, '====> vinfo', vinfo)
-        # Download video and metadata info for all video objects collected.
-        for i, video in enumerate(video_data):
-            progress = '%d/%d' % (i+1, len(video_data),)
-            progress = '==> %s: Downloading video from %s ...' % (progress, video.url,)
-            print(progress)
-            video.download(download_dir=download_path, video_data=DATA)
-    except Exception as e:
-        print('Error downloading videos:')
-        pp = pprint.PrettyPrinter()
-        pp.pprint(e)
-        raise e
-    print('==> DONE downloading videos for', vinfo)
-    return video_data
+    videos = scrape_video_data(vinfo['video_url'], lang_code, vinfo['filename_prefix'])
+    # Scraping errors are not raised, an empty list is scraped again by the next run.
+    if journal is not None and videos:
+        journal.record(unit, [video.to_dict() for video in videos])
+    return videos
 
 
-def build_english_video_topics(topic):
+def resume_video(video, journal=None):
     """
+    Returns the scraped `video` as downloaded by the run of the `journal`, None if
+    it has to be downloaded.
     """
-    video_data = download_videos(LANG_CODE_EN)
-    if not video_data:
-        print('==> Download of Videos FAILED!')
+    if journal is None:
+        return None
+    data = journal.get('video:%s' % video.get_media_id())
+    if not data or data['url'] != video.url or data['lang_code'] != video.lang_code:
+        return None
+    return PointBVideo.from_dict(data)
+
+
+def reuse_video(video):
+    """
+    Returns True if the scraped `video` is unchanged since the last scraping and
+    was downloaded by a previous run, which recorded its file in the catalog
+    (see `record_downloaded_videos()`), and if the video cache still has a valid
+    entry for that file.  The video is then used as is, without `download()`.
+    The added and changed videos have no recorded file.
+    """
+    if not video.filepath:
         return False
+    entry = get_video_cache().get(video.get_media_id())
+    return bool(entry) and entry['filepath'] == video.filepath
+
 
+def record_video(video, journal=None):
+    """
+    Records the downloaded `video` and its files in the `journal`.
+    """
+    if journal is not None:
+        journal.record('video:%s' % video.get_media_id(), video.to_dict(),
+                       outputs=[video.filepath, video.thumbnail])
+
+
+def download_video(video, download_dir):
+    """
+    Default downloader used by `download_video_pool()`.
+    """
+    return video.download(download_dir=download_dir, video_data=DATA, cache=get_video_cache(),
+                          scheduler=get_scheduler(), planner=get_video_formats())
+
+
+def download_video_pool(jobs, max_workers=VIDEO_DOWNLOAD_WORKERS, downloader=None):
+    """
+    Download the `(video, download_dir)` tuples in `jobs` using a pool of at most
+    `max_workers` threads.  A failed download does not stop the other downloads.
+    The `downloader` is called as `downloader(video, download_dir)`, it defaults
+    to `download_video()` and can be replaced by a stub for testing.
+    Returns tuple: (downloaded_videos, [(failed_video, exception), ...])
+    """
+    downloader = downloader or download_video
+    downloaded = []
+    failed = []
+    if not jobs:
+        return downloaded, failed
+
+    max_workers = max(1, min(int(max_workers), len(jobs)))
+    print('==> DOWNLOADING', len(jobs), 'videos using', max_workers, 'workers')
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for video, download_dir in jobs:
+            future = executor.submit(downloader, video, download_dir)
+            futures[future] = video
+        for i, future in enumerate(as_completed(futures)):
+            video = futures[future]
+            progress = '%d/%d' % (i+1, len(jobs),)
+            try:
+                future.result()
+                downloaded.append(video)
+                print('==> %s: Downloaded video from %s' % (progress, video.url,))
+            except Exception as e:
+                failed.append((video, e,))
+                print('==> %s: Error downloading video from %s: %s' % (progress, video.url, e,))
+
+    # Keep the scraped order of the videos regardless of the completion order.
+    order = {id(video): i for i, (video, download_dir) in enumerate(jobs)}
+    downloaded.sort(key=lambda video: order[id(video)])
+    print('==> DONE downloading videos: %d downloaded, %d failed.' % (len(downloaded), len(failed),))
+    for video, e in failed:
+        print('====> FAILED', video.lang_code, video.url, e)
+    return downloaded, failed
+
+
+def download_videos(lang_codes=LANG_CODES, max_workers=VIDEO_DOWNLOAD_WORKERS, downloader=None,
+        journal=None):
+    """
+    Scrape and collect the videos of all `lang_codes` then download the videos and
+    their thumbnails in one shared pool.
+    A video found on the pages of several languages (same Vimeo id) is only
+    downloaded once and the videos of the other languages share its file, each
+    language keeps its own download directory.  The pages scraped
+    and the videos downloaded by the run of the `journal` are not done again,
+    the unchanged videos of the last run are reused, see `reuse_video()`.
+    Returns tuple: (dict of lang_code --> list of downloaded PointBVideo objects,
+    [(failed_video, exception), ...]), the videos sharing the file of a failed
+    video are failed too.
+    """
+    scraped = []
+    for lang_code in lang_codes:
+        vinfo = DATA[lang_code]['video_info']
+        video_data = scrape_videos(lang_code, journal=journal)
+        scraped.extend((video, vinfo['download_path'],) for video in video_data)
+
+    jobs = []
+    media = {}  # media id --> video downloaded for it
+    duplicates = []
+    resumed = []
+    reused = []
+    for i, (video, download_dir) in enumerate(scraped):
+        media_id = video.get_media_id()
+        if media_id in media:
+            duplicates.append((video, media[media_id],))
+            continue
+        journaled = resume_video(video, journal)
+        if journaled is not None:
+            video = journaled
+            scraped[i] = (video, download_dir,)
+            resumed.append(video)
+        elif reuse_video(video):
+            reused.append(video)
+        else:
+            jobs.append((video, download_dir,))
+        media[media_id] = video
+    if resumed:
+        print('==> %d videos already downloaded by the journaled run.' % len(resumed))
+    if reused:
+        print('==> %d unchanged videos reused from the last run.' % len(reused))
+
+    def download_and_record(video, download_dir):
+        (downloader or download_video)(video, download_dir)
+        record_video(video, journal)
+
+    downloaded, failed = download_video_pool(
+        jobs, max_workers=max_workers, downloader=download_and_record if journal is not None else downloader)
+    downloaded.extend(resumed)
+    downloaded.extend(reused)
+    done = set(id(video) for video in downloaded)
+    errors = {id(video): e for video, e in failed}
+    for video, media_video in duplicates:
+        if id(media_video) in done:
+            downloaded.append(video.share_media(media_video, video_data=DATA))
+        else:
+            failed.append((video, errors[id(media_video)],))
+    print('==> %d videos share the file of a video in another language.' % len(duplicates))
+
+    videos_by_lang = {lang_code: [] for lang_code in lang_codes}
+    order = {id(video): i for i, (video, download_dir) in enumerate(scraped)}
+    for video in sorted(downloaded, key=lambda video: order[id(video)]):
+        videos_by_lang[video.lang_code].append(video)
+    record_downloaded_videos(videos_by_lang)
+    return videos_by_lang, failed
+
+
+async def run_pipeline(lang_codes=LANG_CODES, manifest=None, pdf_workers=PDF_PROCESS_WORKERS,
+        video_workers=VIDEO_DOWNLOAD_WORKERS, write_cropped=WRITE_CROPPED_PDF, stream=STREAM_PDF,
+        journal=None):
+    """
+    Runs the PDF and video stages of all `lang_codes` as overlapping asyncio stages
+    connected by queues, instead of running them back to back:
+     - PDF fetch --> pdf_queue --> PDF crop and split (worker processes)
+     - page scraping --> video_queue --> video downloads (`video_workers` threads)
+    The blocking network calls run in a thread pool and the CPU-bound PDF work runs
+    in a process pool, so the network stages keep going while the PDFs are split.
+    The units of work done by the run of the `journal` are not done again, and the
+    unchanged videos of the last run are reused, see `reuse_video()`.
+    Returns tuple: (dict of lang_code --> chapters, dict of lang_code --> videos,
+    [(failed_video, exception), ...])
+    """
+    loop = asyncio.get_running_loop()
+    video_workers = max(1, int(video_workers))
+    if not pdf_workers:
+        pdf_workers = min(len(lang_codes), os.cpu_count() or 1)
+    pdf_workers = max(1, int(pdf_workers))
+    manifest_path = manifest.path if manifest is not None else None
+    journal_path = journal.path if journal is not None else None
+
+    chapters_by_lang = {lang_code: None for lang_code in lang_codes}
+    downloaded = {lang_code: [] for lang_code in lang_codes}
+    failed = []
+    media = {}  # media id --> future of the video downloaded for it
+    pdf_queue = asyncio.Queue()
+    video_queue = asyncio.Queue()
+
+    async def fetch_pdf(lang_code):
+        chapters_by_lang[lang_code] = resume_chapters(lang_code, journal)
+        if chapters_by_lang[lang_code] is not None:
+            print('==> PDF of %s already processed by the journaled run.' % lang_code)
+            return
+        try:
+            await loop.run_in_executor(thread_pool, download_pdf, lang_code, journal)
+            await pdf_queue.put(lang_code)
+        except Exception as exc:
+            print('==> ERROR downloading PDF for', lang_code, exc)
+
+    async def process_pdf_worker():
+        while True:
+            lang_code = await pdf_queue.get()
+            if lang_code is None:
+                break
+            try:
+                lang_code, chapters, changes, metrics = await loop.run_in_executor(
+                    process_pool, process_pdf, lang_code, manifest_path, write_cropped,
+                    METRICS.enabled, stream, journal_path)
+                chapters_by_lang[lang_code] = chapters
+                METRICS.merge(metrics)
+                if manifest is not None:
+                    manifest.merge(changes)
+                record_chapters(lang_code, chapters, journal, write_cropped=write_cropped)
+            except Exception as exc:
+                print('==> ERROR processing PDF for', lang_code, exc)
+
+    async def scrape(lang_code):
+        vinfo = DATA[lang_code]['video_info']
+        video_data = await loop.run_in_executor(thread_pool, scrape_videos, lang_code, journal)
+        for index, video in enumerate(video_data):
+            await video_queue.put((index, video, vinfo['download_path'],))
+
+    async def download_video_worker():
+        while True:
+            job = await video_queue.get()
+            if job is None:
+                break
+            index, video, download_dir = job
+            media_id = video.get_media_id()
+            if media_id in media:
+                # Already downloaded (or being downloaded) for another language.
+                media_video, exc = await media[media_id]
+                if media_video is not None:
+                    downloaded[video.lang_code].append((index, video.share_media(media_video, video_data=DATA),))
+                else:
+                    failed.append((video, exc,))
+                continue
+            media[media_id] = loop.create_future()
+            journaled = resume_video(video, journal)
+            if journaled is not None:
+                downloaded[video.lang_code].append((index, journaled,))
+                media[media_id].set_result((journaled, None,))
+                continue
+            if reuse_video(video):
+                print('==> Reusing the unchanged video %s' % video.url)
+                downloaded[video.lang_code].append((index, video,))
+                media[media_id].set_result((video, None,))
+                continue
+            try:
+                await loop.run_in_executor(thread_pool, download_video, video, download_dir)
+                record_video(video, journal)
+                downloaded[video.lang_code].append((index, video,))
+                media[media_id].set_result((video, None,))
+                print('==> Downloaded video from %s' % video.url)
+            except Exception as exc:
+                media[media_id].set_result((None, exc,))
+                failed.append((video, exc,))
+                print('==> Error downloading video from %s: %s' % (video.url, exc,))
+
+    async def pdf_stage():
+        await asyncio.gather(*[fetch_pdf(lang_code) for lang_code in lang_codes])
+        for i in range(pdf_workers):
+            await pdf_queue.put(None)
+
+    async def video_stage():
+        await asyncio.gather(*[scrape(lang_code) for lang_code in lang_codes])
+        for i in range(video_workers):
+            await video_queue.put(None)
+
+    print('==> RUNNING PIPELINE', lang_codes, 'using', pdf_workers, 'processes and',
+          video_workers, 'video workers')
+    thread_pool = ThreadPoolExecutor(max_workers=video_workers + 2 * len(lang_codes))
+    process_pool = ProcessPoolExecutor(max_workers=pdf_workers, initializer=update_data, initargs=(DATA,))
+    try:
+        await asyncio.gather(
+            pdf_stage(),
+            video_stage(),
+            *[process_pdf_worker() for i in range(pdf_workers)],
+            *[download_video_worker() for i in range(video_workers)])
+    finally:
+        thread_pool.shutdown()
+        process_pool.shutdown()
+
+    print('==> DONE downloading videos: %d downloaded, %d failed.' % (
+        sum(len(videos) for videos in downloaded.values()), len(failed),))
+    for video, exc in failed:
+        print('====> FAILED', video.lang_code, video.url, exc)
+    # Keep the scraped order of the videos regardless of the completion order.
+    videos_by_lang = {}
+    for lang_code, videos in downloaded.items():
+        videos_by_lang[lang_code] = [video for index, video in sorted(videos, key=lambda item: item[0])]
+    record_downloaded_videos(videos_by_lang)
+    return chapters_by_lang, videos_by_lang, failed
+
+
+def build_video_topics(topic, video_data, lang_code, copyright_holder=POINTB, title_suffix=''):
+    """
+    Adds a VideoNode to `topic` for each video of `video_data`, removing the
+    `title_suffix` from the titles of the videos.
+    """
     # NOTE(cpauya: VideoNode constructor has no argument for language code?
     for i, video in enumerate(video_data):
         filepath = video.filepath
-        title=video.title.replace('(English Language)', '').strip()
+        title = video.title
+        if title_suffix:
+            title = title.replace(title_suffix, '').strip()
         video_node = VideoNode(
                 source_id=video.uid, 
                 title=title, 
                 description=video.description,
                 aggregator=LE,
                 thumbnail=video.thumbnail,
-                license=get_license("CC BY-NC-SA", copyright_holder=POINTB),
+                license=get_license("CC BY-NC-SA", copyright_holder=copyright_holder),
                 role=roles.COACH,
                 files=[
                     VideoFile(
                         path=filepath,
-                        language=LANG_CODE_EN
+                        language=lang_code
                     )
                 ])
         topic.add_child(video_node)
-
     return topic
 
 
-def build_burmese_video_topics(topic):
+@timed('build_english_video_topics')
+def build_english_video_topics(topic, video_data=None):
     """
+    Adds the downloaded English `video_data` to `topic`, downloading them first if
+    `video_data` is not given.
     """
-    video_data = download_videos(LANG_CODE_MY)
+    if video_data is None:
+        video_data = download_videos([LANG_CODE_EN])[0][LANG_CODE_EN]
     if not video_data:
         print('==> Download of Videos FAILED!')
         return False
+    return build_video_topics(topic, video_data, LANG_CODE_EN, title_suffix='(English Language)')
 
-    for i, video in enumerate(video_data):
-        filepath = video.filepath
-        video_node = VideoNode(
-                source_id=video.uid, 
-                title=video.title, 
-                description=video.description,
-                aggregator=LE,
-                thumbnail=video.thumbnail,
-                license=get_license("CC BY-NC-SA", copyright_holder=POINTB),
-                role=roles.COACH,
-                files=[
-                    VideoFile(
-                        path=filepath,
-                        language=LANG_CODE_MY
-                    )
-                ])
-        topic.add_child(video_node)
-    return topic
+
+@timed('build_burmese_video_topics')
+def build_burmese_video_topics(topic, video_data=None):
+    """
+    Adds the downloaded Burmese `video_data` to `topic`, downloading them first if
+    `video_data` is not given.
+    """
+    if video_data is None:
+        video_data = download_videos([LANG_CODE_MY])[0][LANG_CODE_MY]
+    if not video_data:
+        print('==> Download of Videos FAILED!')
+        return False
+    return build_video_topics(topic, video_data, LANG_CODE_MY)
 
 
-def build_pdf_topics(main_topic, sections, lang_code):
+@timed('build_pdf_topics')
+def build_pdf_topics(main_topic, sections, lang_code, copyright_holder=POINTB,
+        description='Chapter from A GUIDE TO BECOMING A 21ST CENTURY TEACHER'):
     """
     Adds the documents from the sections tree to the `main_topic`.
      - CASE A = no children => add as DocumentNode
      - CASE B = has children => add as TopicNode and add all children as DocumentNode
     """
-    LICENSE = get_license("CC BY-NC-SA", copyright_holder=POINTB)
+    LICENSE = get_license("CC BY-NC-SA", copyright_holder=copyright_holder)
 
     for i, section in enumerate(sections):
 
@@ -422,12 +1261,13 @@ def build_pdf_topics(main_topic, sections, lang_code):
             filename = os.path.basename(abspath)
             doc_node = DocumentNode(
                 title=title,
-                description='Chapter from A GUIDE TO BECOMING A 21ST CENTURY TEACHER',
+                description=description,
                 source_id='%s-%s' % (filename, lang_code),
                 license=LICENSE,
                 aggregator=LE,
                 language=lang_code,
                 role=roles.COACH,
+                thumbnail=section.get('thumbnail'),
                 files=[
                     DocumentFile(
                         path=abspath,
@@ -456,6 +1296,7 @@ def build_pdf_topics(main_topic, sections, lang_code):
                     aggregator=LE,
                     language=lang_code,
                     role=roles.COACH,
+                    thumbnail=subsection.get('thumbnail'),
                     files=[
                         DocumentFile(
                             path=abspath,
@@ -468,6 +1309,402 @@ def build_pdf_topics(main_topic, sections, lang_code):
 
 
 
+def iter_chapter_files(chapters):
+    """
+    Yields the chapters and subchapters of the `chapters` tree that have a PDF file.
+    """
+    for chapter in chapters:
+        if 'children' in chapter:
+            for subchapter in chapter['children']:
+                yield subchapter
+        else:
+            yield chapter
+
+
+def make_chapter_thumbnails(chapters_by_lang, max_workers=THUMBNAIL_WORKERS):
+    """
+    Sets the `thumbnail` of each chapter of `chapters_by_lang` to the rendering of
+    the first page of its PDF.
+    """
+    chapters = [chapter for chapters in chapters_by_lang.values() if chapters
+                for chapter in iter_chapter_files(chapters)]
+    thumbnails = make_thumbnails([('pdf', chapter['path']) for chapter in chapters], max_workers=max_workers)
+    for chapter in chapters:
+        chapter['thumbnail'] = thumbnails.get(chapter['path'])
+    return chapters_by_lang
+
+
+def make_video_thumbnails(videos_by_lang, max_workers=THUMBNAIL_WORKERS):
+    """
+    Replaces the `thumbnail` downloaded with each video of `videos_by_lang` by
+    its resized copy, the downloaded thumbnail is kept if resizing it failed.
+    """
+    videos = [video for videos in videos_by_lang.values() for video in videos if video.thumbnail]
+    thumbnails = make_thumbnails([('video', video.thumbnail) for video in videos], max_workers=max_workers)
+    for video in videos:
+        video.thumbnail = thumbnails.get(video.thumbnail) or video.thumbnail
+    return videos_by_lang
+
+
+def get_verify_jobs(chapters_by_lang, videos_by_lang):
+    """
+    Returns the list of tuples (lang_code, kind, path, expected) of the artifacts
+    of the content, see `verify_artifacts()`.  The chapters are checked against
+    their range of the source PDF, the page sizes are only computed by the
+    workers for the chapters that aren't in the verification cache.
+    """
+    video_cache = get_video_cache()
+    jobs = []
+    for lang_code, chapters in chapters_by_lang.items():
+        pdf_path = DATA[lang_code]['pdf_info']['pdf_path']
+        source_hash = hash_file(pdf_path) if os.path.exists(pdf_path) else None
+        for chapter in iter_chapter_files(chapters or []):
+            expected = {'pages': chapter['page_end'] - chapter['page_start']}
+            if source_hash is not None:
+                expected['source'] = {
+                    'path': pdf_path,
+                    'sha256': source_hash,
+                    'page_start': chapter['page_start'],
+                    'page_end': chapter['page_end'],
+                    'crop_params': CROP_PARAMS,
+                }
+            jobs.append((lang_code, 'pdf', chapter['path'], expected))
+            if chapter.get('thumbnail'):
+                jobs.append((lang_code, 'thumbnail', chapter['thumbnail'], {}))
+    for lang_code, videos in videos_by_lang.items():
+        for video in videos:
+            entry = video_cache.get(video.get_media_id(), validate=False) or {}
+            jobs.append((lang_code, 'video', video.filepath, {'duration': entry.get('duration')}))
+            if video.thumbnail:
+                jobs.append((lang_code, 'thumbnail', video.thumbnail, {}))
+    return jobs
+
+
+def verify_content(chapters_by_lang, videos_by_lang, manifest=None, max_workers=VERIFY_WORKERS,
+        journal=None):
+    """
+    Verifies the chapter PDFs (page count and crop geometry), the video files
+    (complete mp4 with the expected duration) and the thumbnails of the content
+    in a pool of processes, before the channel is uploaded.  The stages that
+    wrote a broken chapter are forgotten by the `manifest` and the `journal`,
+    the broken videos and thumbnails are removed, so the next run makes them again.
+    Returns the list of tuples (lang_code, kind, path, error) of the broken artifacts.
+    """
+    jobs = get_verify_jobs(chapters_by_lang, videos_by_lang)
+    errors = verify_artifacts([(kind, path, expected) for lang_code, kind, path, expected in jobs],
+                              max_workers=max_workers, cache=VerificationCache())
+    broken = [(lang_code, kind, path, errors[path])
+              for lang_code, kind, path, expected in jobs if errors.get(path)]
+    removed = set()
+    for lang_code, kind, path, error in broken:
+        if path in removed:
+            continue
+        removed.add(path)
+        print('==> BROKEN %s %s (%s): %s' % (kind, path, lang_code, error))
+        if kind == 'pdf':
+            if manifest is not None:
+                manifest.invalidate_output(path)
+            if journal is not None:
+                journal.forget_output(path)
+        elif path and os.path.exists(path):
+            os.remove(path)
+
+    video_cache = get_video_cache()
+    for videos in videos_by_lang.values():
+        for video in videos:
+            if errors.get(video.filepath) or errors.get(video.thumbnail):
+                video_cache.invalidate(video.get_media_id())
+    return broken
+
+
+def plan_artifact(kind, lang_code, path, status, pages=0, size=0):
+    """
+    Returns an item of the plan: the artifact `path` of `lang_code` with its
+    `status` ('missing', 'stale', 'cached', 'shared' or 'unknown'), the `pages` to
+    write and the `size` in bytes to download (None if unknown) to build it.
+    """
+    return {'kind': kind, 'lang_code': lang_code, 'path': path, 'status': status,
+            'pages': pages, 'bytes': size}
+
+
+def plan_pdf(lang_code, manifest=None, write_cropped=WRITE_CROPPED_PDF):
+    """
+    Computes the chapters of the `lang_code` PDF from its `page_ranges` without
+    downloading, cropping or splitting anything, using the `manifest` to find
+    the chapters that are up to date.
+    Returns tuple: (chapters, artifacts)
+    """
+    pdf = DATA[lang_code]['pdf_info']
+    pdf_path = pdf['pdf_path']
+    artifacts = []
+    if os.path.exists(pdf_path):
+        # Only revalidated with a conditional request by `download_pdf()`.
+        artifacts.append(plan_artifact('pdf', lang_code, pdf_path, 'cached'))
+        source_inputs = {
+            'source': hash_file(pdf_path),
+            'crop_params': hash_data(CROP_PARAMS),
+        }
+    else:
+        size = read_meta(pdf_path).get('size')
+        artifacts.append(plan_artifact('pdf', lang_code, pdf_path, 'missing', size=size))
+        # Without the source PDF, none of the chapters can be up to date.
+        source_inputs = {}
+        manifest = None
+
+    page_ranges = pdf['page_ranges']
+    if write_cropped:
+        pdf_path_cropped = pdf['pdf_path_cropped']
+        pages = max(pagerange['page_end'] for pagerange in page_ranges)
+        if manifest is not None and manifest.is_fresh('crop:%s' % lang_code, source_inputs):
+            artifacts.append(plan_artifact('crop', lang_code, pdf_path_cropped, 'cached'))
+        elif os.path.exists(pdf_path_cropped):
+            artifacts.append(plan_artifact('crop', lang_code, pdf_path_cropped, 'stale', pages=pages))
+        else:
+            artifacts.append(plan_artifact('crop', lang_code, pdf_path_cropped, 'missing', pages=pages))
+
+    index = PageRangeIndex(page_ranges)
+    num_pages = None
+    if os.path.exists(pdf_path):
+        num_pages = get_num_cropped_pages(open_pdf(pdf_path).getNumPages())
+    errors, warnings = index.check(num_pages)
+    for error in errors:
+        print('==> ERROR page ranges', lang_code, error)
+    for warning in warnings:
+        print('==> WARNING page ranges', lang_code, warning)
+
+    def plan_pageranges(pageranges, paths, on_write=None):
+        for pagerange, path in zip(pageranges, paths):
+            status = 'stale' if os.path.exists(path) else 'missing'
+            pages = pagerange['page_end'] - pagerange['page_start']
+            artifacts.append(plan_artifact('chapter', lang_code, path, status, pages=pages))
+
+    chapters, written, cached = build_chapters(
+        lang_code, index, pdf['pdf_split_path'], source_inputs, plan_pageranges,
+        manifest=manifest, dry_run=True)
+    for path in cached:
+        artifacts.append(plan_artifact('chapter', lang_code, path, 'cached'))
+    return chapters, artifacts
+
+
+def plan_videos(lang_codes=LANG_CODES):
+    """
+    Computes the videos of `lang_codes` from the videos found by the last scraping
+    and the video cache, without scraping or downloading anything.  The languages
+    without scraped videos are left out of the returned videos.
+    Returns tuple: (videos_by_lang, artifacts)
+    """
+    scraped = load_scraped_videos()
+    cache = get_video_cache()
+    formats = get_video_formats()
+    videos_by_lang = {}
+    artifacts = []
+    media = set()
+    for lang_code in lang_codes:
+        vinfo = DATA[lang_code]['video_info']
+        if lang_code not in scraped:
+            artifacts.append(plan_artifact('video', lang_code, vinfo['video_url'], 'unknown', size=None))
+            continue
+        videos = []
+        for video in scraped[lang_code]:
+            media_id = video.get_media_id()
+            entry = cache.get(media_id, validate=False)
+            if media_id in media:
+                status = 'shared'
+            elif entry and cache.is_valid(entry):
+                status = 'cached'
+            elif entry:
+                status = 'stale'
+            else:
+                status = 'missing'
+            media.add(media_id)
+            if entry:
+                video.uid = entry['id']
+                video.set_title(entry['title'], video_data=DATA)
+                video.filepath = entry['filepath']
+                video.thumbnail = entry['thumbnail']
+            else:
+                # youtube_dl uses the Vimeo id as video id.
+                video.uid = get_vimeo_id(video.url) or video.url
+                video.title = DATA[lang_code].get('video_titles', {}).get(video.uid) or video.title
+                video.filepath = video.get_filename(vinfo['download_path']) % {'id': video.uid, 'ext': 'mp4'}
+            # The size of the planned format of the last run, if any.
+            format_plan = formats.get(media_id)
+            if format_plan and format_plan.get('size'):
+                size = format_plan['size']
+            elif entry and status == 'stale':
+                size = entry.get('filesize')
+            else:
+                size = None
+            artifacts.append(plan_artifact('video', lang_code, video.filepath, status,
+                                           size=0 if status in ('cached', 'shared') else size))
+            videos.append(video)
+        videos_by_lang[lang_code] = videos
+    return videos_by_lang, artifacts
+
+
+def print_plan(artifacts):
+    """
+    Prints the artifacts of the plan and the estimated work.
+    """
+    print('==> PLAN')
+    print('%-8s %-4s %-8s %6s %12s %s' % ('KIND', 'LANG', 'STATUS', 'PAGES', 'BYTES', 'PATH'))
+    for artifact in artifacts:
+        size = '?' if artifact['bytes'] is None else artifact['bytes']
+        print('%-8s %-4s %-8s %6d %12s %s' % (
+            artifact['kind'], artifact['lang_code'], artifact['status'], artifact['pages'],
+            size, artifact['path']))
+    statuses = {}
+    for artifact in artifacts:
+        statuses[artifact['status']] = statuses.get(artifact['status'], 0) + 1
+    todo = [artifact for artifact in artifacts if artifact['status'] in ('missing', 'stale', 'unknown')]
+    unknown = [artifact for artifact in todo if artifact['bytes'] is None]
+    print('==> %s' % ', '.join('%d %s' % (count, status) for status, count in sorted(statuses.items())))
+    print('==> Estimated work: %d pages to write, %d bytes to download (+%d downloads of unknown size)' % (
+        sum(artifact['pages'] for artifact in todo),
+        sum(artifact['bytes'] or 0 for artifact in todo),
+        len(unknown)))
+
+
+def count_nodes(node, counts=None):
+    """
+    Returns a dict of node class name --> number of nodes in the tree of `node`.
+    """
+    counts = {} if counts is None else counts
+    for child in node.children:
+        name = child.__class__.__name__
+        counts[name] = counts.get(name, 0) + 1
+        count_nodes(child, counts)
+    return counts
+
+
+def get_bool_option(kwargs, name, default=False):
+    """
+    Returns the boolean value of the `name=value` command line option in `kwargs`.
+    """
+    value = kwargs.get(name, default)
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def setup_run(kwargs):
+    """
+    Applies the command line options of the caches, the video formats and the
+    request scheduler, shared by all the channels built in the process.
+    Returns the `BuildManifest` of the run.
+    """
+    # Stages whose inputs haven't changed since the last run are skipped,
+    # pass `rebuild=1` on the command line to redo all of them.
+    manifest = BuildManifest()
+    if get_bool_option(kwargs, 'rebuild'):
+        manifest.invalidate()
+
+    video_cache = get_video_cache()
+    if 'video_cache_ttl' in kwargs:
+        video_cache.ttl = float(kwargs['video_cache_ttl'])
+    if get_bool_option(kwargs, 'refresh_videos'):
+        video_cache.invalidate()
+    video_formats = get_video_formats()
+    if 'video_max_height' in kwargs:
+        video_formats.max_height = int(kwargs['video_max_height'])
+    if 'video_budget' in kwargs:
+        video_formats.budget = int(kwargs['video_budget']) or None
+
+    # Record the HTTP responses and the youtube_dl results of the run with
+    # `record=CASSETTE`, or serve them offline from a recorded run with `replay=CASSETTE`.
+    if kwargs.get('record'):
+        use_cassette(kwargs['record'], mode='record')
+    elif kwargs.get('replay'):
+        use_cassette(kwargs['replay'], mode='replay')
+    if any(name in kwargs for name in ('http_retries', 'http_per_host', 'http_rate')):
+        set_scheduler(RequestScheduler(
+            retries=kwargs.get('http_retries', MAX_RETRIES),
+            max_per_host=kwargs.get('http_per_host', MAX_PER_HOST),
+            rate=kwargs.get('http_rate', RATE_PER_HOST)))
+    return manifest
+
+
+def open_run_journal(lang_codes, kwargs):
+    """
+    Returns the `RunJournal` of a run building `lang_codes` with the command line
+    options `kwargs`, resuming the journal of the last run if it didn't finish
+    and had the same inputs, or None with `journal=0`.  The journal is started
+    again with `rebuild=1` or `refresh_videos=1`.
+    """
+    if not get_bool_option(kwargs, 'journal', RUN_JOURNAL):
+        return None
+    options = {name: kwargs.get(name) for name in RUN_JOURNAL_OPTIONS}
+    options['crop_params'] = CROP_PARAMS
+    journal = RunJournal(run_key=get_run_key({lang_code: DATA[lang_code] for lang_code in lang_codes},
+                                             options))
+    if get_bool_option(kwargs, 'rebuild') or get_bool_option(kwargs, 'refresh_videos'):
+        journal.discard()
+    return journal
+
+
+def build_content(lang_codes=LANG_CODES, manifest=None, partial=False, run_journal=None, **kwargs):
+    """
+    Downloads, crops and splits the PDFs and downloads the videos of `lang_codes`
+    (keys of `DATA`, possibly of several guides) in shared pools, then makes the
+    thumbnails.  The command line options in `kwargs` set the workers and modes,
+    `only=pdfs` or `only=videos` skips the videos or the PDFs.  Each unit of work
+    is recorded in the `run_journal` (a `RunJournal`), the units done by the
+    journaled run are skipped and their results used.
+    Returns tuple: (dict of lang_code --> chapters, dict of lang_code --> videos,
+    [(failed_video, exception), ...]), the chapters are None for the failed
+    languages.  Unless `partial` is True, the run stops and returns
+    (None, None, []) if a PDF download failed.
+    """
+    only = kwargs.get('only', '')
+    if only not in RUN_MODES:
+        raise ValueError('Unknown only=%s, use one of: %s' % (only, ', '.join(RUN_MODES[1:])))
+    pdf_workers = kwargs.get('pdf_workers', PDF_PROCESS_WORKERS)
+    video_workers = kwargs.get('video_workers', VIDEO_DOWNLOAD_WORKERS)
+    write_cropped = get_bool_option(kwargs, 'write_cropped', WRITE_CROPPED_PDF)
+    stream = get_bool_option(kwargs, 'stream_pdf', STREAM_PDF)
+    chapters = {}
+    videos = None
+    failed = []
+    if only == 'pdfs':
+        videos = {}
+    if get_bool_option(kwargs, 'async_pipeline') and not only:
+        # Overlap the PDF and video stages of all languages.
+        loop = asyncio.new_event_loop()
+        try:
+            chapters, videos, failed = loop.run_until_complete(run_pipeline(
+                lang_codes, manifest=manifest, pdf_workers=pdf_workers,
+                video_workers=video_workers, write_cropped=write_cropped, stream=stream,
+                journal=run_journal))
+        finally:
+            loop.close()
+    elif only != 'videos':
+        # The languages already processed by the journaled run don't need their PDF.
+        pending = [lang_code for lang_code in lang_codes
+                   if resume_chapters(lang_code, run_journal) is None]
+        if not download_pdfs(pending, journal=run_journal) and not partial:
+            return None, None, []
+        # Crop and split the PDF of each language in its own process.
+        chapters = process_pdfs(lang_codes, manifest=manifest, max_workers=pdf_workers,
+                                write_cropped=write_cropped, stream=stream, journal=run_journal)
+
+    thumbnails = get_bool_option(kwargs, 'thumbnails', MAKE_THUMBNAILS)
+    thumbnail_workers = kwargs.get('thumbnail_workers', THUMBNAIL_WORKERS)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Make the chapter thumbnails while the videos are downloaded.
+        chapter_thumbnails = None
+        if thumbnails and chapters:
+            chapter_thumbnails = executor.submit(make_chapter_thumbnails, chapters, thumbnail_workers)
+        if videos is None:
+            # Download the videos of all the languages in one shared pool.
+            videos, failed = download_videos(lang_codes, max_workers=video_workers,
+                                             journal=run_journal)
+        if chapter_thumbnails is not None:
+            chapter_thumbnails.result()
+    if thumbnails and videos:
+        make_video_thumbnails(videos, max_workers=thumbnail_workers)
+    return chapters, videos, failed
+
+
 class PointBChef(SushiChef):
     channel_info = {
         "CHANNEL_TITLE": "PointB 21CS Guide",
@@ -478,49 +1715,144 @@ class PointBChef(SushiChef):
         # (optional)
         "CHANNEL_DESCRIPTION": "Guide To Becoming A 21St Century Teacher",
     }
+    # The keys of the `DATA` entries of the channel.
+    lang_codes = LANG_CODES
+
+    def run(self, args, options):
+        """
+        With the `plan=1` command line option, only prints what the run would do
+        (see `plan_channel()`) without downloading, processing or uploading anything.
+        """
+        if get_bool_option(options, 'plan'):
+            self.plan_channel(**options)
+            return
+        super(PointBChef, self).run(args, options)
 
     def construct_channel(self, **kwargs):
+        """
+        Builds the channel, resuming the run journal of a run that failed (see
+        `open_run_journal()`), and reporting the time spent in each stage at the
+        end of the run when the `metrics=1`, `metrics_json=PATH` or
+        `metrics_prom=PATH` command line options are given.
+        """
+        metrics_json = kwargs.get('metrics_json')
+        metrics_prom = kwargs.get('metrics_prom')
+        METRICS.enable(get_bool_option(kwargs, 'metrics') or bool(metrics_json or metrics_prom))
+        try:
+            with METRICS.stage('construct_channel'):
+                return self.build_channel(**kwargs)
+        finally:
+            if METRICS.enabled:
+                print('==> STAGE METRICS')
+                print(METRICS.report())
+                if metrics_json:
+                    METRICS.write_json(metrics_json)
+                if metrics_prom:
+                    METRICS.write_prometheus(metrics_prom)
 
-        if not download_pdfs():
+    def build_channel(self, **kwargs):
+        manifest = setup_run(kwargs)
+        journal = open_run_journal(self.lang_codes, kwargs)
+        chapters, videos, failed = build_content(self.lang_codes, manifest=manifest,
+                                                 run_journal=journal, **kwargs)
+        if chapters is None:
             print('==> Download of PDFS FAILED!')
             return False
-
-        chapters_en = split_chapters(LANG_CODE_EN)
-        if chapters_en is None:
-            print('==> Split chapters for en PDFs FAILED!')
-            return False
-        chapters_my = split_chapters(LANG_CODE_MY)
-        if chapters_en is None:
-            print('==> Split chapters for my PDFs FAILED!')
+        for lang_code in self.lang_codes:
+            if lang_code in chapters and chapters[lang_code] is None:
+                print('==> Split chapters for %s PDFs FAILED!' % lang_code)
+                return False
+        if failed and not get_bool_option(kwargs, 'partial_videos', PARTIAL_VIDEOS):
+            print('==> Download of %d videos FAILED!' % len(failed))
             return False
+        if get_bool_option(kwargs, 'verify', VERIFY_ARTIFACTS):
+            # Find the broken files before ricecooker uploads them.
+            broken = verify_content(chapters, videos, manifest=manifest,
+                                    max_workers=kwargs.get('verify_workers', VERIFY_WORKERS),
+                                    journal=journal)
+            if broken:
+                print('==> Verification of %d artifacts FAILED!' % len(broken))
+                return False
 
         channel = self.get_channel(**kwargs)
+        channel = self.build_tree(channel, chapters, videos)
+        if failed:
+            # Keep the journal so the next run only downloads the failed videos.
+            print('==> Uploading the channel without %d failed videos, keeping the run journal.' % (
+                len(failed),))
+        elif journal is not None:
+            journal.finish()
+        return channel
 
-        # English topics
-        main_topic = TopicNode(title="English", source_id="pointb_en_main")
-        topic_guide = TopicNode(title="21st Century Guide", source_id="pointb_en_topic")
-        topic_videos_en = TopicNode(title="Videos", source_id="pointb_en_videos")
-        main_topic.add_child(topic_guide)
-        main_topic.add_child(topic_videos_en)
+    def plan_channel(self, **kwargs):
+        """
+        Builds the channel tree from the `page_ranges`, the build manifest, the
+        videos found by the last scraping and the video cache, then prints which
+        artifacts are missing, stale or cached and the estimated work of a run.
+        Nothing is downloaded or written.
+        Returns tuple: (channel, artifacts)
+        """
+        manifest = BuildManifest(persist=False)
+        if get_bool_option(kwargs, 'rebuild'):
+            manifest.entries = {}
+        video_cache = get_video_cache()
+        if 'video_cache_ttl' in kwargs:
+            video_cache.ttl = float(kwargs['video_cache_ttl'])
+        if get_bool_option(kwargs, 'refresh_videos'):
+            video_cache.entries = {}
+        if 'video_max_height' in kwargs:
+            get_video_formats().max_height = int(kwargs['video_max_height'])
+        write_cropped = get_bool_option(kwargs, 'write_cropped', WRITE_CROPPED_PDF)
 
-        # Burmese topics
-        main_topic_my = TopicNode(title="Burmese", source_id="pointb_my_main")
-        topic_guide_my = TopicNode(title="21st Century Guide", source_id="pointb_my_guide")
-        topic_videos_my = TopicNode(title="Videos", source_id="pointb_my_videos")
-        main_topic_my.add_child(topic_guide_my)
-        main_topic_my.add_child(topic_videos_my)
+        chapters = {}
+        artifacts = []
+        with closing_pdfs():
+            for lang_code in self.lang_codes:
+                chapters[lang_code], pdf_artifacts = plan_pdf(
+                    lang_code, manifest=manifest, write_cropped=write_cropped)
+                artifacts.extend(pdf_artifacts)
+        videos, video_artifacts = plan_videos(self.lang_codes)
+        artifacts.extend(video_artifacts)
 
-        channel.add_child(main_topic)
-        channel.add_child(main_topic_my)
+        channel = self.build_tree(self.get_channel(**kwargs), chapters, videos)
+        print_plan(artifacts)
+        print('==> CHANNEL TREE:', ', '.join(
+            '%d %s' % (count, name) for name, count in sorted(count_nodes(channel).items())))
+        return channel, artifacts
 
+    def build_tree(self, channel, chapters, videos):
+        """
+        Adds the topics of each language to `channel`: the `chapters` of the guide
+        and the `videos`, both dicts of lang_code --> chapters/videos.  The topic of
+        the chapters or of the videos of a language missing from `chapters` or
+        `videos` (e.g. skipped by `only=`) is left out, and so is a language
+        missing from both.
+        """
         # English topics
-        build_pdf_topics(topic_guide, chapters_en, lang_code=LANG_CODE_EN)
+        if LANG_CODE_EN in chapters or LANG_CODE_EN in videos:
+            main_topic = TopicNode(title="English", source_id="pointb_en_main")
+            channel.add_child(main_topic)
+            if LANG_CODE_EN in chapters:
+                topic_guide = TopicNode(title="21st Century Guide", source_id="pointb_en_topic")
+                main_topic.add_child(topic_guide)
+                build_pdf_topics(topic_guide, chapters[LANG_CODE_EN], lang_code=LANG_CODE_EN)
+            if LANG_CODE_EN in videos:
+                topic_videos_en = TopicNode(title="Videos", source_id="pointb_en_videos")
+                main_topic.add_child(topic_videos_en)
+                build_english_video_topics(topic_videos_en, videos[LANG_CODE_EN])
+
         # Burmese topics
-        build_pdf_topics(topic_guide_my, chapters_my, lang_code=LANG_CODE_MY)
-        # English videos
-        topic = build_english_video_topics(topic_videos_en)
-        # Burmese videos
-        topic = build_burmese_video_topics(topic_videos_my)
+        if LANG_CODE_MY in chapters or LANG_CODE_MY in videos:
+            main_topic_my = TopicNode(title="Burmese", source_id="pointb_my_main")
+            channel.add_child(main_topic_my)
+            if LANG_CODE_MY in chapters:
+                topic_guide_my = TopicNode(title="21st Century Guide", source_id="pointb_my_guide")
+                main_topic_my.add_child(topic_guide_my)
+                build_pdf_topics(topic_guide_my, chapters[LANG_CODE_MY], lang_code=LANG_CODE_MY)
+            if LANG_CODE_MY in videos:
+                topic_videos_my = TopicNode(title="Videos", source_id="pointb_my_videos")
+                main_topic_my.add_child(topic_videos_my)
+                build_burmese_video_topics(topic_videos_my, videos[LANG_CODE_MY])
 
         return channel
 
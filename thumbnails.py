@@ -0,0 +1,113 @@
+import os
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pdf2image import convert_from_path
+from PIL import Image
+from ricecooker.utils.images import scale_and_crop_thumbnail
+
+from manifest import hash_file
+from metrics import METRICS, timed
+
+
+THUMBNAILS_PATH = os.path.join(os.getcwd(), 'downloads', 'thumbnails', '')
+# The thumbnails are 400x225, rendering the PDF pages at a higher resolution
+# (ricecooker uses 500 dpi) only makes the rendering slower.
+PDF_THUMBNAIL_DPI = 100
+THUMBNAIL_KINDS = ('pdf', 'video')
+
+
+def get_thumbnail_path(source_hash, directory=THUMBNAILS_PATH):
+    """
+    Returns the path of the thumbnail of the source file with hash `source_hash`,
+    the thumbnails are named after their source so they are only made once.
+    """
+    return os.path.join(directory, '%s.png' % source_hash)
+
+
+def make_pdf_thumbnail(pdf_path, thumbnail_path):
+    """
+    Renders the first page of the PDF at `pdf_path` as the PNG `thumbnail_path`.
+    """
+    pages = convert_from_path(pdf_path, dpi=PDF_THUMBNAIL_DPI, first_page=1, last_page=1)
+    # Same crop as the thumbnails derived by ricecooker for the documents.
+    image = scale_and_crop_thumbnail(pages[0], zoom=10)
+    image.save(thumbnail_path, 'PNG')
+
+
+def make_video_thumbnail(image_path, thumbnail_path):
+    """
+    Resizes the thumbnail `image_path` downloaded with a video to the PNG `thumbnail_path`.
+    """
+    with Image.open(image_path) as image:
+        image = scale_and_crop_thumbnail(image.convert('RGB'))
+        image.save(thumbnail_path, 'PNG')
+
+
+def make_thumbnail(kind, source_path, thumbnail_path):
+    """
+    Makes the thumbnail of the `kind` ('pdf' or 'video') source file in a worker
+    process, writing it to a temporary file first so an interrupted run never
+    leaves a partial thumbnail in the cache.
+    Returns the `thumbnail_path`.
+    """
+    tmp_path = thumbnail_path + '.tmp.png'
+    if kind == 'pdf':
+        make_pdf_thumbnail(source_path, tmp_path)
+    elif kind == 'video':
+        make_video_thumbnail(source_path, tmp_path)
+    else:
+        raise ValueError('Unknown thumbnail kind %s' % kind)
+    os.replace(tmp_path, thumbnail_path)
+    return thumbnail_path
+
+
+@timed('make_thumbnails')
+def make_thumbnails(jobs, max_workers=None, directory=THUMBNAILS_PATH):
+    """
+    Makes the thumbnails of the `(kind, source_path)` tuples in `jobs` using a
+    pool of at most `max_workers` processes.  The thumbnails are cached by the
+    hash of their source file, the same source is only processed once and never
+    again on the next runs.
+    Returns a dict of source_path --> thumbnail path, None if it failed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    thumbnails = {}
+    pending = {}  # thumbnail path --> (kind, source_path)
+    for kind, source_path in jobs:
+        if not source_path or not os.path.exists(source_path):
+            thumbnails[source_path] = None
+            continue
+        if os.path.dirname(os.path.abspath(source_path)) == os.path.abspath(directory):
+            # Already a thumbnail made by this function.
+            thumbnails[source_path] = source_path
+            continue
+        thumbnail_path = get_thumbnail_path(hash_file(source_path), directory=directory)
+        thumbnails[source_path] = thumbnail_path
+        if os.path.exists(thumbnail_path):
+            METRICS.add('make_thumbnails', cache_hits=1)
+        elif thumbnail_path not in pending:
+            pending[thumbnail_path] = (kind, source_path)
+    if not pending:
+        return thumbnails
+
+    max_workers = max(1, min(int(max_workers or os.cpu_count() or 1), len(pending)))
+    print('==> MAKING', len(pending), 'thumbnails using', max_workers, 'processes')
+    failed = set()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for thumbnail_path, (kind, source_path) in pending.items():
+            future = executor.submit(make_thumbnail, kind, source_path, thumbnail_path)
+            futures[future] = thumbnail_path
+        for future in as_completed(futures):
+            thumbnail_path = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failed.add(thumbnail_path)
+                print('==> Error making thumbnail of', pending[thumbnail_path][1], e)
+    for source_path, thumbnail_path in thumbnails.items():
+        if thumbnail_path in failed:
+            thumbnails[source_path] = None
+    print('==> DONE making thumbnails: %d made, %d failed.' % (len(pending) - len(failed), len(failed)))
+    return thumbnails
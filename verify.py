@@ -0,0 +1,271 @@
+import os
+import struct
+import threading
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+from PyPDF2 import PdfFileReader
+
+from manifest import hash_data, hash_file, load_json, write_json_atomic
+from metrics import METRICS, timed
+from pdfcrop import get_cropped_page_sizes
+
+
+VERIFY_CACHE_PATH = os.path.join(os.getcwd(), 'chefdata', 'verified_artifacts.json')
+ARTIFACT_KINDS = ('pdf', 'video', 'thumbnail')
+# Differences allowed between the geometry of the chapter pages and the cropped
+# pages (in points), and between the duration of a video file and the duration
+# reported by youtube_dl (in seconds, or the fraction of the duration if larger).
+PAGE_SIZE_TOLERANCE = 1.0
+DURATION_TOLERANCE = 2.0
+DURATION_TOLERANCE_RATIO = 0.02
+
+# The keys of the verifications already in the cache, set in the worker processes.
+_verified_keys = frozenset()
+
+
+class ArtifactError(ValueError):
+    pass
+
+
+def get_source_page_sizes(source):
+    """
+    Returns the list of the (width, height) of the pages of the chapter cut from
+    the `source` dict: {'path', 'sha256', 'page_start', 'page_end', 'crop_params'}
+    """
+    return get_cropped_page_sizes(source['path'], source['page_start'], source['page_end'],
+                                  source['crop_params'])
+
+
+def verify_pdf(path, pages=None, page_sizes=None, source=None):
+    """
+    Checks that the PDF at `path` opens, that all its pages load and that it has
+    the expected number of `pages` with the `page_sizes` (list of (width, height)),
+    or with the sizes of the pages cropped from the `source` PDF.  The `source`
+    has the hash of the source PDF, so the cache key of a chapter changes with
+    the source PDF, the crop parameters and the page range.
+    Returns dict: {'pages': number of pages}
+    """
+    if page_sizes is None and source is not None:
+        page_sizes = get_source_page_sizes(source)
+    with open(path, 'rb') as f:
+        reader = PdfFileReader(f, strict=False)
+        num_pages = reader.getNumPages()
+        if num_pages == 0:
+            raise ArtifactError('no pages')
+        if pages is not None and num_pages != pages:
+            raise ArtifactError('%d pages instead of %d' % (num_pages, pages))
+        for page_num in range(num_pages):
+            box = reader.getPage(page_num).mediaBox
+            width, height = float(box.getWidth()), float(box.getHeight())
+            if width <= 0 or height <= 0:
+                raise ArtifactError('page %d has an empty mediaBox' % page_num)
+            if page_sizes is None:
+                continue
+            expected_width, expected_height = page_sizes[page_num]
+            if (abs(width - expected_width) > PAGE_SIZE_TOLERANCE or
+                    abs(height - expected_height) > PAGE_SIZE_TOLERANCE):
+                raise ArtifactError('page %d is %gx%g instead of %gx%g, not cropped?' % (
+                    page_num, width, height, expected_width, expected_height))
+    return {'pages': num_pages}
+
+
+def iter_mp4_boxes(f, start, end):
+    """
+    Yields the boxes of the ISO base media file `f` between the offsets `start`
+    and `end`, tuples: (type, offset of the content, offset of the next box).
+    Raises `ArtifactError` if a box extends past `end`, e.g. in a truncated file.
+    """
+    offset = start
+    while offset < end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            raise ArtifactError('truncated box header at byte %d' % offset)
+        size, box_type = struct.unpack('>I4s', header)
+        content = offset + 8
+        if size == 1:
+            largesize = f.read(8)
+            if len(largesize) < 8:
+                raise ArtifactError('truncated box header at byte %d' % offset)
+            size = struct.unpack('>Q', largesize)[0]
+            content += 8
+        elif size == 0:
+            size = end - offset  # the box extends to the end of the file
+        box_type = box_type.decode('latin-1')
+        if size < content - offset or offset + size > end:
+            raise ArtifactError('box %r at byte %d ends after the end of the file (%d bytes)' % (
+                box_type, offset, end))
+        yield box_type, content, offset + size
+        offset += size
+
+
+def get_mp4_duration(f, start, end):
+    """
+    Returns the duration in seconds from the `mvhd` box of the `moov` box between
+    `start` and `end`, None if it's not known (fragmented files).
+    """
+    for box_type, content, box_end in iter_mp4_boxes(f, start, end):
+        if box_type != 'mvhd':
+            continue
+        f.seek(content)
+        version = f.read(1)
+        f.seek(content + 4)
+        if version == b'\x01':
+            timescale, duration = struct.unpack('>16xIQ', f.read(28))
+        else:
+            timescale, duration = struct.unpack('>8xII', f.read(16))
+        if not timescale or duration in (0, 0xffffffff, 0xffffffffffffffff):
+            return None
+        return duration / float(timescale)
+    raise ArtifactError('no mvhd box in the moov box')
+
+
+def verify_mp4(path, duration=None):
+    """
+    Checks that the mp4 at `path` is complete: its boxes span the whole file and
+    it has the `ftyp`, `moov` and `mdat` boxes.  The duration of the file must be
+    the expected `duration` (in seconds) if given.
+    Returns dict: {'duration': duration of the file or None}
+    """
+    size = os.path.getsize(path)
+    boxes = {}
+    with open(path, 'rb') as f:
+        for box_type, content, box_end in iter_mp4_boxes(f, 0, size):
+            if not boxes and box_type != 'ftyp':
+                raise ArtifactError('not an mp4 file, starts with %r' % box_type)
+            boxes.setdefault(box_type, (content, box_end))
+        for box_type in ('moov', 'mdat'):
+            if box_type not in boxes:
+                raise ArtifactError('no %s box' % box_type)
+        actual = get_mp4_duration(f, *boxes['moov'])
+    if actual is None and 'moof' not in boxes:
+        raise ArtifactError('no duration')
+    if duration and actual is not None:
+        tolerance = max(DURATION_TOLERANCE, duration * DURATION_TOLERANCE_RATIO)
+        if abs(actual - duration) > tolerance:
+            raise ArtifactError('lasts %.1fs instead of %.1fs' % (actual, duration))
+    return {'duration': actual}
+
+
+def verify_image(path):
+    """
+    Checks that the image at `path` decodes.
+    Returns dict: {'size': [width, height]}
+    """
+    with Image.open(path) as image:
+        image.verify()
+    # `verify()` doesn't decode the image data and the image can't be used after it.
+    with Image.open(path) as image:
+        image.load()
+        return {'size': list(image.size)}
+
+
+VERIFIERS = {
+    'pdf': verify_pdf,
+    'video': verify_mp4,
+    'thumbnail': verify_image,
+}
+
+
+def get_verification_key(kind, digest, expected):
+    """
+    Returns the cache key of the verification of a `kind` artifact whose content
+    has the hash `digest`, the same file is verified again if `expected` changes.
+    """
+    return '%s:%s:%s' % (kind, digest, hash_data(expected))
+
+
+def set_verified_keys(keys):
+    """
+    Initializer of the worker processes of `verify_artifacts()`.
+    """
+    global _verified_keys
+    _verified_keys = keys
+
+
+def verify_artifact(kind, path, expected):
+    """
+    Verifies the `kind` artifact at `path` in a worker process, unless a file with
+    the same content was already verified with the same `expected` values.
+    Returns tuple: (cache key, info dict or None if cached, error message or None)
+    """
+    key = get_verification_key(kind, hash_file(path), expected)
+    if key in _verified_keys:
+        return key, None, None
+    try:
+        return key, VERIFIERS[kind](path, **expected), None
+    except Exception as e:
+        return key, None, str(e) if isinstance(e, ArtifactError) else '%s: %s' % (type(e).__name__, e)
+
+
+class VerificationCache():
+    """
+    On-disk record of the artifacts that passed verification, keyed by their kind,
+    content hash and expected values (see `get_verification_key()`), so unchanged
+    artifacts are not verified again by the next runs.
+    """
+
+    def __init__(self, path=VERIFY_CACHE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = load_json(self.path, 'verification cache')
+
+    def save(self):
+        with self.lock:
+            write_json_atomic(self.path, self.entries)
+
+    def add(self, key, path, info):
+        with self.lock:
+            self.entries[key] = dict(info or {}, path=path, timestamp=time.time())
+
+
+@timed('verify_artifacts')
+def verify_artifacts(jobs, max_workers=None, cache=None):
+    """
+    Verifies the `(kind, path, expected)` artifacts of `jobs` using a pool of at
+    most `max_workers` processes, `kind` being one of `ARTIFACT_KINDS` and
+    `expected` the keyword arguments of its verifier.  The artifacts that passed
+    are recorded in the `cache` (a `VerificationCache`).
+    Returns dict of path --> error message, None if the artifact is valid.
+    """
+    errors = {}
+    pending = {}  # path --> (kind, expected)
+    for kind, path, expected in jobs:
+        if kind not in VERIFIERS:
+            raise ValueError('Unknown artifact kind %s' % kind)
+        if path in errors or path in pending:
+            continue
+        if not path or not os.path.exists(path):
+            errors[path] = 'missing file'
+        else:
+            pending[path] = (kind, expected)
+    if not pending:
+        return errors
+
+    max_workers = max(1, min(int(max_workers or os.cpu_count() or 1), len(pending)))
+    keys = frozenset(cache.entries) if cache is not None else frozenset()
+    print('==> VERIFYING', len(pending), 'artifacts using', max_workers, 'processes')
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=set_verified_keys,
+                             initargs=(keys,)) as executor:
+        futures = {}
+        for path, (kind, expected) in pending.items():
+            futures[executor.submit(verify_artifact, kind, path, expected)] = path
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                key, info, error = future.result()
+            except Exception as e:
+                key, info, error = None, None, '%s: %s' % (type(e).__name__, e)
+            errors[path] = error
+            if key in keys:
+                METRICS.add('verify_artifacts', cache_hits=1)
+            elif error is None and cache is not None:
+                cache.add(key, path, info)
+    if cache is not None:
+        cache.save()
+    num_errors = len([error for error in errors.values() if error])
+    print('==> DONE verifying artifacts: %d valid, %d broken.' % (len(errors) - num_errors, num_errors))
+    return errors